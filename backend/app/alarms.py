@@ -0,0 +1,193 @@
+"""
+alarms.py
+=========
+
+Streaming anomaly detection stage of the ingest pipeline of the Abelhas IoT+ML backend.
+Every ingested record is scored against per-hive baselines kept in memory, in constant memory and O(1) per record, without
+reading the history: for each monitored metric the detector keeps an exponentially weighted mean and variance (EWMA) of the
+values and of the changes between consecutive readings. A value whose z-score against its baseline exceeds ALARM_Z raises a
+"zscore" alarm; a change since the previous reading that is unusually large raises a "variacao" (rate-of-change) alarm.
+Alarms are written to the abelhas_alarmes table in the ingest transaction.
+
+Also holds the fixed noise thresholds and classify_noise, the single source of the status_ruido labels.
+
+Main Components
+---------------
+
+- Thresholds:
+    - LIMIAR_RUIDO_ALERTA / LIMIAR_RUIDO_MODERADO: Noise levels (dB) for the alert and moderate statuses.
+- Configuration (environment variables):
+    - ALARM_ALPHA: EWMA smoothing factor of the baselines (default 0.05, about the last 20 readings).
+    - ALARM_Z: z-score above which an alarm is raised (default 4.0).
+    - ALARM_WARMUP: Readings of a hive needed before its baseline can raise alarms (default 30).
+- ALARM_METRICAS: Monitored metrics (ruido_db, temperatura, abelhas_ativas).
+- Functions:
+    - classify_noise(ruido_db): Returns the noise status label for a noise level.
+    - apply_alarms(db, rows): Scores a batch of inserted rows (with ids) and inserts the alarms in the current transaction.
+      Returns (alarms with their ids, observations); the observations are applied to the detector with
+      detector.commit(observations) after the transaction commits.
+- AnomalyDetector:
+    - detect(rows): Scores rows against copies of the touched baselines. Returns (alarms, observations), the finite
+      (hive, metric, value) readings of the batch in order; NaN and infinite values are ignored.
+    - commit(observations): Applies the observations to the live baselines under the lock, so concurrent batches of the
+      same hive (sync route and write-behind flush) never overwrite each other's updates.
+- detector: Global instance used by app.ingest.
+
+Usage
+-----
+
+Called by app.ingest.insert_records; alarms are listed at GET /api/data/alarms.
+Baselines start empty when the process starts and warm up with the incoming readings.
+
+Dependencies
+------------
+
+SQLAlchemy, math, threading, app.models
+"""
+import math
+import os
+import threading
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from .models import AlarmRecord
+
+LIMIAR_RUIDO_ALERTA = 80
+LIMIAR_RUIDO_MODERADO = 60
+
+ALARM_METRICAS = ("ruido_db", "temperatura", "abelhas_ativas")
+ALARM_ALPHA = float(os.getenv("ALARM_ALPHA", "0.05"))
+ALARM_Z = float(os.getenv("ALARM_Z", "4.0"))
+ALARM_WARMUP = int(os.getenv("ALARM_WARMUP", "30"))
+
+# Leitura de uma métrica: ((colmeia, métrica), valor)
+Observation = Tuple[Tuple[str, str], float]
+
+
+def classify_noise(ruido_db: Optional[float]) -> Optional[str]:
+    if ruido_db is None:
+        return None
+    if ruido_db > LIMIAR_RUIDO_ALERTA:
+        return "alerta: possível agitação!"
+    if ruido_db > LIMIAR_RUIDO_MODERADO:
+        return "moderado: atenção"
+    return "normal"
+
+
+class _Baseline:
+    """Média e variância exponencialmente ponderadas (EWMA) de uma série."""
+    __slots__ = ("n", "media", "var")
+
+    def __init__(self, n: int = 0, media: float = 0.0, var: float = 0.0):
+        self.n = n
+        self.media = media
+        self.var = var
+
+    def score(self, x: float, warmup: int) -> Optional[float]:
+        if self.n < warmup or self.var <= 0.0:
+            return None
+        return (x - self.media) / math.sqrt(self.var)
+
+    def update(self, x: float, alpha: float):
+        if self.n == 0:
+            self.media = x
+        else:
+            diff = x - self.media
+            incr = alpha * diff
+            self.media += incr
+            self.var = (1 - alpha) * (self.var + diff * incr)
+        self.n += 1
+
+
+class _MetricState:
+    """Linha de base do valor e da variação entre leituras de uma métrica de uma colmeia."""
+    __slots__ = ("nivel", "variacao", "ultimo")
+
+    def __init__(self):
+        self.nivel = _Baseline()
+        self.variacao = _Baseline()
+        self.ultimo: Optional[float] = None
+
+    def observe(self, x: float, alpha: float):
+        if self.ultimo is not None:
+            self.variacao.update(x - self.ultimo, alpha)
+        self.nivel.update(x, alpha)
+        self.ultimo = x
+
+    def copy(self) -> "_MetricState":
+        novo = _MetricState()
+        novo.nivel = _Baseline(self.nivel.n, self.nivel.media, self.nivel.var)
+        novo.variacao = _Baseline(self.variacao.n, self.variacao.media, self.variacao.var)
+        novo.ultimo = self.ultimo
+        return novo
+
+
+class AnomalyDetector:
+    def __init__(self, alpha: float = 0.05, z: float = 4.0, warmup: int = 30, metricas=ALARM_METRICAS):
+        self.alpha = alpha
+        self.z = z
+        self.warmup = warmup
+        self.metricas = tuple(metricas)
+        self._state: Dict[Tuple[str, str], _MetricState] = {}
+        self._lock = threading.Lock()
+
+    def detect(self, rows: List[dict]) -> Tuple[List[dict], List[Observation]]:
+        # As linhas de base só mudam em commit(): um lote cuja transação falhar não altera o estado
+        novos: Dict[Tuple[str, str], _MetricState] = {}
+        alarms = []
+        observations: List[Observation] = []
+        for row in rows:
+            for metrica in self.metricas:
+                x = row.get(metrica)
+                if x is None:
+                    continue
+                x = float(x)
+                if not math.isfinite(x):
+                    continue  # NaN/infinito tornaria média e variância NaN para sempre
+                chave = (row["hive_id"], metrica)
+                st = novos.get(chave)
+                if st is None:
+                    # Cópia feita sob o lock: commit() de outro lote pode estar alterando o estado atual
+                    with self._lock:
+                        atual = self._state.get(chave)
+                        st = novos[chave] = atual.copy() if atual is not None else _MetricState()
+                z = st.nivel.score(x, self.warmup)
+                if z is not None and abs(z) > self.z:
+                    alarms.append(self._alarm(row, metrica, "zscore", x, st.nivel.media, z))
+                if st.ultimo is not None:
+                    delta = x - st.ultimo
+                    z = st.variacao.score(delta, self.warmup)
+                    if z is not None and abs(z) > self.z:
+                        alarms.append(self._alarm(row, metrica, "variacao", delta, st.variacao.media, z))
+                st.observe(x, self.alpha)
+                observations.append((chave, x))
+        return alarms, observations
+
+    @staticmethod
+    def _alarm(row: dict, metrica: str, detector: str, valor: float, referencia: float, score: float) -> dict:
+        return {"record_id": row["id"], "hive_id": row["hive_id"], "timestamp": row["timestamp"], "metrica": metrica,
+                "detector": detector, "valor": valor, "referencia": referencia, "score": score}
+
+    def commit(self, observations: List[Observation]):
+        # Reaplica as leituras sobre o estado atual (não sobre as cópias): lotes concorrentes da mesma colmeia somam-se
+        with self._lock:
+            for chave, x in observations:
+                st = self._state.get(chave)
+                if st is None:
+                    st = self._state[chave] = _MetricState()
+                st.observe(x, self.alpha)
+
+
+def apply_alarms(db: Session, rows: List[dict]) -> Tuple[List[dict], List[Observation]]:
+    alarms, observations = detector.detect(rows)
+    if alarms:
+        ids = db.execute(
+            insert(AlarmRecord.__table__).returning(AlarmRecord.id, sort_by_parameter_order=True), alarms
+        ).scalars().all()
+        for alarm, id_ in zip(alarms, ids):
+            alarm["id"] = id_
+    return alarms, observations
+
+
+# Global instance
+detector = AnomalyDetector(alpha=ALARM_ALPHA, z=ALARM_Z, warmup=ALARM_WARMUP)
@@ -0,0 +1,207 @@
+"""
+broadcaster.py
+==============
+
+In-process broadcaster that pushes newly ingested records and anomaly alarms to Server-Sent Events (SSE) subscribers
+in the Abelhas IoT+ML backend.
+insert_records publishes each committed batch (from the event loop or from the write-behind flush thread); the batch is
+handed to the event loop with call_soon_threadsafe, encoded once as SSE frames and copied to every subscriber queue.
+Each subscriber has a bounded queue: a client that falls more than BROADCAST_CLIENT_QUEUE events behind is disconnected
+instead of slowing down ingestion, and resumes from its last event id when it reconnects.
+
+Event ids are record ids (the alarms of a record carry the id of that record), so a client can resume with the
+Last-Event-ID header (sent automatically by EventSource) or the last_id query parameter: recent events are replayed from
+an in-memory ring buffer, older ones from the database, page by page (in a worker thread) until the ring buffer takes over.
+The subscriber is registered before the replay starts and live events already covered by the replay are skipped, so a
+resuming client gets every event exactly once.
+
+Main Components
+---------------
+
+- Configuration (environment variables):
+    - BROADCAST_CLIENT_QUEUE: Maximum number of pending events per subscriber (default 1000).
+    - BROADCAST_BUFFER: Events kept in memory for resuming clients (default 1000).
+    - BROADCAST_KEEPALIVE: Seconds between keep-alive comments on idle streams (default 15).
+- Broadcaster:
+    - start(): Binds the broadcaster to the running event loop (called on startup). Before that, publish() is a no-op.
+    - publish(rows, alarms): Thread-safe; schedules the delivery of a committed batch on the event loop.
+    - stream(request, last_id, hive_id): Async generator of SSE frames for one subscriber (replay, then live events).
+      The database pages of the replay hold at most BROADCAST_BUFFER records each.
+    - stats(): Number of subscribers and delivery counters.
+- broadcaster: Global instance used by app.ingest, main.py and the /stream route.
+
+Usage
+-----
+
+    `const source = new EventSource("/api/data/stream");`
+    `source.addEventListener("record", e => ...); source.addEventListener("alarm", e => ...);`
+
+Dependencies
+------------
+
+asyncio, json, FastAPI (run_in_threadpool), SQLAlchemy, app.db, app.models, app.retention
+"""
+import asyncio
+import json
+import os
+from collections import deque
+from datetime import datetime
+from typing import AsyncIterator, Deque, List, Optional, Set, Tuple
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import select
+from .db import ReadSessionLocal
+from .models import AlarmRecord, BeeRecord
+from .retention import ARCHIVE_COLUMNS
+
+ALARM_COLUMNS = ["id", "record_id", "hive_id", "timestamp", "metrica", "detector", "valor", "referencia", "score"]
+
+# Evento codificado: (id do registro, colmeia, frame SSE)
+Event = Tuple[int, str, bytes]
+
+
+def _frame(event: str, record_id: int, payload: dict) -> bytes:
+    data = json.dumps({k: v.isoformat() if isinstance(v, datetime) else v for k, v in payload.items()},
+                      ensure_ascii=False)
+    return f"id: {record_id}\nevent: {event}\ndata: {data}\n\n".encode()
+
+
+def _encode(rows: List[dict], alarms: List[dict]) -> List[Event]:
+    por_registro = {}
+    for alarm in alarms:
+        por_registro.setdefault(alarm["record_id"], []).append(alarm)
+    events = []
+    for row in rows:
+        events.append((row["id"], row["hive_id"], _frame("record", row["id"], {c: row[c] for c in ARCHIVE_COLUMNS})))
+        for alarm in por_registro.get(row["id"], ()):
+            events.append((row["id"], row["hive_id"],
+                           _frame("alarm", row["id"], {c: alarm.get(c) for c in ALARM_COLUMNS})))
+    return events
+
+
+class _Subscriber:
+    def __init__(self, max_size: int, hive_id: Optional[str]):
+        self.queue: "asyncio.Queue[Event]" = asyncio.Queue(maxsize=max_size)
+        self.hive_id = hive_id
+        self.dropped = False  # fila cheia: o cliente é desconectado e retoma pelo último id
+
+
+class Broadcaster:
+    def __init__(self, client_queue: int = 1000, buffer_size: int = 1000, keepalive: float = 15.0):
+        self.client_queue = client_queue
+        self.keepalive = keepalive
+        self._buffer: Deque[Event] = deque(maxlen=buffer_size)
+        self._subscribers: Set[_Subscriber] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+        # Contadores
+        self.published_total = 0
+        self.delivered_total = 0
+        self.dropped_clients = 0
+
+    def start(self):
+        self._loop = asyncio.get_running_loop()
+
+    def publish(self, rows: List[dict], alarms: List[dict]):
+        if self._loop is None or not rows:
+            return
+        try:
+            # Pode ser chamado da thread do flush: a entrega sempre acontece no event loop
+            self._loop.call_soon_threadsafe(self._dispatch, rows, alarms)
+        except RuntimeError:
+            pass  # event loop já encerrado
+
+    def _dispatch(self, rows: List[dict], alarms: List[dict]):
+        events = _encode(rows, alarms)
+        self._buffer.extend(events)
+        self.published_total += len(events)
+        for sub in list(self._subscribers):
+            for event in events:
+                if sub.hive_id is not None and event[1] != sub.hive_id:
+                    continue
+                try:
+                    sub.queue.put_nowait(event)
+                    self.delivered_total += 1
+                except asyncio.QueueFull:
+                    sub.dropped = True
+                    self._subscribers.discard(sub)
+                    self.dropped_clients += 1
+                    break
+
+    def _from_buffer(self, last_id: int, hive_id: Optional[str]) -> Optional[List[Event]]:
+        # None: o buffer em memória não cobre mais os eventos seguintes a last_id
+        if not self._buffer or self._buffer[0][0] > last_id + 1:
+            return None
+        return [e for e in self._buffer if e[0] > last_id and (hive_id is None or e[1] == hive_id)]
+
+    def _read_page(self, last_id: int, hive_id: Optional[str], limite: int) -> Tuple[List[Event], int, bool]:
+        """Lê do banco até `limite` registros depois de last_id e seus alarmes. Retorna (eventos, último id, última página)."""
+        with ReadSessionLocal() as db:
+            q = select(*[getattr(BeeRecord, c) for c in ARCHIVE_COLUMNS]).where(BeeRecord.id > last_id) \
+                .order_by(BeeRecord.id).limit(limite)
+            if hive_id is not None:
+                q = q.where(BeeRecord.hive_id == hive_id)
+            rows = [dict(r) for r in db.execute(q).mappings()]
+            if not rows:
+                return [], last_id, True
+            ate = rows[-1]["id"]
+            # Alarmes só dos registros da página (gravados na mesma transação que eles)
+            qa = select(*[getattr(AlarmRecord, c) for c in ALARM_COLUMNS]) \
+                .where(AlarmRecord.record_id > last_id, AlarmRecord.record_id <= ate).order_by(AlarmRecord.id)
+            if hive_id is not None:
+                qa = qa.where(AlarmRecord.hive_id == hive_id)
+            alarms = [dict(r) for r in db.execute(qa).mappings()]
+        return _encode(rows, alarms), ate, len(rows) < limite
+
+    async def stream(self, request, last_id: Optional[int] = None,
+                     hive_id: Optional[str] = None) -> AsyncIterator[bytes]:
+        sub = _Subscriber(self.client_queue, hive_id)
+        # Inscrição antes do replay: o que for publicado durante o replay fica na fila (nada se perde)
+        self._subscribers.add(sub)
+        try:
+            cursor = last_id
+            while cursor is not None:
+                # Buffer em memória lido sem await: cobre tudo até a inscrição; o restante já está na fila
+                replay = self._from_buffer(cursor, hive_id)
+                if replay is not None:
+                    for event in replay:
+                        yield event[2]
+                    cursor = max(cursor, replay[-1][0]) if replay else cursor
+                    break
+                # Cliente mais atrasado que o buffer: páginas do banco, lidas fora do event loop
+                events, cursor, ultima = await run_in_threadpool(self._read_page, cursor, hive_id,
+                                                                 self._buffer.maxlen)
+                for event in events:
+                    yield event[2]
+                if ultima:
+                    break
+            yield b"retry: 3000\n\n"
+            while not (sub.dropped and sub.queue.empty()):
+                try:
+                    event = await asyncio.wait_for(sub.queue.get(), timeout=self.keepalive)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield b": keep-alive\n\n"
+                    continue
+                if cursor is not None and event[0] <= cursor:
+                    continue  # já enviado pelo replay (lote gravado antes da leitura, entregue depois)
+                yield event[2]
+        finally:
+            self._subscribers.discard(sub)
+
+    def stats(self) -> dict:
+        return {
+            "subscribers": len(self._subscribers),
+            "buffered": len(self._buffer),
+            "published_total": self.published_total,
+            "delivered_total": self.delivered_total,
+            "dropped_clients": self.dropped_clients,
+        }
+
+
+# Global instance
+broadcaster = Broadcaster(
+    client_queue=int(os.getenv("BROADCAST_CLIENT_QUEUE", "1000")),
+    buffer_size=int(os.getenv("BROADCAST_BUFFER", "1000")),
+    keepalive=float(os.getenv("BROADCAST_KEEPALIVE", "15")),
+)
@@ -7,19 +7,28 @@ Sets up the database connection and session management for the Abelhas IoT+ML ba
 Main Components
 ---------------
 
-- Database Path and URL: Constructs the absolute path to data.db and sets the SQLAlchemy database URL for SQLite.
+- Database Path and URL: Constructs the absolute path to data.db (overridable with DB_PATH) and sets the SQLAlchemy database URL for SQLite.
+- Storage Mode (STORAGE_MODE):
+    - "default": a single engine shared by readers and writers.
+    - "wal": single-writer / multi-reader mode. The database runs in WAL journaling with tuned pragmas
+      (synchronous, mmap_size, cache_size, busy_timeout); writes go through one dedicated writer connection
+      and reads use a separate pooled read-only engine, so readers never wait for a write transaction.
 - Engine and Session:
-    - engine: SQLAlchemy engine for database connection.
-    - SessionLocal: Factory for creating new database sessions.
+    - engine: SQLAlchemy engine used for writes (and for reads in default mode).
+    - read_engine: SQLAlchemy engine used for reads (the same as engine in default mode).
+    - SessionLocal: Factory for write sessions.
+    - ReadSessionLocal: Factory for read-only sessions.
     - Base: Declarative base for model definitions.
-- Dependency:
-    - get_db(): FastAPI dependency that provides a database session and ensures it is closed after use.
+- Dependencies:
+    - get_write_db(): FastAPI dependency that provides a write session and ensures it is closed after use.
+    - get_read_db(): FastAPI dependency that provides a read session and ensures it is closed after use.
+    - get_db(): Alias of get_write_db kept for existing routes.
 
 Usage
 -----
 
 Import Base to define ORM models.
-Use get_db as a dependency in FastAPI routes to access the database session.
+Use get_read_db in routes that only query and get_write_db in routes that insert or update.
 
 Dependencies
 ------------
@@ -27,23 +36,75 @@ Dependencies
 os, sqlalchemy
 """
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base, Session
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))  # backend/app
 DB_PATH = os.path.join(BASE_DIR, "..", "data.db")      # backend/data.db
-DB_PATH = os.path.abspath(DB_PATH)                     # caminho absoluto
+DB_PATH = os.path.abspath(os.getenv("DB_PATH", DB_PATH))  # caminho absoluto
 DATABASE_URL = f"sqlite:///{DB_PATH}"
 
+STORAGE_MODE = os.getenv("STORAGE_MODE", "default")  # "default" ou "wal"
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))  # bytes
+SQLITE_CACHE_KB = int(os.getenv("SQLITE_CACHE_KB", "65536"))
+READ_POOL_SIZE = int(os.getenv("READ_POOL_SIZE", "8"))
+
 connect_args = {"check_same_thread": False}
 
-engine = create_engine(DATABASE_URL, echo=False, future=True, connect_args=connect_args)
+
+def _set_writer_pragmas(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")  # seguro em WAL; fsync apenas no checkpoint
+    cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cur.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA busy_timeout=5000")
+    cur.close()
+
+
+def _set_reader_pragmas(dbapi_conn, _record):
+    cur = dbapi_conn.cursor()
+    cur.execute("PRAGMA query_only=1")
+    cur.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+    cur.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_KB}")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.execute("PRAGMA busy_timeout=5000")
+    cur.close()
+
+
+if STORAGE_MODE == "wal":
+    # Uma única conexão de escrita: as escritas são serializadas no pool em vez de disputar o lock do arquivo
+    engine = create_engine(DATABASE_URL, echo=False, future=True, connect_args=connect_args,
+                           pool_size=1, max_overflow=0)
+    event.listen(engine, "connect", _set_writer_pragmas)
+    # Garante o modo WAL antes que a primeira conexão somente leitura seja aberta
+    with engine.connect():
+        pass
+
+    read_engine = create_engine(f"sqlite:///file:{DB_PATH}?mode=ro&uri=true", echo=False, future=True,
+                                connect_args=connect_args, pool_size=READ_POOL_SIZE, max_overflow=READ_POOL_SIZE)
+    event.listen(read_engine, "connect", _set_reader_pragmas)
+else:
+    engine = create_engine(DATABASE_URL, echo=False, future=True, connect_args=connect_args)
+    read_engine = engine
+
 SessionLocal = sessionmaker(bind=engine, autocommit=False, autoflush=False, future=True)
+ReadSessionLocal = sessionmaker(bind=read_engine, autocommit=False, autoflush=False, future=True)
 Base = declarative_base()
 
-def get_db() -> Session:
+def get_write_db() -> Session:
     db = SessionLocal()
     try:
         yield db
     finally:
         db.close()
+
+def get_read_db() -> Session:
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+get_db = get_write_db
@@ -0,0 +1,161 @@
+"""
+export.py
+=========
+
+Columnar export of bee sensor data for offline analytics in the Abelhas IoT+ML backend.
+Reads a time range of abelhas_data in chunks (plus, optionally, the Parquet archive) and streams it as Arrow IPC
+stream batches or as a Parquet file, without materializing the full result or building per-row dicts.
+
+Main Components
+---------------
+
+- EXPORT_FORMATS: Supported columnar formats and their media types ("arrow", "parquet").
+- TEXT_FORMATS: Supported row-oriented streaming formats and their media types ("ndjson", "csv").
+- Functions:
+    - iter_record_batches(inicio, fim, chunk_size, include_archive, hive_id): Yields pyarrow RecordBatches of the period,
+      archived records first, then hot records read with a server-side cursor.
+    - stream_export(fmt, inicio, fim, chunk_size, include_archive, hive_id): Generator of encoded bytes for a StreamingResponse.
+    - stream_rows(fmt, query, chunk_size): Runs a Core select with a server-side cursor (yield_per) and yields
+      NDJSON lines or CSV rows as they are fetched, so memory stays constant regardless of row count.
+
+Usage
+-----
+
+Used by GET /api/data/export and by GET /api/data/dados?format=ndjson|csv. Example with pyarrow on the client:
+    `pa.ipc.open_stream(requests.get(url, stream=True).raw).read_all()`
+
+Dependencies
+------------
+
+pyarrow, SQLAlchemy, csv, json, app.db, app.models, app.retention
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from typing import Iterator, List, Optional
+import pyarrow as pa
+import pyarrow.parquet as pq
+from sqlalchemy import Select, select
+from .db import ReadSessionLocal
+from .models import BeeRecord
+from .retention import ARCHIVE_COLUMNS, ARCHIVE_SCHEMA, archive_filter, archive_dataset
+
+EXPORT_FORMATS = {
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+TEXT_FORMATS = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv",
+}
+
+
+class _Drain:
+    """Destino de escrita em memória esvaziado a cada lote: só o lote atual fica em memória."""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+        self.closed = False
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def iter_record_batches(inicio: Optional[datetime] = None, fim: Optional[datetime] = None,
+                        chunk_size: int = 50000, include_archive: bool = True,
+                        hive_id: Optional[str] = None) -> Iterator[pa.RecordBatch]:
+    if include_archive:
+        dataset = archive_dataset()
+        if dataset is not None:
+            for batch in dataset.to_batches(columns=ARCHIVE_COLUMNS, filter=archive_filter(inicio, fim, hive_id),
+                                            batch_size=chunk_size):
+                if batch.num_rows:
+                    yield batch
+
+    q = select(*[getattr(BeeRecord, c) for c in ARCHIVE_COLUMNS]) \
+        .order_by(BeeRecord.timestamp.asc(), BeeRecord.id.asc())
+    if inicio is not None:
+        q = q.where(BeeRecord.timestamp >= inicio)
+    if fim is not None:
+        q = q.where(BeeRecord.timestamp < fim)
+    if hive_id is not None:
+        q = q.where(BeeRecord.hive_id == hive_id)
+
+    # Sessão própria: a resposta é transmitida depois que as dependências da rota já foram encerradas
+    db = ReadSessionLocal()
+    try:
+        result = db.execute(q.execution_options(yield_per=chunk_size))
+        for rows in result.partitions():
+            cols = list(zip(*rows))
+            yield pa.record_batch([pa.array(c, type=f.type) for c, f in zip(cols, ARCHIVE_SCHEMA)],
+                                  schema=ARCHIVE_SCHEMA)
+    finally:
+        db.close()
+
+
+def stream_export(fmt: str, inicio: Optional[datetime] = None, fim: Optional[datetime] = None,
+                  chunk_size: int = 50000, include_archive: bool = True,
+                  hive_id: Optional[str] = None) -> Iterator[bytes]:
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Formato inválido: {fmt}")
+    drain = _Drain()
+    sink = pa.PythonFile(drain, mode="w")
+    if fmt == "arrow":
+        writer = pa.ipc.new_stream(sink, ARCHIVE_SCHEMA)
+    else:
+        writer = pq.ParquetWriter(sink, ARCHIVE_SCHEMA, compression="zstd")
+    try:
+        for batch in iter_record_batches(inicio, fim, chunk_size, include_archive, hive_id):
+            if fmt == "arrow":
+                writer.write_batch(batch)
+            else:
+                writer.write_table(pa.Table.from_batches([batch]))  # um row group por lote
+            data = drain.take()
+            if data:
+                yield data
+    finally:
+        writer.close()
+    yield drain.take()
+
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    raise TypeError(f"Tipo não serializável: {type(value)}")
+
+
+def stream_rows(fmt: str, query: Select, chunk_size: int = 1000) -> Iterator[bytes]:
+    if fmt not in TEXT_FORMATS:
+        raise ValueError(f"Formato inválido: {fmt}")
+    db = ReadSessionLocal()
+    try:
+        result = db.execute(query.execution_options(yield_per=chunk_size))
+        columns = list(result.keys())
+        if fmt == "csv":
+            buf = io.StringIO()
+            writer = csv.writer(buf)
+            writer.writerow(columns)
+        for rows in result.partitions():
+            if fmt == "ndjson":
+                yield "".join(json.dumps(dict(zip(columns, r)), default=_json_default, ensure_ascii=False) + "\n"
+                              for r in rows).encode()
+            else:
+                writer.writerows((v.isoformat() if isinstance(v, datetime) else v for v in r) for r in rows)
+                yield buf.getvalue().encode()
+                buf.seek(0)
+                buf.truncate()
+    finally:
+        db.close()
@@ -0,0 +1,350 @@
+"""
+features.py
+===========
+
+Incremental feature store for the bee activity model in the Abelhas IoT+ML backend.
+The derived features (deltas, moving averages, interaction terms and temporal features) of every record are computed once,
+when the record is ingested, from the previous window of its hive, and stored in abelhas_features.
+Windows follow the (timestamp, id) order of the history, as the pandas computation they replaced: a record that arrives with
+a timestamp older than the latest of its hive is derived from the records before it, and the following records it affects
+(the next delta and the next max(JANELAS) moving averages) are recomputed.
+Like abelhas_data, the table only holds the hot records: retention deletes the features of archived records.
+Prediction and forecasting read the stored features instead of recomputing them over the whole history; training also derives
+the features of the archived records again from the Parquet archive (load_all_features).
+
+Main Components
+---------------
+
+- JANELAS: Moving average window sizes (3, 5, 10 records).
+- FEATURE_COLUMNS / FEATURE_DTYPES: Columns of abelhas_features returned by load_features and their NumPy dtypes.
+- Functions:
+    - load_state(db, hives): Reads the previous window (last max(JANELAS) records by (timestamp, id)) of each hive from abelhas_features.
+    - derive_features(rows, state): Computes the feature rows of a batch of records (with ids), advancing the window state.
+    - apply_features(db, rows): Derives and inserts the features of an ingested batch and returns the feature rows, recomputing the
+      records that follow out-of-order ones; does not commit (runs inside the ingest transaction).
+    - load_features(db, limit, hive_id, columns, since_id, until_id, chunk_size): Loads stored features into a DataFrame in (timestamp, id) order,
+      with a Core select into typed NumPy arrays; since_id/until_id restrict the record ids to (since_id, until_id].
+    - load_archived_features(db, limit, hive_id, columns, chunk_size): Derives the features of the archived records again from the
+      Parquet archive, read in ordered batches (they are not stored), in the same typed layout as load_features.
+    - load_all_features(db, limit, hive_id, columns, until_id): Archived features followed by the stored ones (hot SQLite plus
+      cold Parquet), as read by training.
+    - recent_features(db, hive_id, n): Returns the feature rows of the last n records of a hive, oldest first.
+    - prune_features(db, ids, batch_size): Deletes the feature rows of archived records, keeping the last max(JANELAS) rows of
+      each hive (the window of the next ingest); does not commit (runs inside the retention transaction).
+    - rebuild_features(db, chunk_size): Recomputes the table from abelhas_data, with the window state warmed up by the Parquet
+      archive read in ordered batches (archived rows are only kept while they are in the window of their hive).
+    - ensure_features(db): Rebuilds the features when the table is empty but abelhas_data is not (first run).
+
+Usage
+-----
+
+Rebuild the feature store from the backend directory:
+    `python -m app.features rebuild`
+
+Dependencies
+------------
+
+numpy, pandas, SQLAlchemy, app.models, app.retention
+"""
+from collections import deque
+from typing import Dict, Iterable, List, Optional
+import numpy as np
+import pandas as pd
+from sqlalchemy import String, delete, insert, select, tuple_, type_coerce, update
+from sqlalchemy.orm import Session
+from .models import BeeRecord, FeatureRecord
+from .retention import hot_archived_ids, iter_archive_rows
+
+JANELAS = (3, 5, 10)
+
+# Métrica bruta -> coluna de diferença
+DELTAS = {
+    "abelhas_ativas": "delta_abelhas",
+    "temperatura": "delta_temperatura",
+    "umidade": "delta_umidade",
+    "poluicao": "delta_poluicao",
+    "ruido_db": "delta_ruido",
+}
+INPUT_COLUMNS = ["id", "hive_id", "timestamp", "temperatura", "umidade", "poluicao", "ruido_db",
+                 "abelhas_ativas", "atividade_alta"]
+
+FEATURE_DTYPES = {
+    "hive_id": object,
+    "timestamp": object,
+    "temperatura": np.float64,
+    "umidade": np.float64,
+    "poluicao": np.float64,
+    "ruido_db": np.float64,
+    "abelhas_ativas": np.int64,
+    "atividade_alta": np.int64,
+    **{col: np.float64 for col in DELTAS.values()},
+    **{f"media_movel_{n}": np.float64 for n in JANELAS},
+    "indice_estresse": np.float64,
+    "temp_umidade": np.float64,
+    "poluicao_ruido": np.float64,
+    "hora": np.int64,
+    "dia_semana": np.int64,
+}
+FEATURE_COLUMNS = list(FEATURE_DTYPES)
+
+
+def _new_state() -> dict:
+    # chave: (timestamp, id) do último registro da janela
+    return {"anterior": None, "janela": deque(maxlen=max(JANELAS)), "chave": None}
+
+
+def _chave(row: dict) -> tuple:
+    return row["timestamp"], row["id"]
+
+
+def _ordem(desc: bool = False) -> tuple:
+    # As janelas seguem a ordem do histórico, (timestamp, id), mesmo quando os registros chegam fora de ordem
+    if desc:
+        return FeatureRecord.timestamp.desc(), FeatureRecord.id.desc()
+    return FeatureRecord.timestamp.asc(), FeatureRecord.id.asc()
+
+
+def _read_state(db: Session, hive: str, antes: Optional[tuple] = None) -> dict:
+    q = select(FeatureRecord.id, FeatureRecord.timestamp, *[getattr(FeatureRecord, m) for m in DELTAS]) \
+        .where(FeatureRecord.hive_id == hive)
+    if antes is not None:
+        q = q.where(tuple_(FeatureRecord.timestamp, FeatureRecord.id) < antes)
+    rows = db.execute(q.order_by(*_ordem(desc=True)).limit(max(JANELAS))).mappings().all()
+    estado = _new_state()
+    if rows:
+        estado["anterior"] = dict(rows[0])
+        estado["janela"].extend(r["abelhas_ativas"] for r in reversed(rows))
+        estado["chave"] = _chave(rows[0])
+    return estado
+
+
+def load_state(db: Session, hives: Iterable[str]) -> Dict[str, dict]:
+    return {hive: _read_state(db, hive) for hive in hives}
+
+
+def _delta(atual, anterior) -> float:
+    # Primeiro registro da colmeia ou valor ausente: diferença zero (como diff().fillna(0))
+    if atual is None or anterior is None:
+        return 0.0
+    return float(atual - anterior)
+
+
+def derive_features(rows: Iterable[dict], state: Dict[str, dict]) -> List[dict]:
+    feats = []
+    for row in rows:
+        estado = state.get(row["hive_id"])
+        if estado is None:
+            estado = state[row["hive_id"]] = _new_state()
+        anterior = estado["anterior"] or {}
+        janela = estado["janela"]
+        janela.append(row["abelhas_ativas"])
+
+        feat = {c: row[c] for c in INPUT_COLUMNS}
+        for metrica, col in DELTAS.items():
+            feat[col] = _delta(row[metrica], anterior.get(metrica))
+        valores = list(janela)
+        for n in JANELAS:
+            ultimos = valores[-n:]
+            feat[f"media_movel_{n}"] = sum(ultimos) / len(ultimos)
+        feat["indice_estresse"] = row["temperatura"] * row["poluicao"]
+        feat["temp_umidade"] = row["temperatura"] * row["umidade"]
+        feat["poluicao_ruido"] = row["poluicao"] * row["ruido_db"] if row["ruido_db"] is not None else None
+        feat["hora"] = row["timestamp"].hour
+        feat["dia_semana"] = row["timestamp"].weekday()
+        feats.append(feat)
+
+        estado["anterior"] = {m: row[m] for m in DELTAS}
+        estado["chave"] = _chave(row)
+    return feats
+
+
+def apply_features(db: Session, rows: List[dict]) -> List[dict]:
+    if not rows:
+        return []
+    rows = sorted(rows, key=_chave)
+    state = load_state(db, {r["hive_id"] for r in rows})
+    # Colmeias com algum registro anterior ao último gravado (timestamp do cliente atrasado ou retroativo)
+    atrasadas = {r["hive_id"] for r in rows
+                 if state[r["hive_id"]]["chave"] is not None and _chave(r) < state[r["hive_id"]]["chave"]}
+    feats = derive_features([r for r in rows if r["hive_id"] not in atrasadas], state)
+    if feats:
+        db.execute(insert(FeatureRecord.__table__), feats)
+    for hive in atrasadas:
+        feats += _backfill_features(db, hive, [r for r in rows if r["hive_id"] == hive])
+    return feats
+
+
+def _backfill_features(db: Session, hive: str, rows: List[dict], chunk_size: int = 1000) -> List[dict]:
+    # A janela é lida antes do primeiro registro atrasado; os registros gravados depois dele são recalculados até
+    # max(JANELAS) registros após o último atrasado (delta do seguinte e médias móveis dos próximos)
+    inicio = _chave(rows[0])
+    state = {hive: _read_state(db, hive, antes=inicio)}
+    result = db.execute(select(*[getattr(FeatureRecord, c) for c in INPUT_COLUMNS])
+                        .where(FeatureRecord.hive_id == hive, tuple_(FeatureRecord.timestamp, FeatureRecord.id) > inicio)
+                        .order_by(*_ordem()).execution_options(yield_per=chunk_size)).mappings()
+    novos = deque(rows)
+    fila = []
+    restantes = max(JANELAS)
+    for gravado in result:
+        while novos and _chave(novos[0]) < _chave(gravado):
+            fila.append(novos.popleft())
+        if not novos:
+            if not restantes:
+                break
+            restantes -= 1
+        fila.append(dict(gravado))
+    result.close()
+    fila.extend(novos)
+
+    ids = {r["id"] for r in rows}
+    feats = derive_features(fila, state)
+    novas = [f for f in feats if f["id"] in ids]
+    db.execute(insert(FeatureRecord.__table__), novas)
+    recalculadas = [f for f in feats if f["id"] not in ids]
+    if recalculadas:
+        db.execute(update(FeatureRecord), recalculadas)
+    return novas
+
+
+def load_features(db: Session, limit: Optional[int] = None, hive_id: Optional[str] = None,
+                  columns: Optional[List[str]] = None, since_id: Optional[int] = None, until_id: Optional[int] = None,
+                  chunk_size: int = 50000) -> pd.DataFrame:
+    columns = columns or FEATURE_COLUMNS
+    # timestamp vem como texto (sem o conversor por linha do SQLAlchemy) e é convertido de uma vez
+    q = select(*[type_coerce(FeatureRecord.timestamp, String) if c == "timestamp" else getattr(FeatureRecord, c)
+                 for c in columns]).order_by(*_ordem())
+    if hive_id is not None:
+        q = q.where(FeatureRecord.hive_id == hive_id)
+    if since_id is not None:
+        q = q.where(FeatureRecord.id > since_id)
+    if until_id is not None:
+        q = q.where(FeatureRecord.id <= until_id)
+    if limit:
+        q = q.limit(limit)
+    partes = {c: [] for c in columns}
+    result = db.execute(q.execution_options(yield_per=chunk_size))
+    for rows in result.partitions():
+        for nome, valores in zip(columns, zip(*rows)):
+            partes[nome].append(np.array(valores, dtype=FEATURE_DTYPES[nome]))
+    return _frame(partes, columns)
+
+
+def _frame(partes: Dict[str, List[np.ndarray]], columns: List[str]) -> pd.DataFrame:
+    cols = {nome: np.concatenate(arrs) if arrs else np.array([], dtype=FEATURE_DTYPES[nome])
+            for nome, arrs in partes.items()}
+    if "timestamp" in cols:
+        cols["timestamp"] = pd.to_datetime(cols["timestamp"], format="ISO8601")
+    return pd.DataFrame(cols, columns=columns)
+
+
+def load_archived_features(db: Session, limit: Optional[int] = None, hive_id: Optional[str] = None,
+                           columns: Optional[List[str]] = None, chunk_size: int = 50000) -> pd.DataFrame:
+    columns = columns or FEATURE_COLUMNS
+    # As features dos registros arquivados não são guardadas: são derivadas de novo, em lotes ordenados do Parquet,
+    # pulando os registros ainda no SQLite e a janela de cada colmeia mantida em abelhas_features
+    guardados = set(db.execute(select(FeatureRecord.id).outerjoin(BeeRecord, BeeRecord.id == FeatureRecord.id)
+                               .where(BeeRecord.id.is_(None))).scalars())
+    state: Dict[str, dict] = {}
+    partes = {c: [] for c in columns}
+    total = 0
+    for rows in iter_archive_rows(INPUT_COLUMNS, batch_size=chunk_size, exclude_ids=hot_archived_ids(db),
+                                  ordered=True):
+        if hive_id is not None:
+            rows = [r for r in rows if r["hive_id"] == hive_id]
+        feats = [f for f in derive_features(rows, state) if f["id"] not in guardados]
+        if limit:
+            feats = feats[:limit - total]
+        for nome in columns:
+            # Ruído ausente (None) vira NaN nas colunas float, como na leitura do SQLite
+            valores = [f[nome] for f in feats]
+            partes[nome].append(np.array(valores, dtype=FEATURE_DTYPES[nome]) if nome != "timestamp"
+                                else pd.to_datetime(valores).to_numpy())
+        total += len(feats)
+        if limit and total >= limit:
+            break
+    return _frame(partes, columns)
+
+
+def load_all_features(db: Session, limit: Optional[int] = None, hive_id: Optional[str] = None,
+                      columns: Optional[List[str]] = None, until_id: Optional[int] = None) -> pd.DataFrame:
+    # Arquivo Parquet (mais antigo) primeiro, depois a tabela quente
+    cold = load_archived_features(db, limit=limit, hive_id=hive_id, columns=columns)
+    if limit and len(cold) >= limit:
+        return cold
+    hot = load_features(db, limit=limit - len(cold) if limit else None, hive_id=hive_id, columns=columns,
+                        until_id=until_id)
+    if cold.empty:
+        return hot
+    return pd.concat([cold, hot], ignore_index=True)
+
+
+def recent_features(db: Session, hive_id: str, n: int) -> List[dict]:
+    rows = db.execute(
+        select(FeatureRecord.id, *[getattr(FeatureRecord, c) for c in FEATURE_COLUMNS])
+        .where(FeatureRecord.hive_id == hive_id).order_by(*_ordem(desc=True)).limit(n)
+    ).mappings().all()
+    return [dict(r) for r in reversed(rows)]
+
+
+def prune_features(db: Session, ids: List[int], batch_size: int = 500):
+    if not ids:
+        return
+    # A janela de cada colmeia (últimos max(JANELAS) registros) fica: é o estado da próxima ingestão
+    hives = db.execute(select(FeatureRecord.hive_id).distinct()).scalars().all()
+    janela = set()
+    for hive in hives:
+        janela.update(db.execute(select(FeatureRecord.id).where(FeatureRecord.hive_id == hive)
+                                 .order_by(*_ordem(desc=True)).limit(max(JANELAS))).scalars())
+    ids = [i for i in ids if i not in janela]
+    for i in range(0, len(ids), batch_size):
+        db.execute(delete(FeatureRecord).where(FeatureRecord.id.in_(ids[i:i + batch_size])))
+
+
+def rebuild_features(db: Session, chunk_size: int = 10000):
+    # O DELETE abre a transação de escrita: ingestões concorrentes esperam o fim da reconstrução
+    db.execute(delete(FeatureRecord))
+    state: Dict[str, dict] = {}
+    # Registros arquivados em Parquet primeiro (são os mais antigos), em lotes ordenados: só aquecem a janela de
+    # cada colmeia; os últimos max(JANELAS) de cada uma são gravados e, no fim, podados como na retenção
+    ultimos: Dict[str, deque] = {}
+    for rows in iter_archive_rows(INPUT_COLUMNS, batch_size=chunk_size, exclude_ids=hot_archived_ids(db),
+                                  ordered=True):
+        for feat in derive_features(rows, state):
+            ultimos.setdefault(feat["hive_id"], deque(maxlen=max(JANELAS))).append(feat)
+    cold = [feat for janela in ultimos.values() for feat in janela]
+    if cold:
+        db.execute(insert(FeatureRecord.__table__), cold)
+    # Depois abelhas_data em ordem (timestamp, id)
+    result = db.execute(select(*[getattr(BeeRecord, c) for c in INPUT_COLUMNS])
+                        .order_by(BeeRecord.timestamp.asc(), BeeRecord.id.asc())
+                        .execution_options(yield_per=chunk_size))
+    for chunk in result.partitions():
+        rows = [r._asdict() for r in chunk]
+        if rows:
+            db.execute(insert(FeatureRecord.__table__), derive_features(rows, state))
+    prune_features(db, [feat["id"] for feat in cold])
+    db.commit()
+
+
+def ensure_features(db: Session):
+    if db.execute(select(FeatureRecord.id).limit(1)).first() is None \
+            and db.execute(select(BeeRecord.id).limit(1)).first() is not None:
+        rebuild_features(db)
+
+
+if __name__ == "__main__":
+    import argparse
+    from .db import SessionLocal, engine
+    from .models import init_db
+
+    parser = argparse.ArgumentParser(description="Manutenção da tabela de features do modelo")
+    parser.add_argument("comando", choices=["rebuild"])
+    parser.parse_args()
+
+    init_db(engine)
+    db = SessionLocal()
+    try:
+        rebuild_features(db)
+        print("Features reconstruídas.")
+    finally:
+        db.close()
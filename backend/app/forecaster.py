@@ -0,0 +1,134 @@
+"""
+forecaster.py
+=============
+
+Stateful ARIMA forecasting of bee activity (abelhas_ativas) per hive for the Abelhas IoT+ML backend.
+Instead of refitting ARIMA(2,1,2) on the whole history at every request, the fitted results of each hive are kept in memory:
+new observations are appended to them with the fitted parameters (statsmodels `extend`, a Kalman filter pass over the new
+points only), the parameters are re-estimated on a bounded window of recent observations on a schedule, and the forecast of
+each horizon is cached until new data lands. Between ingests a forecast is a dictionary lookup.
+
+Main Components
+---------------
+
+- ARIMA_ORDER: Order of the ARIMA model, (2, 1, 2).
+- FORECAST_WINDOW: Observations used by a full fit (env, 2000 most recent records of the hive).
+- FORECAST_REFIT_EVERY: Observations appended before the parameters are re-estimated (env, 500).
+- FORECAST_REFIT_SECONDS: Maximum age of the fitted parameters (env, 3600 s).
+- Forecaster:
+    - forecast(db, steps, hive_id, watermark): Returns {"forecast": [...]} (or {"error": ...}). watermark is the id of the latest
+      record of the hive known in memory; when it has not moved, the cached forecast is returned without querying the database.
+- forecaster: Global instance used by app.model_manager.
+
+Usage
+-----
+
+Called through ModelManager.forecast, which passes the watermark of the hive's recent window (GET /api/forecast).
+
+Dependencies
+------------
+
+numpy, sqlalchemy, statsmodels, threading, time, warnings, app.models
+"""
+import os
+import threading
+import time
+import warnings
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from statsmodels.tsa.arima.model import ARIMA
+from .models import FeatureRecord
+
+ARIMA_ORDER = (2, 1, 2)
+FORECAST_WINDOW = int(os.getenv("FORECAST_WINDOW", "2000"))
+FORECAST_REFIT_EVERY = int(os.getenv("FORECAST_REFIT_EVERY", "500"))
+FORECAST_REFIT_SECONDS = float(os.getenv("FORECAST_REFIT_SECONDS", "3600"))
+
+
+class _HiveState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.results = None           # resultados ajustados (statsmodels), estendidos a cada leitura nova
+        self.watermark = 0            # id do último registro incorporado
+        self.appended = 0             # observações acrescentadas desde o último ajuste completo
+        self.fitted_at = 0.0          # time.monotonic() do último ajuste completo
+        self.cache: Dict[int, List[float]] = {}  # horizonte -> previsão
+
+
+def _read_series(db: Session, hive_id: str, since_id: int = 0,
+                 limit: Optional[int] = None) -> Tuple[np.ndarray, int]:
+    """Lê (valores, maior id) de abelhas_ativas da colmeia em ordem de ingestão; com limit, só os limit registros mais recentes."""
+    q = select(FeatureRecord.id, FeatureRecord.abelhas_ativas).where(FeatureRecord.hive_id == hive_id,
+                                                                     FeatureRecord.id > since_id)
+    if limit:
+        rows = db.execute(q.order_by(FeatureRecord.id.desc()).limit(limit)).all()[::-1]
+    else:
+        rows = db.execute(q.order_by(FeatureRecord.id.asc())).all()
+    if not rows:
+        return np.array([], dtype=np.float64), since_id
+    return np.array([r[1] for r in rows], dtype=np.float64), rows[-1][0]
+
+
+class Forecaster:
+    def __init__(self, window: int = 2000, refit_every: int = 500, refit_seconds: float = 3600.0):
+        self.window = window
+        self.refit_every = refit_every
+        self.refit_seconds = refit_seconds
+        self._states: Dict[str, _HiveState] = {}
+        self._lock = threading.Lock()
+
+    def _state(self, hive_id: str) -> _HiveState:
+        with self._lock:
+            state = self._states.get(hive_id)
+            if state is None:
+                state = self._states[hive_id] = _HiveState()
+            return state
+
+    def _fit(self, db: Session, state: _HiveState, hive_id: str):
+        y, watermark = _read_series(db, hive_id, limit=self.window)
+        if len(y) < 20:
+            raise ValueError("Poucos dados para previsão")
+        with warnings.catch_warnings():
+            # Avisos de convergência/parâmetros iniciais do statsmodels não interrompem a previsão
+            warnings.simplefilter("ignore")
+            state.results = ARIMA(y, order=ARIMA_ORDER).fit()
+        state.watermark, state.appended = watermark, 0
+        state.fitted_at = time.monotonic()
+        state.cache.clear()
+
+    def _update(self, db: Session, state: _HiveState, hive_id: str):
+        if state.results is None or state.appended >= self.refit_every \
+                or time.monotonic() - state.fitted_at >= self.refit_seconds:
+            self._fit(db, state, hive_id)
+            return
+        y, watermark = _read_series(db, hive_id, since_id=state.watermark)
+        if not len(y):
+            return
+        # Só o filtro de Kalman sobre os pontos novos, com os parâmetros já estimados
+        state.results = state.results.extend(y)
+        state.watermark = watermark
+        state.appended += len(y)
+        state.cache.clear()
+        if state.appended >= self.refit_every:
+            self._fit(db, state, hive_id)
+
+    def forecast(self, db: Session, steps: int, hive_id: str, watermark: Optional[int] = None) -> dict:
+        state = self._state(hive_id)
+        with state.lock:
+            try:
+                # Marca d'água em memória inalterada: nada novo a incorporar, sem consultar o banco
+                if state.results is None or watermark is None or watermark > state.watermark \
+                        or time.monotonic() - state.fitted_at >= self.refit_seconds:
+                    self._update(db, state, hive_id)
+                previsao = state.cache.get(steps)
+                if previsao is None:
+                    previsao = state.cache[steps] = np.asarray(state.results.forecast(steps=steps)).tolist()
+                return {"forecast": previsao}
+            except Exception as e:
+                return {"error": str(e)}
+
+
+# Global instance
+forecaster = Forecaster(window=FORECAST_WINDOW, refit_every=FORECAST_REFIT_EVERY, refit_seconds=FORECAST_REFIT_SECONDS)
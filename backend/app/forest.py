@@ -0,0 +1,115 @@
+"""
+forest.py
+=========
+
+Compiled, array-based inference for the RandomForestClassifier of the Abelhas IoT+ML backend.
+A trained forest is flattened into a few contiguous NumPy arrays (all trees concatenated), and scoring walks every
+(row, tree) pair at once with vectorized NumPy operations, without sklearn's per-call validation and per-tree dispatch.
+Results are identical to sklearn's predict_proba: inputs are cast to float32 like sklearn does before comparing against the
+thresholds, missing values follow the same branch, and the tree probabilities are accumulated in the same order.
+
+Main Components
+---------------
+
+- ARRAY_NAMES: Names of the arrays that make up a compiled forest (saved as .npy files in the model registry).
+- CompiledForest:
+    - from_sklearn(model): Flattens a fitted RandomForestClassifier.
+    - from_arrays(arrays): Rebuilds a compiled forest from its arrays (for example memory-mapped from the registry).
+    - arrays(): Returns the arrays to be saved.
+    - apply(X): Returns the leaf reached by each row in each tree, shape (n_rows, n_trees).
+    - predict_proba(X) / predict(X): Same contract as the sklearn classifier.
+
+Usage
+-----
+
+    `forest = CompiledForest.from_sklearn(model)`
+    `forest.predict_proba(X)`
+
+Dependencies
+------------
+
+numpy
+"""
+from typing import Dict
+import numpy as np
+
+ARRAY_NAMES = ("feature", "threshold", "left", "right", "missing_left", "leaf_proba", "roots", "classes")
+
+
+class CompiledForest:
+    def __init__(self, feature: np.ndarray, threshold: np.ndarray, left: np.ndarray, right: np.ndarray,
+                 missing_left: np.ndarray, leaf_proba: np.ndarray, roots: np.ndarray, classes: np.ndarray):
+        self.feature = feature            # feature testada em cada nó (0 nas folhas)
+        self.threshold = threshold        # limiar de cada nó
+        self.left = left                  # índice absoluto do filho esquerdo (o próprio nó nas folhas)
+        self.right = right                # índice absoluto do filho direito (o próprio nó nas folhas)
+        self.missing_left = missing_left  # valores ausentes (NaN) seguem pela esquerda
+        self.leaf_proba = leaf_proba      # probabilidades por classe de cada nó, normalizadas como no sklearn
+        self.roots = roots                # nó raiz de cada árvore
+        self.classes_ = classes
+        self.n_estimators = len(roots)
+
+    @classmethod
+    def from_sklearn(cls, model) -> "CompiledForest":
+        feature, threshold, left, right, missing_left, leaf_proba, roots = [], [], [], [], [], [], []
+        inicio = 0
+        for estimator in model.estimators_:
+            nodes = estimator.tree_.__getstate__()["nodes"]
+            n = len(nodes)
+            folha = nodes["left_child"] == -1
+            idx = np.arange(inicio, inicio + n)
+            roots.append(inicio)
+            feature.append(np.where(folha, 0, nodes["feature"]))
+            threshold.append(nodes["threshold"])
+            # Nas folhas os filhos apontam para o próprio nó: o percurso fica parado até o fim
+            left.append(np.where(folha, idx, nodes["left_child"] + inicio))
+            right.append(np.where(folha, idx, nodes["right_child"] + inicio))
+            missing_left.append(nodes["missing_go_to_left"].astype(bool))
+            # Mesma normalização de DecisionTreeClassifier.predict_proba
+            proba = estimator.tree_.value[:, 0, :estimator.n_classes_].copy()
+            normalizador = proba.sum(axis=1)[:, np.newaxis]
+            normalizador[normalizador == 0.0] = 1.0
+            proba /= normalizador
+            leaf_proba.append(proba)
+            inicio += n
+        return cls(np.concatenate(feature).astype(np.intp), np.concatenate(threshold).astype(np.float64),
+                   np.concatenate(left).astype(np.intp), np.concatenate(right).astype(np.intp),
+                   np.concatenate(missing_left), np.concatenate(leaf_proba), np.asarray(roots, dtype=np.intp),
+                   np.asarray(model.classes_))
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray]) -> "CompiledForest":
+        return cls(*(arrays[nome] for nome in ARRAY_NAMES))
+
+    def arrays(self) -> Dict[str, np.ndarray]:
+        return {nome: getattr(self, "classes_" if nome == "classes" else nome) for nome in ARRAY_NAMES}
+
+    def apply(self, X: np.ndarray) -> np.ndarray:
+        # O sklearn converte X para float32 antes de comparar com os limiares (float64)
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        n, n_features = X.shape
+        valores = X.ravel()
+        # Um par (linha, árvore) por posição; a cada nível só os pares que ainda não chegaram a uma folha avançam
+        nodes = np.tile(self.roots, n)
+        base = np.repeat(np.arange(n) * n_features, self.n_estimators)
+        ativos = np.flatnonzero(self.left[nodes] != nodes)
+        while ativos.size:
+            nd = nodes[ativos]
+            x = valores[base[ativos] + self.feature[nd]]
+            vai_esquerda = np.where(np.isnan(x), self.missing_left[nd], x <= self.threshold[nd])
+            nd = np.where(vai_esquerda, self.left[nd], self.right[nd])
+            nodes[ativos] = nd
+            ativos = ativos[self.left[nd] != nd]
+        return nodes.reshape(n, self.n_estimators)
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        folhas = self.apply(X)
+        # Acumula árvore a árvore, na ordem do sklearn, para resultados idênticos (inclusive em empates)
+        proba = np.zeros((len(folhas), len(self.classes_)))
+        for t in range(self.n_estimators):
+            proba += self.leaf_proba[folhas[:, t]]
+        proba /= self.n_estimators
+        return proba
+
+    def predict(self, X: np.ndarray) -> np.ndarray:
+        return self.classes_.take(np.argmax(self.predict_proba(X), axis=1))
@@ -0,0 +1,87 @@
+"""
+ingest.py
+=========
+
+Ingestion pipeline for bee sensor readings in the Abelhas IoT+ML backend.
+Turns validated payloads into `abelhas_data` rows, deriving the server-side fields, and writes a whole batch in a single transaction.
+
+Main Components
+---------------
+
+- Thresholds:
+    - LIMIAR_ATIVIDADE: Active bee count above which activity is considered high.
+- Functions:
+    - derive_fields(payload): Builds the row dict for a BeeRecordCreate, filling atividade, atividade_alta and status_ruido
+      (app.alarms.classify_noise).
+    - insert_records(db, payloads): Inserts a batch of payloads with one executemany and one commit, updating the
+      /stats counters, the /series rollups, the model feature store and the anomaly alarms in the same transaction, then
+      hands the new feature rows to the model manager's recent window and the scored readings to the anomaly detector baselines,
+      advances the data watermark (app.watermark) and publishes the new records and alarms to the push subscribers
+      (app.broadcaster). Returns the number of rows.
+
+Usage
+-----
+
+Call insert_records from the ingest routes with the validated request body.
+
+Dependencies
+------------
+
+SQLAlchemy, datetime, app.models, app.schemas, app.stats, app.rollups, app.features, app.alarms, app.broadcaster, app.watermark, app.model_manager
+"""
+from datetime import datetime
+from typing import Iterable
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+from .models import BeeRecord
+from .schemas import BeeRecordCreate
+from .stats import apply_counters
+from .rollups import apply_rollups
+from .features import apply_features
+from .alarms import apply_alarms, classify_noise, detector
+from .broadcaster import broadcaster
+from .watermark import data_watermark
+from .model_manager import model_manager
+
+LIMIAR_ATIVIDADE = 500
+
+
+def derive_fields(payload: BeeRecordCreate) -> dict:
+    atividade_alta = 1 if payload.abelhas_ativas > LIMIAR_ATIVIDADE else 0
+    return {
+        # timestamp sempre presente para que todas as linhas do lote tenham as mesmas chaves (executemany)
+        "hive_id": payload.hive_id,
+        "timestamp": payload.timestamp or datetime.now(),
+        "temperatura": payload.temperatura,
+        "umidade": payload.umidade,
+        "poluicao": payload.poluicao,
+        "abelhas_ativas": payload.abelhas_ativas,
+        "atividade_alta": atividade_alta,
+        "atividade": "alta" if atividade_alta else "baixa",
+        "ruido_db": payload.ruido_db,
+        "status_ruido": classify_noise(payload.ruido_db),
+    }
+
+
+def insert_records(db: Session, payloads: Iterable[BeeRecordCreate]) -> int:
+    rows = [derive_fields(p) for p in payloads]
+    if not rows:
+        return 0
+    # Core insert com lista de parâmetros -> um único executemany no driver; os ids voltam na ordem do lote
+    ids = db.execute(
+        insert(BeeRecord.__table__).returning(BeeRecord.id, sort_by_parameter_order=True), rows
+    ).scalars().all()
+    for row, id_ in zip(rows, ids):
+        row["id"] = id_
+    # Contadores de /stats, rollups de /series, features do modelo e alarmes na mesma transação
+    apply_counters(db, rows)
+    apply_rollups(db, rows)
+    feats = apply_features(db, rows)
+    alarms, observations = apply_alarms(db, rows)
+    db.commit()
+    # Só depois do commit: a janela e as linhas de base em memória nunca contêm registros que não foram gravados
+    model_manager.observe(feats)
+    detector.commit(observations)
+    data_watermark.bump(max(ids))
+    broadcaster.publish(rows, alarms)
+    return len(rows)
@@ -0,0 +1,194 @@
+"""
+ingest_buffer.py
+================
+
+In-process write-behind buffer for the ingest routes of the Abelhas IoT+ML backend.
+Ingest handlers enqueue validated records and return immediately; a background asyncio task flushes the queue to the database in batches.
+
+Main Components
+---------------
+
+- IngestBuffer:
+    - put_many(records): Enqueues records, stamping the reception time on records without a timestamp. Returns False when
+      the buffer is full (the route answers 429).
+    - start(): Starts the background flusher on the running event loop.
+    - running: True while the flusher task is active; routes write synchronously otherwise.
+    - stop(): Stops the flusher after writing everything still queued (graceful shutdown).
+    - flush(): Writes the queued records in batches of flush_size using app.ingest.insert_records in a worker thread.
+      When a batch fails, its records are retried one at a time: a record rejected by the database (e.g. a constraint)
+      goes to the dead-letter list instead of blocking the queue; on an operational error (database locked or
+      unavailable) the remaining records go back to the front of the queue for the next flush.
+    - dead_letter: The most recent records that could not be written (up to INGEST_DEAD_LETTER_MAX).
+    - stats(): Queue depth and flush counters/latencies.
+- Configuration (environment variables):
+    - INGEST_WRITE_BEHIND: "1" (default) enables the buffer, "0" makes the routes write synchronously.
+    - INGEST_BUFFER_MAX: Maximum number of queued records (default 50000).
+    - INGEST_FLUSH_SIZE: Queue size that triggers a flush (default 500).
+    - INGEST_FLUSH_INTERVAL: Maximum seconds between flushes (default 1.0).
+    - INGEST_DEAD_LETTER_MAX: Rejected records kept in memory for inspection (default 1000).
+- ingest_buffer: Global instance used by the routers and by main.py.
+
+Usage
+-----
+
+Call ingest_buffer.start() on startup and await ingest_buffer.stop() on shutdown.
+
+Dependencies
+------------
+
+asyncio, collections, datetime, time, SQLAlchemy, app.db, app.ingest, app.schemas
+"""
+import asyncio
+import os
+import time
+from collections import deque
+from datetime import datetime
+from typing import Deque, List, Optional, Sequence
+from sqlalchemy.exc import OperationalError
+from .db import SessionLocal
+from .ingest import insert_records
+from .schemas import BeeRecordCreate
+
+
+class IngestBuffer:
+    def __init__(self, max_size: int = 50000, flush_size: int = 500, flush_interval: float = 1.0,
+                 enabled: bool = True, dead_letter_max: int = 1000):
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.enabled = enabled
+        self._items: Deque[BeeRecordCreate] = deque()
+        self.dead_letter: Deque[BeeRecordCreate] = deque(maxlen=dead_letter_max)
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+
+        # Contadores
+        self.enqueued_total = 0
+        self.rejected_total = 0
+        self.flushed_total = 0
+        self.flushes = 0
+        self.flush_errors = 0
+        self.dead_letter_total = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._flush_ms_total = 0.0
+
+    def put_many(self, records: Sequence[BeeRecordCreate]) -> bool:
+        if len(self._items) + len(records) > self.max_size:
+            self.rejected_total += len(records)
+            return False
+        # Horário de recebimento, não o do flush (nem o de cada nova tentativa)
+        agora = datetime.now()
+        for record in records:
+            if record.timestamp is None:
+                record.timestamp = agora
+        self._items.extend(records)
+        self.enqueued_total += len(records)
+        if self._wakeup is not None and len(self._items) >= self.flush_size:
+            self._wakeup.set()
+        return True
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._stopping
+
+    def start(self):
+        if not self.enabled or self._task is not None:
+            return
+        self._stopping = False
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is None:
+            return
+        self._stopping = True
+        self._wakeup.set()
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            await self.flush()
+        # Flush final no desligamento
+        await self.flush()
+
+    async def flush(self):
+        while self._items:
+            batch: List[BeeRecordCreate] = []
+            while self._items and len(batch) < self.flush_size:
+                batch.append(self._items.popleft())
+            start = time.perf_counter()
+            try:
+                await asyncio.to_thread(self._write, batch)
+            except Exception as e:
+                self.flush_errors += 1
+                print("Falha ao gravar lote do buffer de ingestão:", e)
+                if not await self._write_one_by_one(batch):
+                    return
+                continue
+            elapsed_ms = (time.perf_counter() - start) * 1000
+            self.flushes += 1
+            self.flushed_total += len(batch)
+            self.last_flush_ms = elapsed_ms
+            self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+            self._flush_ms_total += elapsed_ms
+
+    async def _write_one_by_one(self, batch: List[BeeRecordCreate]) -> bool:
+        # Isola o registro que impede a gravação do lote; os demais são gravados normalmente
+        for i, record in enumerate(batch):
+            try:
+                await asyncio.to_thread(self._write, [record])
+            except OperationalError as e:
+                # Banco travado/indisponível: o problema não é o registro, o restante volta para a frente da fila
+                # (continua contando para o limite: backpressure)
+                self._items.extendleft(reversed(batch[i:]))
+                print("Falha ao gravar lote do buffer de ingestão:", e)
+                return False
+            except Exception as e:
+                self.dead_letter.append(record)
+                self.dead_letter_total += 1
+                print("Registro descartado pelo buffer de ingestão:", record.model_dump(), e)
+                continue
+            self.flushed_total += 1
+        return True
+
+    @staticmethod
+    def _write(batch: List[BeeRecordCreate]):
+        db = SessionLocal()
+        try:
+            insert_records(db, batch)
+        finally:
+            db.close()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "queue_depth": len(self._items),
+            "max_size": self.max_size,
+            "enqueued_total": self.enqueued_total,
+            "rejected_total": self.rejected_total,
+            "flushed_total": self.flushed_total,
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "dead_letter_total": self.dead_letter_total,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._flush_ms_total / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+
+# Global instance
+ingest_buffer = IngestBuffer(
+    max_size=int(os.getenv("INGEST_BUFFER_MAX", "50000")),
+    flush_size=int(os.getenv("INGEST_FLUSH_SIZE", "500")),
+    flush_interval=float(os.getenv("INGEST_FLUSH_INTERVAL", "1.0")),
+    enabled=os.getenv("INGEST_WRITE_BEHIND", "1") == "1",
+    dead_letter_max=int(os.getenv("INGEST_DEAD_LETTER_MAX", "1000")),
+)
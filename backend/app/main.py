@@ -8,12 +8,15 @@ Sets up database tables, configures CORS, includes API routers, and starts a bac
 Main Components
 ---------------
 
-- Database Initialization: Creates all tables using SQLAlchemy's Base.metadata.create_all.
+- Database Initialization: Creates all tables and missing indexes using app.models.init_db and builds the /stats counters, /series rollups and model feature store on first run.
 - FastAPI App Initialization: Sets the app title to "API Abelhas IoT+ML".
 - CORS Middleware: Allows cross-origin requests from specified frontend origins (development only).
 - Routers: Includes routers for data and machine learning endpoints.
-- Root Endpoint: GET / returns a simple health check JSON.
-- Startup Event: Runs the data simulator in the background when the app starts.
+- Root Endpoint: GET / returns a simple health check JSON, including the JSON encoder in use by the read endpoints
+  ("orjson", or "json" when orjson is not installed).
+- Validation Errors: 422 responses omit the rejected value of non-finite numbers (NaN/Infinity are not valid JSON).
+- Startup Event: Starts the write-behind ingest flusher, binds the push broadcaster to the event loop, the periodic retention job (when RETENTION_DAYS > 0) and runs the data simulator in the background when the app starts.
+- Shutdown Event: Flushes the records still queued in the ingest buffer and stops the training process pool.
 
 Usage
 -----
@@ -28,23 +31,41 @@ The API will be available at / and other endpoints defined in the routers.
 Dependencies
 ------------
 
-FastAPI, SQLAlchemy, asyncio, app.db, app.routers, app.simulator
+FastAPI, SQLAlchemy, asyncio, app.db, app.models, app.stats, app.rollups, app.features, app.routers, app.simulator, app.ingest_buffer, app.broadcaster, app.retention, app.model_manager, app.serialization
 """
 import os
 from fastapi import FastAPI
+from fastapi.encoders import jsonable_encoder
+from fastapi.exceptions import RequestValidationError
 from fastapi.middleware.cors import CORSMiddleware
-from .db import Base, engine
+from fastapi.responses import JSONResponse
+from .db import engine, SessionLocal
+from .models import init_db
+from .stats import ensure_stats
+from .rollups import ensure_rollups
+from .features import ensure_features
 from .routers import data as data_router
 from .routers import model_manager_routers as ml_router
 from .routers import data
 # Import do simulador
 import asyncio
 from .simulator import simulate_data
+from .ingest_buffer import ingest_buffer
+from .broadcaster import broadcaster
+from .model_manager import model_manager
+from .retention import RETENTION_DAYS, retention_loop
+from .serialization import JSON_ENCODER
 from .routers import model_manager_routers as ml_router
 from app.routers import data, model_manager_routers
 
-# Criação das tabelas
-Base.metadata.create_all(bind=engine)
+# Criação das tabelas e índices
+init_db(engine)
+
+# Contadores de /stats, rollups de /series e features do modelo (reconstruídos na primeira execução com dados já existentes)
+with SessionLocal() as _db:
+    ensure_stats(_db)
+    ensure_rollups(_db)
+    ensure_features(_db)
 
 # Inicialização do app
 app = FastAPI(title="API Abelhas IoT+ML")
@@ -73,16 +94,34 @@ app.include_router(ml_router.router)
 app.include_router(model_manager_routers.router)
 
 
+# Leituras com NaN/Infinity são rejeitadas (422); o valor recebido não pode ser ecoado no JSON da resposta
+@app.exception_handler(RequestValidationError)
+async def validation_exception_handler(request, exc: RequestValidationError):
+    errors = [{k: v for k, v in err.items() if k != "input"} if err.get("type") == "finite_number" else err
+              for err in exc.errors()]
+    return JSONResponse(status_code=422, content={"detail": jsonable_encoder(errors)})
+
+
 # Root
 @app.get("/")
 async def root():
-    return {"ok": True, "service": "abelhas-api"}
+    return {"ok": True, "service": "abelhas-api", "json_encoder": JSON_ENCODER}
 
 # 🚀 Startup: rodar simulador em background
 @app.on_event("startup")
 async def startup_event():
+    ingest_buffer.start()
+    broadcaster.start()
+    if RETENTION_DAYS > 0:
+        asyncio.create_task(retention_loop())
     asyncio.create_task(simulate_data())
 
+# Grava o que ainda estiver no buffer de ingestão antes de desligar
+@app.on_event("shutdown")
+async def shutdown_event():
+    await ingest_buffer.stop()
+    model_manager.shutdown()
+
 # if __name__ == "__main__":
 #     import uvicorn
 
@@ -3,226 +3,608 @@ model_manager.py
 ===============
 
 This module manages machine learning models for bee activity prediction and forecasting.
-It uses a RandomForestClassifier for classification and ARIMA for time series forecasting.
+It uses a RandomForestClassifier for classification and ARIMA for time series forecasting (stateful, per hive: app.forecaster).
 Data is fetched from a SQLAlchemy database and processed with pandas.
+Training can run as a background job in a separate process; the trained model is swapped in atomically when the job finishes.
+Every trained model is stored as a new version of the model registry (app.registry) and promoted there; the active version is
+loaded lazily, on first use, with memory-mapped arrays.
+Small batches (including the single-row /predicao) are scored by the compiled forest (app.forest), whose node arrays are saved with
+each registry version; larger batches keep using sklearn's predict_proba, which is faster there. Both give identical results.
+Single predictions go through an LRU/TTL cache (app.prediction_cache) keyed on the inputs, the model version and the hive
+watermark; it is cleared whenever a new model version is installed. Predictions are computed on the exact inputs unless input
+snapping is enabled (PREDICT_CACHE_STEP > 0), in which case single and batch predictions both use the snapped inputs.
+
+Functions
+---------
+
+fit_model(df, report)
+    Fits the RandomForest on a feature DataFrame and computes its metrics (hold-out and 5-fold cross-validation).
+    Returns (model, metrics); report(etapa, progresso) is called between stages.
+can_update(model, df) / fit_incremental(model, df, report)
+    Incremental update: grows TREES_PER_UPDATE extra trees (warm_start) fitted only on the records ingested since the last fit,
+    keeping the existing trees. Metrics are measured on a hold-out of the new records (no cross-validation).
+_load_training_data(db, modo, limit, hive_id, since_id)
+    Reads the training features up to the current largest record id, which becomes the model watermark.
+    A full fit reads the whole history (archived records included, app.features.load_all_features); an incremental update
+    only the records since the last fit.
+_version_meta(...)
+    Builds the registry metadata of a trained model (mode, base version, features, metrics, watermark, record count).
+_train_job(job_id, modo, limit, hive_id, base_version)
+    Entry point of a training job in the worker process: loads the features, fits (full, or incremental on top of base_version,
+    falling back to full when the new records cannot update the model) and saves a new, not yet active, registry version
+    together with its compiled forest arrays.
+    Returns the version name, mode, row count and metrics.
 
 Classes
 -------
 
+ModelNotReady
+    Raised by the prediction path while no model is installed yet; carries the training job that will provide one.
+
 ModelManager
     Handles model training, prediction, and forecasting.
 
     Attributes:
-        model: The trained RandomForestClassifier.
+        model: The trained RandomForestClassifier (property; the active registry version is loaded on first access).
+        _forest: Compiled form of the model (CompiledForest, memory-mapped from the registry), or None when disabled.
+        version: Name of the registry version being served.
         metrics: Dictionary of model metrics.
-        _last_train_count: Number of records at last training.
+        _trained_watermark / _updates_since_full: Largest record id seen by the serving model and incremental updates since the last full refit.
+        _recent: Per-hive ring buffer (deque) with the feature rows of the latest RECENT_WINDOW records by (timestamp, id), fed on
+            ingest (dropped and read again when an out-of-order record arrives).
+        _new_records: Cheap in-memory counter of the records ingested after the serving model's watermark, used by the retrain
+            check (seeded with one indexed count when a version is installed, then fed on ingest).
+        _jobs: Status of the latest training jobs (job_id -> dict), at most one queued or running at a time.
 
     Methods:
-        __init__(): Loads the model if it exists.
-        _load(): Loads the model from disk.
-        _save(): Saves the model to disk.
-        _fetch_df(db, limit): Fetches and processes data from the database, adding features and statistics.
-        train(db, limit): Trains the RandomForest model with data from the database. Returns metrics.
-        ensure_model(db, retrain_threshold): Ensures the model is trained and retrains if enough new data is available.
-        predict(db, temperatura, umidade, poluicao, ruido_db): Predicts bee activity using the trained model and input features.
-        forecast(db, steps): Forecasts future bee activity using ARIMA.
+        __init__(): Initializes the state; the model is not loaded yet.
+        _load(): Loads the active registry version (importing a legacy model.pkl as the first version when the registry is empty).
+        _fetch_df(db, limit, hive_id, columns): Reads records and their derived features from the feature store (abelhas_features),
+            preceded by the archived records with their features derived again; hive_id restricts the data to one hive.
+        train(db, limit, hive_id): Trains the RandomForest model in the calling thread with data from the database (all hives by default),
+            saves and activates it as a new registry version. Returns metrics.
+        _compile(model, version): Returns the compiled forest of a version (saved arrays, or compiled in memory for older versions).
+        _install(model, meta): Atomically replaces the serving model, its compiled forest, version, metrics and watermark,
+            and clears the prediction cache.
+        activate(version): Promotes a registry version and serves it. Returns its metadata.
+        rollback(): Activates the version created before the one being served.
+        versions(): Lists the registry versions with their metadata.
+        _next_mode(): Retrain policy: "incremental" until FULL_REFIT_EVERY updates have been applied, then "full".
+        start_training(limit, hive_id, modo): Submits a training job ("full", "incremental" or "auto") to the process pool.
+            Returns (job, created); when a job is already active, that job is returned instead.
+        job_status(job_id): Returns the status of a job (queued, running, done or error), its stage, progress and metrics.
+        wait_job(job_id): Blocks on the job's completion event and returns its final status; re-raises the job's exception.
+        shutdown(): Stops the training process pool.
+        observe(feats): Appends freshly ingested feature rows to the recent windows and to the new record counter.
+        _recent_window(db, hive_id): Returns the ring buffer of a hive, seeding it from the feature store on first use.
+        new_records(db): Returns the number of records ingested after the training watermark, without scanning the table.
+        ensure_model(db, retrain_threshold): Ensures the model is trained. Without a model (cold start), submits a full training
+            job (deduplicated by start_training) and raises ModelNotReady, answered with 503 by the routes, instead of training
+            inside the request; when enough new data is available, starts a background retrain following the retrain policy
+            and keeps serving the current model.
+        _feature_matrix(db, items): Builds the feature matrix of a list of inputs, using the recent window of each hive.
+        prepare_batch(db, items): Ensures the model is trained and builds the feature matrix (of the snapped inputs when
+            PREDICT_CACHE_STEP > 0). Returns (scorer, X), where the scorer
+            is the compiled forest for batches up to COMPILED_MAX_ROWS rows and the sklearn model otherwise.
+        iter_predictions(model, X, chunk_size): Scores X with one predict_proba call per chunk and yields lists of results
+            (model is a RandomForestClassifier or a CompiledForest).
+        predict_batch(db, items): Predicts bee activity for a list of inputs with a single feature matrix.
+        predict(db, temperatura, umidade, poluicao, ruido_db, hive_id): Predicts bee activity using the trained model, input features
+            and the recent window of the hive (O(1), independent of the table size). With the prediction cache enabled, repeated
+            requests are answered from memory.
+        forecast(db, steps, hive_id): Forecasts future bee activity of a hive using ARIMA. The fitted model of the hive is kept and
+            extended with new records (app.forecaster); the forecast is cached per horizon until the hive's recent window moves.
 
 Global Variables
 ----------------
 
-MODEL_PATH: Path to save/load the model (model.pkl by default).
+MODEL_PATH: Legacy single-file model (model.pkl by default), imported into the registry on first run.
+RECENT_WINDOW: Number of records kept in memory per hive (largest moving average window).
+MAX_TRAIN_JOBS: Number of training jobs kept for status queries.
+MODEL_FEATURES: Model feature columns, in the order of the feature matrix.
+RETRAIN_MODE: Automatic retrain mode, "incremental" (default) or "full" (env).
+BASE_TREES / TREES_PER_UPDATE: Trees of a full fit (200) and trees added by each incremental update (env, 20).
+FULL_REFIT_EVERY: Incremental updates between two full refits (env, 20), which also bounds the forest size.
+COMPILED_INFERENCE: Scores small batches with the compiled forest (env, "1" by default; "0" always uses sklearn).
+COMPILED_MAX_ROWS: Largest batch scored by the compiled forest (env, 256); above it sklearn's compiled per-tree traversal is faster.
 model_manager: Global instance of ModelManager.
 
 Dependencies
 ------------
 
-joblib, numpy, pandas, sqlalchemy, sklearn, statsmodels
+joblib, numpy, pandas, sqlalchemy, sklearn, statsmodels, threading, multiprocessing, concurrent.futures, app.features, app.registry,
+app.forest, app.prediction_cache, app.forecaster
 """
 
+import multiprocessing
 import os
-import joblib
+import queue
+import threading
+import uuid
 import numpy as np
 import pandas as pd
-from typing import Optional
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from datetime import datetime
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import func, select
 from sqlalchemy.orm import Session
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import train_test_split, cross_val_score
 from sklearn.metrics import accuracy_score, classification_report, confusion_matrix, f1_score, roc_auc_score
-from .models import BeeRecord
-from statsmodels.tsa.arima.model import ARIMA
+from .models import DEFAULT_HIVE, FeatureRecord
+from .features import JANELAS, load_all_features, load_features, recent_features
+from .forest import CompiledForest
+from .prediction_cache import prediction_cache
+from .forecaster import forecaster
+from . import registry
 
 MODEL_PATH = os.getenv("MODEL_PATH", "./model.pkl")
+RECENT_WINDOW = max(JANELAS)
+MAX_TRAIN_JOBS = 20  # jobs mantidos para consulta de status
+
+
+class ModelNotReady(Exception):
+    """Ainda não há modelo treinado: o treino foi enfileirado (job) e a predição deve ser repetida depois."""
+
+    def __init__(self, job: dict):
+        super().__init__("Modelo em treinamento, tente novamente em instantes")
+        self.job = job
+
+# Retreino automático: "incremental" (árvores novas só com os dados novos) ou "full" (refit completo a cada limiar)
+RETRAIN_MODE = os.getenv("RETRAIN_MODE", "incremental")
+BASE_TREES = 200
+TREES_PER_UPDATE = int(os.getenv("TREES_PER_UPDATE", "20"))
+FULL_REFIT_EVERY = int(os.getenv("FULL_REFIT_EVERY", "20"))  # atualizações incrementais entre dois refits completos
+
+# Inferência compilada (app.forest) para lotes pequenos; lotes maiores usam o predict_proba do sklearn
+COMPILED_INFERENCE = os.getenv("COMPILED_INFERENCE", "1") == "1"
+COMPILED_MAX_ROWS = int(os.getenv("COMPILED_MAX_ROWS", "256"))
+
+# Features do modelo, na ordem das colunas de X
+MODEL_FEATURES = ["temperatura","umidade","poluicao","ruido_db",
+                  "delta_abelhas","media_movel_3","media_movel_5","media_movel_10",
+                  "indice_estresse","delta_temperatura","delta_umidade","delta_poluicao","delta_ruido"]
+
+_progress_queue = None
+
+
+def _metrics(model: RandomForestClassifier, y_test, y_pred, cv_scores=None) -> dict:
+    return {
+        "accuracy": float(accuracy_score(y_test, y_pred)),
+        "f1_score": float(f1_score(y_test, y_pred)),
+        # AUC só é definida com as duas classes no conjunto de teste
+        "auc": float(roc_auc_score(y_test, y_pred)) if len(set(y_test)) > 1 else None,
+        "confusion_matrix": confusion_matrix(y_test, y_pred).tolist(),
+        "classification_report": classification_report(y_test, y_pred, output_dict=True),
+        "cross_val_mean": float(cv_scores.mean()) if cv_scores is not None else None,
+        "feature_importance": dict(zip(MODEL_FEATURES, model.feature_importances_.tolist())),
+        "n_estimators": len(model.estimators_),
+    }
+
+
+def fit_model(df: pd.DataFrame, report: Optional[Callable[[str, float], None]] = None):
+    report = report or (lambda etapa, progresso: None)
+    if len(df) < 20:
+        raise ValueError("Poucos dados no banco para treinar (mín. 20). Rode o simulador para popular.")
+
+    X = df[MODEL_FEATURES]
+    y = df["atividade_alta"]
+
+    report("treinando", 0.2)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    model = RandomForestClassifier(n_estimators=BASE_TREES, random_state=42)
+    model.fit(X_train, y_train)
+    y_pred = model.predict(X_test)
+
+    # Cross-validation
+    report("validação cruzada", 0.5)
+    cv_scores = cross_val_score(model, X, y, cv=5)
+
+    return model, _metrics(model, y_test, y_pred, cv_scores)
+
+
+def can_update(model: RandomForestClassifier, df: pd.DataFrame) -> bool:
+    # As árvores novas precisam ver as mesmas classes do modelo (predict_proba soma as árvores por classe)
+    return len(df) >= 20 and set(df["atividade_alta"].unique().tolist()) == set(model.classes_.tolist())
+
+
+def fit_incremental(model: RandomForestClassifier, df: pd.DataFrame,
+                    report: Optional[Callable[[str, float], None]] = None):
+    """Acrescenta TREES_PER_UPDATE árvores treinadas só com os registros novos (warm_start); as antigas são mantidas."""
+    report = report or (lambda etapa, progresso: None)
+    if not can_update(model, df):
+        raise ValueError("Dados novos insuficientes para atualização incremental (mín. 20, com as duas classes).")
+
+    X = df[MODEL_FEATURES]
+    y = df["atividade_alta"]
+
+    report("treinando (incremental)", 0.2)
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + TREES_PER_UPDATE)
+    model.fit(X_train, y_train)
+    model.set_params(warm_start=False)
+    y_pred = model.predict(X_test)
+
+    # Sem validação cruzada: métricas medidas nos registros novos retidos para teste
+    return model, _metrics(model, y_test, y_pred)
+
+
+def _load_training_data(db: Session, modo: str, limit: Optional[int] = None, hive_id: Optional[str] = None,
+                        since_id: int = 0) -> Tuple[pd.DataFrame, int]:
+    """Lê as features até o maior id atual (marca d'água do treino); no modo incremental, só as posteriores a since_id."""
+    watermark = db.execute(select(func.max(FeatureRecord.id))).scalar() or 0
+    if modo == "incremental":
+        return load_features(db, since_id=since_id, until_id=watermark), watermark
+    # Histórico completo: SQLite quente e arquivo Parquet frio
+    df = load_all_features(db, limit=limit, hive_id=hive_id, until_id=watermark)
+    # Treino parcial (uma colmeia ou limite) não serve de base para atualizações incrementais
+    return df, (0 if limit or hive_id else watermark)
+
+
+def _init_worker(progress_queue):
+    global _progress_queue
+    _progress_queue = progress_queue
+
+
+def _version_meta(modo: str, metrics: dict, df: pd.DataFrame, watermark: int, registros: int, atualizacoes: int,
+                  base: Optional[str] = None, limit: Optional[int] = None, hive_id: Optional[str] = None) -> dict:
+    return {"modo": modo, "base": base, "features": MODEL_FEATURES, "metrics": metrics, "watermark": watermark,
+            "registros": registros, "linhas": len(df), "atualizacoes": atualizacoes, "limit": limit,
+            "hive_id": hive_id, "criado_em": datetime.now().isoformat()}
+
+
+def _train_job(job_id: str, modo: str, limit: Optional[int], hive_id: Optional[str],
+               base_version: Optional[str]) -> dict:
+    """Executado no processo de treino: lê as features, treina e grava uma nova versão no registro (sem ativá-la)."""
+    from .db import ReadSessionLocal
+
+    def report(etapa: str, progresso: float):
+        if _progress_queue is not None:
+            _progress_queue.put((job_id, etapa, progresso))
+
+    report("carregando dados", 0.05)
+    model, base = None, None
+    if modo == "incremental":
+        # Base da atualização: a versão em uso; sem mmap, pois as árvores novas são acrescentadas a ela
+        try:
+            model, base = registry.load_version(base_version, mmap=False)
+        except Exception:
+            model = None
+    with ReadSessionLocal() as db:
+        if model is not None:
+            df, watermark = _load_training_data(db, modo, since_id=base["watermark"])
+        if model is None or not can_update(model, df):
+            modo = "full"
+            df, watermark = _load_training_data(db, modo, limit, hive_id)
+    if modo == "incremental":
+        model, metrics = fit_incremental(model, df, report)
+        meta = _version_meta(modo, metrics, df, watermark, base["registros"] + len(df), base["atualizacoes"] + 1,
+                             base=base["version"])
+    else:
+        model, metrics = fit_model(df, report)
+        meta = _version_meta(modo, metrics, df, watermark, len(df), 0, limit=limit, hive_id=hive_id)
+    report("salvando", 0.9)
+    version = registry.save_version(model, meta, arrays=CompiledForest.from_sklearn(model).arrays())
+    return {"version": version, "modo": modo, "linhas": len(df), "metrics": metrics}
+
 
 class ModelManager:
     def __init__(self):
-        self.model: Optional[RandomForestClassifier] = None
+        # O modelo só é carregado do registro no primeiro uso (startup rápido)
+        self._model: Optional[RandomForestClassifier] = None
+        self._forest: Optional[CompiledForest] = None
+        self._loaded = False
+        self._load_lock = threading.Lock()
+        self.version: Optional[str] = None
         self.metrics: Optional[dict] = None
-        self._last_train_count: int = 0
-        self._load()
+        self._trained_watermark: int = 0  # maior id de registro visto no último treino (0: desconhecido)
+        self._updates_since_full: int = 0
+        self._lock = threading.Lock()
+        self._recent: Dict[str, Deque[dict]] = {}
+        self._new_records: Optional[int] = None  # registros depois da marca d'água do modelo em uso (None: a semear)
+        self._count_watermark: int = 0  # maior id já incluído em _new_records
+        self._jobs_lock = threading.Lock()
+        self._jobs: "OrderedDict[str, dict]" = OrderedDict()
+        self._futures: Dict[str, Future] = {}
+        self._done: Dict[str, threading.Event] = {}  # sinalizado por _finish_job
+        self._active_job: Optional[str] = None
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._progress = None  # fila de progresso compartilhada com o processo de treino
+
+    @property
+    def model(self) -> Optional[RandomForestClassifier]:
+        if not self._loaded:
+            with self._load_lock:
+                if not self._loaded:
+                    self._load()
+        return self._model
 
     def _load(self):
-        if os.path.exists(MODEL_PATH):
+        try:
+            # Primeira execução com o registro: importa o model.pkl existente como v0001
+            version = registry.active_version() or registry.import_legacy(MODEL_PATH)
+            if version is not None:
+                self._install(*registry.load_version(version))
+        except Exception:
+            self._model = None
+        self._loaded = True
+
+    def _fetch_df(self, db: Session, limit: Optional[int] = None, hive_id: Optional[str] = None,
+                  columns: Optional[List[str]] = None) -> pd.DataFrame:
+        # Features já calculadas na ingestão (app.features); só as dos registros arquivados são derivadas de novo
+        return load_all_features(db, limit=limit, hive_id=hive_id, columns=columns)
+
+    def train(self, db: Session, limit: Optional[int] = None, hive_id: Optional[str] = None):
+        df, watermark = _load_training_data(db, "full", limit, hive_id)
+        model, metrics = fit_model(df)
+        version = registry.save_version(model, _version_meta("full", metrics, df, watermark, len(df), 0,
+                                                             limit=limit, hive_id=hive_id),
+                                        arrays=CompiledForest.from_sklearn(model).arrays())
+        self.activate(version)
+        return metrics
+
+    def _compile(self, model: RandomForestClassifier, version: str) -> Optional[CompiledForest]:
+        if not COMPILED_INFERENCE:
+            return None
+        arrays = registry.load_arrays(version)
+        # Versões gravadas antes da inferência compilada (ou importadas do model.pkl) são compiladas em memória
+        return CompiledForest.from_arrays(arrays) if arrays else CompiledForest.from_sklearn(model)
+
+    def _install(self, model: RandomForestClassifier, meta: dict):
+        forest = self._compile(model, meta["version"])
+        # Troca atômica: predições em andamento continuam com a referência antiga do modelo
+        with self._lock:
+            self._model = model
+            self._forest = forest
+            self._loaded = True
+            self.version = meta["version"]
+            self.metrics = meta.get("metrics")
+            self._trained_watermark = meta.get("watermark", 0)
+            self._new_records = None  # recontado a partir da nova marca d'água no próximo uso
+            self._updates_since_full = meta.get("atualizacoes", 0)
+        # Predições da versão anterior não são mais servidas (a versão também faz parte da chave)
+        prediction_cache.clear()
+
+    def activate(self, version: str) -> dict:
+        """Promove uma versão do registro: carrega (com mmap), grava o ponteiro ACTIVE e troca o modelo em uso."""
+        model, meta = registry.load_version(version)
+        registry.activate(version)
+        self._install(model, meta)
+        return meta
+
+    def rollback(self) -> dict:
+        anterior = registry.previous_version(self.version or registry.active_version() or "")
+        if anterior is None:
+            raise KeyError("Não há versão anterior para rollback")
+        return self.activate(anterior)
+
+    def versions(self) -> List[dict]:
+        self.model  # garante a importação do model.pkl legado antes de listar
+        return registry.list_versions()
+
+    def _next_mode(self) -> str:
+        if RETRAIN_MODE != "incremental" or not self._trained_watermark \
+                or self._updates_since_full >= FULL_REFIT_EVERY:
+            return "full"
+        return "incremental"
+
+    def _drain_progress(self):
+        while self._progress is not None:
             try:
-                self.model = joblib.load(MODEL_PATH)
-            except Exception:
-                self.model = None
-
-    def _save(self):
-        if self.model is not None:
-            joblib.dump(self.model, MODEL_PATH)
-
-    def _fetch_df(self, db: Session, limit: Optional[int] = None) -> pd.DataFrame:
-        q = db.query(BeeRecord).order_by(BeeRecord.timestamp.asc())
-        if limit:
-            q = q.limit(limit)
-        rows = q.all()
-        if not rows:
-            return pd.DataFrame(columns=["temperatura", "umidade", "poluicao", "abelhas_ativas",
-                                         "atividade_alta", "ruido_db", "timestamp"])
-        data = [{
-            "temperatura": r.temperatura,
-            "umidade": r.umidade,
-            "poluicao": r.poluicao,
-            "abelhas_ativas": r.abelhas_ativas,
-            "atividade_alta": r.atividade_alta,
-            "ruido_db": r.ruido_db,
-            "timestamp": r.timestamp
-        } for r in rows]
-
-        df = pd.DataFrame(data)
-        df['timestamp'] = pd.to_datetime(df['timestamp'])
-
-        # Diferenças
-        df['delta_abelhas'] = df['abelhas_ativas'].diff().fillna(0)
-        df['delta_temperatura'] = df['temperatura'].diff().fillna(0)
-        df['delta_umidade'] = df['umidade'].diff().fillna(0)
-        df['delta_poluicao'] = df['poluicao'].diff().fillna(0)
-        df['delta_ruido'] = df['ruido_db'].diff().fillna(0)
-
-        # Médias móveis
-        df['media_movel_3'] = df['abelhas_ativas'].rolling(3, min_periods=1).mean()
-        df['media_movel_5'] = df['abelhas_ativas'].rolling(5, min_periods=1).mean()
-        df['media_movel_10'] = df['abelhas_ativas'].rolling(10, min_periods=1).mean()
-
-        # Interações
-        df['indice_estresse'] = df['temperatura'] * df['poluicao']
-        df['temp_umidade'] = df['temperatura'] * df['umidade']
-        df['poluicao_ruido'] = df['poluicao'] * df['ruido_db']
-
-        # Features temporais
-        df['hora'] = df['timestamp'].dt.hour
-        df['dia_semana'] = df['timestamp'].dt.dayofweek
-
-        return df
-
-    def train(self, db: Session, limit: Optional[int] = None):
-        df = self._fetch_df(db, limit)
-        if len(df) < 20:
-            raise ValueError("Poucos dados no banco para treinar (mín. 20). Rode o simulador para popular.")
-
-        # Features completas
-        feature_cols = ["temperatura","umidade","poluicao","ruido_db",
-                        "delta_abelhas","media_movel_3","media_movel_5","media_movel_10",
-                        "indice_estresse","delta_temperatura","delta_umidade","delta_poluicao","delta_ruido"]
-
-        X = df[feature_cols]
-        y = df["atividade_alta"]
-
-        X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-        model = RandomForestClassifier(n_estimators=200, random_state=42)
-        model.fit(X_train, y_train)
-        y_pred = model.predict(X_test)
-
-        # Metrics
-        acc = accuracy_score(y_test, y_pred)
-        f1 = f1_score(y_test, y_pred)
-        auc = roc_auc_score(y_test, y_pred)
-        cm = confusion_matrix(y_test, y_pred).tolist()
-        report = classification_report(y_test, y_pred, output_dict=True)
-
-        # Cross-validation
-        cv_scores = cross_val_score(model, X, y, cv=5)
-
-        self.model = model
-        self._save()
-        self._last_train_count = len(df)
-
-        self.metrics = {
-            "accuracy": float(acc),
-            "f1_score": float(f1),
-            "auc": float(auc),
-            "confusion_matrix": cm,
-            "classification_report": report,
-            "cross_val_mean": float(cv_scores.mean()),
-            "feature_importance": dict(zip(feature_cols, model.feature_importances_.tolist()))
-        }
-
-        return self.metrics
+                job_id, etapa, progresso = self._progress.get_nowait()
+            except queue.Empty:
+                return
+            job = self._jobs.get(job_id)
+            if job is not None and job["status"] in ("queued", "running"):
+                job.update(status="running", etapa=etapa, progresso=progresso)
+                job["iniciado_em"] = job["iniciado_em"] or datetime.now()
+
+    def start_training(self, limit: Optional[int] = None, hive_id: Optional[str] = None,
+                       modo: str = "full") -> Tuple[dict, bool]:
+        """Enfileira um treino no pool de processos. Retorna (job, criado); com um job ativo, retorna esse job."""
+        if limit or hive_id:
+            modo = "full"
+        elif modo == "auto":
+            modo = self._next_mode()
+        elif modo == "incremental" and not self._trained_watermark:
+            modo = "full"
+        with self._jobs_lock:
+            if self._active_job is not None:
+                return self._jobs[self._active_job], False
+            if self._executor is None:
+                ctx = multiprocessing.get_context("spawn")
+                self._progress = ctx.Queue()
+                self._executor = ProcessPoolExecutor(max_workers=1, mp_context=ctx,
+                                                     initializer=_init_worker, initargs=(self._progress,))
+            job_id = uuid.uuid4().hex
+            job = {"job_id": job_id, "status": "queued", "modo": modo, "etapa": None, "progresso": 0.0, "limit": limit,
+                   "hive_id": hive_id, "criado_em": datetime.now(), "iniciado_em": None, "concluido_em": None,
+                   "version": None, "linhas": None, "metrics": None, "error": None}
+            self._jobs[job_id] = job
+            while len(self._jobs) > MAX_TRAIN_JOBS:
+                antigo, _ = self._jobs.popitem(last=False)
+                self._futures.pop(antigo, None)
+                self._done.pop(antigo, None)
+            self._active_job = job_id
+            self._done[job_id] = threading.Event()
+            self._futures[job_id] = future = self._executor.submit(_train_job, job_id, modo, limit, hive_id,
+                                                                       self.version)
+        future.add_done_callback(lambda f: self._finish_job(job_id, f))
+        return job, True
+
+    def _finish_job(self, job_id: str, future: Future):
+        self._drain_progress()
+        job = self._jobs.get(job_id, {})
+        try:
+            res = future.result()
+        except Exception as e:
+            job.update(status="error", error=str(e))
+        else:
+            try:
+                self.activate(res["version"])
+            except Exception as e:
+                job.update(status="error", error=str(e))
+            else:
+                job.update(status="done", modo=res["modo"], version=res["version"], etapa="concluído", progresso=1.0,
+                           linhas=res["linhas"], metrics=res["metrics"])
+        job["concluido_em"] = datetime.now()
+        with self._jobs_lock:
+            if self._active_job == job_id:
+                self._active_job = None
+            done = self._done.get(job_id)
+        if done is not None:
+            done.set()
+
+    def job_status(self, job_id: str) -> Optional[dict]:
+        self._drain_progress()
+        return self._jobs.get(job_id)
+
+    def wait_job(self, job_id: str) -> dict:
+        """Bloqueia até o fim do job (sem ocupar o GIL) e retorna seu estado final; erros do treino são repropagados."""
+        future = self._futures[job_id]
+        # Evento sinalizado pelo callback de conclusão, depois da troca do modelo
+        self._done[job_id].wait()
+        future.result()
+        return self._jobs[job_id]
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def observe(self, feats: List[dict]):
+        with self._lock:
+            # ids já vistos ao semear o contador não são contados de novo (o lote vem em ordem de timestamp, não de id)
+            if self._new_records is not None and feats:
+                self._new_records += sum(1 for feat in feats if feat["id"] > self._count_watermark)
+                self._count_watermark = max(self._count_watermark, max(feat["id"] for feat in feats))
+            for feat in feats:
+                janela = self._recent.get(feat["hive_id"])
+                # Colmeias ainda não semeadas são lidas do banco quando forem usadas
+                if janela is None:
+                    continue
+                if not janela or (feat["timestamp"], feat["id"]) > (janela[-1]["timestamp"], janela[-1]["id"]):
+                    janela.append(feat)
+                elif all(r["id"] != feat["id"] for r in janela):
+                    # Registro fora de ordem (timestamp anterior ao último): a janela é relida do banco no próximo uso
+                    del self._recent[feat["hive_id"]]
+
+    def _recent_window(self, db: Session, hive_id: str) -> List[dict]:
+        with self._lock:
+            janela = self._recent.get(hive_id)
+            if janela is None:
+                janela = self._recent[hive_id] = deque(recent_features(db, hive_id, RECENT_WINDOW),
+                                                       maxlen=RECENT_WINDOW)
+            return list(janela)
+
+    def new_records(self, db: Session) -> int:
+        with self._lock:
+            if self._new_records is None:
+                # Só os registros posteriores à marca d'água do treino (ids crescentes): o arquivamento de registros
+                # antigos não muda a contagem. Contagem e maior id lidos na mesma transação
+                self._new_records, maior = db.execute(
+                    select(func.count(FeatureRecord.id), func.max(FeatureRecord.id))
+                    .where(FeatureRecord.id > self._trained_watermark)
+                ).one()
+                self._count_watermark = maior or self._trained_watermark
+            return self._new_records
 
     def ensure_model(self, db: Session, retrain_threshold: int = 50):
         if self.model is None:
-            self.train(db)
-        else:
-            df = self._fetch_df(db)
-            if len(df) - self._last_train_count >= retrain_threshold:
-                self.train(db)
+            # Partida a frio: o treino roda no pool de processos (um job só, mesmo com várias requisições)
+            job, _ = self.start_training(modo="full")
+            raise ModelNotReady(job)
+        elif self.new_records(db) >= retrain_threshold:
+            # Retreino em segundo plano: a predição continua com o modelo atual até a troca
+            self.start_training(modo="auto")
         return self.model
 
-    def predict(self, db: Session, temperatura: float, umidade: float, poluicao: float, ruido_db: float):
-        # Catch the last record to compute deltas and moving averages
-        df_hist = self._fetch_df(db, limit=1)
-        last_row = df_hist.iloc[-1] if not df_hist.empty else {
-            "abelhas_ativas": 50,
-            "temperatura": temperatura,
-            "umidade": umidade,
-            "poluicao": poluicao,
-            "ruido_db": ruido_db,
-            "media_movel_3": 50,
-            "media_movel_5": 50,
-            "media_movel_10": 50
-        }
-
-        # Calculates derived features
-        delta_abelhas = 0
-        media_movel_3 = last_row.get('media_movel_3', last_row['abelhas_ativas'])
-        media_movel_5 = last_row.get('media_movel_5', last_row['abelhas_ativas'])
-        media_movel_10 = last_row.get('media_movel_10', last_row['abelhas_ativas'])
-        indice_estresse = temperatura * poluicao
-        delta_temperatura = temperatura - last_row['temperatura']
-        delta_umidade = umidade - last_row['umidade']
-        delta_poluicao = poluicao - last_row['poluicao']
-        delta_ruido = ruido_db - last_row['ruido_db']
-
-        # Array with all features
-        X = np.array([[
+    def _feature_matrix(self, db: Session, items: List[dict]) -> np.ndarray:
+        """Monta a matriz de features (uma linha por item) com operações vetorizadas por coluna."""
+        n = len(items)
+        temperatura = np.fromiter((it["temperatura"] for it in items), dtype=np.float64, count=n)
+        umidade = np.fromiter((it["umidade"] for it in items), dtype=np.float64, count=n)
+        poluicao = np.fromiter((it["poluicao"] for it in items), dtype=np.float64, count=n)
+        ruido_db = np.array([it.get("ruido_db") for it in items], dtype=np.float64)  # None -> NaN
+
+        # Janela recente de cada colmeia do lote (uma vez por colmeia): último registro e médias móveis
+        contexto = {}
+        for hive_id in {it.get("hive_id", DEFAULT_HIVE) for it in items}:
+            janela = self._recent_window(db, hive_id)
+            if janela:
+                abelhas = [r["abelhas_ativas"] for r in janela]
+                ultimo = janela[-1]
+                contexto[hive_id] = (ultimo["temperatura"], ultimo["umidade"], ultimo["poluicao"],
+                                     np.nan if ultimo["ruido_db"] is None else ultimo["ruido_db"],
+                                     *(sum(abelhas[-k:]) / len(abelhas[-k:]) for k in JANELAS))
+        # Sem histórico: deltas zero e médias móveis 50 (valores padrão do modelo)
+        ctx = np.array([contexto.get(it.get("hive_id", DEFAULT_HIVE),
+                                     (t, u, p, r, 50.0, 50.0, 50.0))
+                        for it, t, u, p, r in zip(items, temperatura, umidade, poluicao, ruido_db)],
+                       dtype=np.float64).reshape(n, 4 + len(JANELAS))
+
+        # Ruído anterior ausente: delta zero; ruído atual ausente: delta NaN
+        delta_ruido = np.where(np.isnan(ctx[:, 3]), 0.0, ruido_db - ctx[:, 3])
+        return np.column_stack([
             temperatura, umidade, poluicao, ruido_db,
-            delta_abelhas, media_movel_3, media_movel_5, media_movel_10,
-            indice_estresse, delta_temperatura, delta_umidade, delta_poluicao, delta_ruido
-        ]])
-
-        # Ensure model is trained
-        model = self.ensure_model(db)
-
-        # Prediction
-        pred_class = int(model.predict(X)[0])
-        proba = float(model.predict_proba(X)[0][1]) if hasattr(model, "predict_proba") else 0.0
-        label = "Alta" if pred_class == 1 else "Baixa"
-
-        return {"predicted_label": label, "predicted_class": pred_class, "proba_alta": proba}
-
-
-    def forecast(self, db: Session, steps: int = 5):
-        df = self._fetch_df(db)
-        if len(df) < 20:
-            return {"error": "Poucos dados para previsão"}
-        series = df["abelhas_ativas"]
-        try:
-            model = ARIMA(series, order=(2,1,2))
-            fitted = model.fit()
-            forecast = fitted.forecast(steps=steps).tolist()
-            return {"forecast": forecast}
-        except Exception as e:
-            return {"error": str(e)}
+            np.zeros(n), ctx[:, 4], ctx[:, 5], ctx[:, 6],
+            temperatura * poluicao, temperatura - ctx[:, 0], umidade - ctx[:, 1], poluicao - ctx[:, 2], delta_ruido,
+        ])
+
+    def iter_predictions(self, model: RandomForestClassifier, X: np.ndarray,
+                         chunk_size: int = 10000) -> Iterator[List[dict]]:
+        for inicio in range(0, len(X), chunk_size):
+            # predict() do RandomForest é o argmax de predict_proba: uma única passada pelas árvores
+            probas = model.predict_proba(X[inicio:inicio + chunk_size])
+            classes = model.classes_[np.argmax(probas, axis=1)].tolist()
+            alta = probas[:, 1].tolist()
+            yield [{"predicted_label": "Alta" if c == 1 else "Baixa", "predicted_class": int(c), "proba_alta": p}
+                   for c, p in zip(classes, alta)]
+
+    def prepare_batch(self, db: Session, items: List[dict]):
+        """Garante o modelo e monta a matriz de features; o resultado não depende mais da sessão."""
+        if prediction_cache.step:
+            # Grade opcional do cache: lote e predição única usam as mesmas entradas arredondadas
+            items = [prediction_cache.snap(it) for it in items]
+        X = self._feature_matrix(db, items)
+        self.ensure_model(db)
+        # Modelo e floresta compilada lidos juntos: sempre da mesma versão
+        with self._lock:
+            model, forest = self._model, self._forest
+        return (forest if forest is not None and len(X) <= COMPILED_MAX_ROWS else model), X
+
+    def predict_batch(self, db: Session, items: List[dict]) -> List[dict]:
+        if not items:
+            return []
+        model, X = self.prepare_batch(db, items)
+        return [res for chunk in self.iter_predictions(model, X) for res in chunk]
+
+    def predict(self, db: Session, temperatura: float, umidade: float, poluicao: float, ruido_db: float,
+                hive_id: str = DEFAULT_HIVE):
+        if not prediction_cache.enabled:
+            item = {"temperatura": temperatura, "umidade": umidade, "poluicao": poluicao, "ruido_db": ruido_db,
+                    "hive_id": hive_id}
+            return self.predict_batch(db, [item])[0]
+        self.ensure_model(db)
+        # Marca d'água da colmeia: um registro novo muda o contexto (deltas, médias móveis) e portanto a chave
+        janela = self._recent_window(db, hive_id)
+        # Maior id da janela: muda também quando um registro fora de ordem entra nela
+        key = prediction_cache.key(self.version, hive_id, max(r["id"] for r in janela) if janela else 0,
+                                   temperatura, umidade, poluicao, ruido_db)
+        res = prediction_cache.get(key)
+        if res is None:
+            # Mesmo caminho do lote (entradas exatas, ou arredondadas quando a grade do cache está ativa)
+            res = self.predict_batch(db, [{"temperatura": temperatura, "umidade": umidade, "poluicao": poluicao,
+                                           "ruido_db": ruido_db, "hive_id": hive_id}])[0]
+            prediction_cache.put(key, res)
+        return dict(res)
+
+
+    def forecast(self, db: Session, steps: int = 5, hive_id: str = DEFAULT_HIVE):
+        # Maior id da janela em memória: se não mudou desde a última previsão, a resposta vem do cache
+        janela = self._recent_window(db, hive_id)
+        return forecaster.forecast(db, steps, hive_id, max(r["id"] for r in janela) if janela else 0)
 
 # Global instance
 model_manager = ModelManager()
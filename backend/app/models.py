@@ -11,6 +11,7 @@ Main Components
     - Table name: abelhas_data
     - Fields:
         - id: Primary key, integer, indexed.
+        - hive_id: Hive/device identifier (string, default "default").
         - timestamp: Date and time of record (default: now, indexed).
         - temperatura: Temperature (float, required).
         - umidade: Humidity (float, required).
@@ -20,6 +21,42 @@ Main Components
         - atividade: Activity description (string, required).
         - ruido_db: Noise level in dB (float, optional).
         - status_ruido: Noise status description (string, optional).
+    - Indexes: composite (timestamp, id) for keyset pagination and (hive_id, timestamp, id) for per-hive queries.
+- StatsCounter:
+    - Table name: abelhas_stats
+    - Fields:
+        - hive_id, chave: Hive and counter name ("total", "altas" or "status:<status_ruido>"), composite primary key.
+        - valor: Counter value (integer).
+- RollupRecord:
+    - Table name: abelhas_rollup
+    - Fields:
+        - hive_id, bucket, inicio: Hive, granularity ("minute", "hour", "day") and bucket start, composite primary key.
+        - count: Number of records in the bucket.
+        - <metric>_min, <metric>_max, <metric>_soma, <metric>_n: Min, max, sum and non-null count for each metric
+          in ROLLUP_METRICAS (temperatura, umidade, poluicao, ruido_db, abelhas_ativas).
+- FeatureRecord:
+    - Table name: abelhas_features
+    - Fields:
+        - id: Id of the abelhas_data record the features were derived from (primary key).
+        - hive_id, timestamp and the raw metrics used by the model (temperatura, umidade, poluicao, ruido_db,
+          abelhas_ativas, atividade_alta).
+        - delta_*: Difference to the previous record of the same hive, in (timestamp, id) order.
+        - media_movel_3/5/10: Moving averages of abelhas_ativas over the last 3/5/10 records of the hive.
+        - indice_estresse, temp_umidade, poluicao_ruido: Interaction terms.
+        - hora, dia_semana: Temporal features.
+    - Indexes: (hive_id, id) for the forecaster series, (hive_id, timestamp, id) to read the recent window of a hive
+      and (timestamp, id) for the training reads.
+- AlarmRecord:
+    - Table name: abelhas_alarmes
+    - Fields:
+        - id: Primary key.
+        - record_id, hive_id, timestamp: abelhas_data record that raised the alarm.
+        - metrica: Monitored metric (ruido_db, temperatura or abelhas_ativas).
+        - detector: "zscore" (value far from the hive's EWMA baseline) or "variacao" (change since the previous reading far from
+          the usual changes).
+        - valor, referencia, score: Observed value (or change), baseline mean and z-score.
+    - Indexes: (hive_id, id) for per-hive queries.
+- init_db(bind): Creates missing tables, columns and indexes on new or existing databases and normalizes legacy timestamps.
 
 Usage
 -----
@@ -32,13 +69,22 @@ Dependencies
 
 sqlalchemy, app.db
 """
-from sqlalchemy import Column, Integer, Float, String, DateTime, func
+from sqlalchemy import Column, Integer, Float, String, DateTime, Index, PrimaryKeyConstraint, func, inspect, text
 from .db import Base
 
+DEFAULT_HIVE = "default"
+
 class BeeRecord(Base):
     __tablename__ = "abelhas_data"
+    __table_args__ = (
+        # Índice composto usado na paginação por cursor (timestamp, id)
+        Index("ix_abelhas_data_timestamp_id", "timestamp", "id"),
+        # Consultas por colmeia leem apenas as linhas daquela colmeia
+        Index("ix_abelhas_data_hive_timestamp_id", "hive_id", "timestamp", "id"),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
+    hive_id = Column(String(50), nullable=False, default=DEFAULT_HIVE, server_default=DEFAULT_HIVE)
     timestamp = Column(DateTime(timezone=True), server_default=func.now(), index=True)
     temperatura = Column(Float, nullable=False)
     umidade = Column(Float, nullable=False)
@@ -49,4 +95,123 @@ class BeeRecord(Base):
 
      # new fields for noise data
     ruido_db = Column(Float, nullable=True)
-    status_ruido = Column(String(50), nullable=True)
\ No newline at end of file
+    status_ruido = Column(String(50), nullable=True)
+
+
+class StatsCounter(Base):
+    """Contadores agregados de abelhas_data por colmeia, mantidos na mesma transação de cada ingestão."""
+    __tablename__ = "abelhas_stats"
+
+    hive_id = Column(String(50), primary_key=True)
+    chave = Column(String(80), primary_key=True)  # "total", "altas" ou "status:<status_ruido>"
+    valor = Column(Integer, nullable=False, default=0)
+
+
+ROLLUP_METRICAS = ["temperatura", "umidade", "poluicao", "ruido_db", "abelhas_ativas"]
+
+
+class RollupRecord(Base):
+    """Agregados de abelhas_data por intervalo de tempo (minute, hour, day), mantidos a cada ingestão."""
+    __tablename__ = "abelhas_rollup"
+    __table_args__ = (PrimaryKeyConstraint("hive_id", "bucket", "inicio"),)
+
+    hive_id = Column(String(50), nullable=False)
+    bucket = Column(String(10), nullable=False)    # "minute", "hour" ou "day"
+    inicio = Column(DateTime, nullable=False)      # início do intervalo
+    count = Column(Integer, nullable=False, default=0)
+
+
+# min/max/soma/contagem de cada métrica (a contagem própria cobre valores nulos de ruido_db)
+for _m in ROLLUP_METRICAS:
+    setattr(RollupRecord, f"{_m}_min", Column(Float, nullable=True))
+    setattr(RollupRecord, f"{_m}_max", Column(Float, nullable=True))
+    setattr(RollupRecord, f"{_m}_soma", Column(Float, nullable=False, default=0))
+    setattr(RollupRecord, f"{_m}_n", Column(Integer, nullable=False, default=0))
+
+
+class FeatureRecord(Base):
+    """Features derivadas de cada registro, calculadas uma vez na ingestão a partir da janela anterior da colmeia."""
+    __tablename__ = "abelhas_features"
+    __table_args__ = (
+        # Série de uma colmeia em ordem de ingestão (app.forecaster)
+        Index("ix_abelhas_features_hive_id", "hive_id", "id"),
+        # Janela recente de uma colmeia e leitura do treino, na ordem (timestamp, id) do histórico
+        Index("ix_abelhas_features_hive_timestamp_id", "hive_id", "timestamp", "id"),
+        Index("ix_abelhas_features_timestamp_id", "timestamp", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, autoincrement=False)  # mesmo id de abelhas_data
+    hive_id = Column(String(50), nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    temperatura = Column(Float, nullable=False)
+    umidade = Column(Float, nullable=False)
+    poluicao = Column(Float, nullable=False)
+    ruido_db = Column(Float, nullable=True)
+    abelhas_ativas = Column(Integer, nullable=False)
+    atividade_alta = Column(Integer, nullable=False)
+
+    delta_abelhas = Column(Float, nullable=False)
+    delta_temperatura = Column(Float, nullable=False)
+    delta_umidade = Column(Float, nullable=False)
+    delta_poluicao = Column(Float, nullable=False)
+    delta_ruido = Column(Float, nullable=False)
+    media_movel_3 = Column(Float, nullable=False)
+    media_movel_5 = Column(Float, nullable=False)
+    media_movel_10 = Column(Float, nullable=False)
+    indice_estresse = Column(Float, nullable=False)
+    temp_umidade = Column(Float, nullable=False)
+    poluicao_ruido = Column(Float, nullable=True)
+    hora = Column(Integer, nullable=False)
+    dia_semana = Column(Integer, nullable=False)
+
+
+class AlarmRecord(Base):
+    """Alarmes emitidos pelos detectores de anomalias (app.alarms) na ingestão."""
+    __tablename__ = "abelhas_alarmes"
+    __table_args__ = (
+        Index("ix_abelhas_alarmes_hive_id", "hive_id", "id"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    record_id = Column(Integer, nullable=False)  # id do registro de abelhas_data
+    hive_id = Column(String(50), nullable=False)
+    timestamp = Column(DateTime, nullable=False)
+    metrica = Column(String(20), nullable=False)
+    detector = Column(String(20), nullable=False)  # "zscore" ou "variacao"
+    valor = Column(Float, nullable=False)
+    referencia = Column(Float, nullable=False)
+    score = Column(Float, nullable=False)
+
+
+def _migrate(bind):
+    # Reflexão e DDL na mesma conexão: o engine de escrita (STORAGE_MODE=wal) tem uma única conexão no pool
+    with bind.begin() as conn:
+        insp = inspect(conn)
+        tables = insp.get_table_names()
+
+        def columns(table):
+            return {c["name"] for c in insp.get_columns(table)}
+
+        if "abelhas_data" in tables and "hive_id" not in columns("abelhas_data"):
+            conn.execute(text(
+                f"ALTER TABLE abelhas_data ADD COLUMN hive_id VARCHAR(50) NOT NULL DEFAULT '{DEFAULT_HIVE}'"
+            ))
+        # Tabelas derivadas sem colmeia são descartadas e reconstruídas por ensure_stats/ensure_rollups
+        for derived in ("abelhas_stats", "abelhas_rollup"):
+            if derived in tables and "hive_id" not in columns(derived):
+                conn.execute(text(f"DROP TABLE {derived}"))
+
+
+def init_db(bind):
+    """Cria as tabelas e os índices que ainda não existem, inclusive em bancos já criados."""
+    _migrate(bind)
+    Base.metadata.create_all(bind=bind)
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(bind=bind, checkfirst=True)
+    with bind.begin() as conn:
+        # Registros antigos (server_default CURRENT_TIMESTAMP) não têm microssegundos; normaliza para o
+        # formato gravado pelo SQLAlchemy para que ordenação e comparação por cursor sejam consistentes
+        conn.execute(text(
+            "UPDATE abelhas_data SET timestamp = timestamp || '.000000' WHERE length(timestamp) = 19"
+        ))
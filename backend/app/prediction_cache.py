@@ -0,0 +1,132 @@
+"""
+prediction_cache.py
+===================
+
+In-memory LRU/TTL cache of single predictions for the Abelhas IoT+ML backend.
+Dashboards ask for predictions on the same slider values over and over; the result is kept under a key of the inputs
+that also holds the model version and the hive watermark (id of the latest record in the hive's recent window), so a
+retrain or a new reading of the hive never serves a stale prediction.
+By default the key holds the exact inputs, so a cached answer is exactly what the model returns. Snapping the inputs to a
+grid (PREDICT_CACHE_STEP > 0) is opt-in: it trades precision for hit rate, and then every prediction path (single and
+batch) scores the snapped inputs, so the endpoints keep agreeing with each other.
+
+Main Components
+---------------
+
+- PredictionCache:
+    - quantize(value): Snaps an input to the grid (step 0 keeps the exact value).
+    - snap(item): Returns a prediction input with its numeric fields snapped (used by ModelManager.prepare_batch when step > 0).
+    - key(version, hive_id, watermark, temperatura, umidade, poluicao, ruido_db): Builds the cache key of quantized inputs.
+    - get(key): Returns the cached result, or None (counts hits, misses and expired entries).
+    - put(key, result): Stores a result, evicting the least recently used entry when full.
+    - clear(): Drops every entry (called by the model manager whenever a new model version is installed).
+    - stats(): Size, hit/miss/eviction counters and hit rate.
+- Configuration (environment variables):
+    - PREDICT_CACHE_SIZE: Maximum number of entries (default 10000; 0 disables the cache).
+    - PREDICT_CACHE_TTL: Seconds an entry stays valid (default 300).
+    - PREDICT_CACHE_STEP: Grid step of the inputs (default 0: exact inputs; > 0 snaps every prediction input to the grid).
+- prediction_cache: Global instance used by app.model_manager.
+
+Usage
+-----
+
+Used by ModelManager.predict; the counters are exposed at GET /api/predicao/cache.
+
+Dependencies
+------------
+
+collections, threading, time
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+SNAP_FIELDS = ("temperatura", "umidade", "poluicao", "ruido_db")
+
+class PredictionCache:
+    def __init__(self, max_size: int = 10000, ttl: float = 300.0, step: float = 0.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.step = step
+        self._entries: "OrderedDict[Tuple, Tuple[float, dict]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        # Contadores
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def quantize(self, value: Optional[float]) -> Optional[float]:
+        if value is None or not self.step:
+            return value
+        # round() final elimina resíduos de ponto flutuante (ex.: 0.30000000000000004)
+        return round(round(value / self.step) * self.step, 10)
+
+    def snap(self, item: dict) -> dict:
+        return {**item, **{c: self.quantize(item.get(c)) for c in SNAP_FIELDS}}
+
+    def key(self, version: Optional[str], hive_id: str, watermark: int, temperatura: float, umidade: float,
+            poluicao: float, ruido_db: Optional[float]) -> Tuple:
+        return (version, hive_id, watermark, self.quantize(temperatura), self.quantize(umidade),
+                self.quantize(poluicao), self.quantize(ruido_db))
+
+    def get(self, key: Tuple) -> Optional[dict]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expira_em, result = entry
+            if expira_em < time.monotonic():
+                del self._entries[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return result
+
+    def put(self, key: Tuple, result: dict):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, result)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.invalidations += 1
+
+    def stats(self) -> dict:
+        consultas = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "ttl_s": self.ttl,
+            "step": self.step,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / consultas, 4) if consultas else 0.0,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+# Global instance
+prediction_cache = PredictionCache(
+    max_size=int(os.getenv("PREDICT_CACHE_SIZE", "10000")),
+    ttl=float(os.getenv("PREDICT_CACHE_TTL", "300")),
+    step=float(os.getenv("PREDICT_CACHE_STEP", "0")),
+)
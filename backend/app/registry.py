@@ -0,0 +1,198 @@
+"""
+registry.py
+===========
+
+Versioned model registry for the Abelhas IoT+ML backend.
+Every trained model is stored in its own version directory together with its metadata (metrics, feature list, data watermark),
+and a pointer file selects the active version. Versions are never overwritten: a new model is written to a temporary directory
+and renamed into place, and promotion or rollback only replaces the pointer file, so a crash never leaves a half-written model active.
+
+Layout of MODEL_REGISTRY_DIR:
+    v0001/model.joblib   Uncompressed joblib artifact (can be loaded with mmap_mode="r")
+    v0001/meta.json      Metadata of the version
+    v0001/forest/*.npy   Compiled forest arrays (app.forest), memory-mapped read-only by every process serving the version
+    ACTIVE               Name of the active version
+
+Main Components
+---------------
+
+- REGISTRY_DIR: Registry directory (env MODEL_REGISTRY_DIR, "models" next to the database by default).
+- MAX_VERSIONS: Number of versions kept; older inactive versions are pruned (env MODEL_MAX_VERSIONS, 10 by default).
+- Functions:
+    - save_version(model, meta, arrays): Writes a new version atomically (with the compiled forest arrays, if given) and returns
+      its name. Does not activate it.
+    - list_versions(): Returns the metadata of every version, oldest first, flagging the active one.
+    - active_version(): Returns the name of the active version, or None.
+    - activate(version): Atomically makes a version the active one.
+    - previous_version(version): Returns the version created just before the given one, or None (used for rollback).
+    - load_version(version, mmap): Loads (model, meta) of a version, memory-mapping its arrays by default.
+    - load_arrays(version, mmap): Loads the compiled forest arrays of a version as a dict, or None when it has none.
+    - import_legacy(path): Imports an existing single-file model (model.pkl) as the first version and activates it.
+
+Usage
+-----
+
+Used by app.model_manager; inspect the registry from the backend directory:
+    `python -m app.registry list`
+    `python -m app.registry activate v0003`
+
+Dependencies
+------------
+
+joblib, json, numpy, os, app.db
+"""
+import json
+import os
+import shutil
+import uuid
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+import joblib
+import numpy as np
+from .db import DB_PATH
+
+REGISTRY_DIR = os.path.abspath(os.getenv("MODEL_REGISTRY_DIR", os.path.join(os.path.dirname(DB_PATH), "models")))
+MAX_VERSIONS = int(os.getenv("MODEL_MAX_VERSIONS", "10"))
+
+_ACTIVE_FILE = "ACTIVE"
+_MODEL_FILE = "model.joblib"
+_META_FILE = "meta.json"
+_ARRAYS_DIR = "forest"
+
+
+def _version_names() -> List[str]:
+    if not os.path.isdir(REGISTRY_DIR):
+        return []
+    return sorted(n for n in os.listdir(REGISTRY_DIR)
+                  if n.startswith("v") and n[1:].isdigit() and os.path.isdir(os.path.join(REGISTRY_DIR, n)))
+
+
+def _write_atomic(path: str, text: str):
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _read_meta(version: str) -> dict:
+    with open(os.path.join(REGISTRY_DIR, version, _META_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def active_version() -> Optional[str]:
+    try:
+        with open(os.path.join(REGISTRY_DIR, _ACTIVE_FILE), encoding="utf-8") as f:
+            version = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return version if os.path.isdir(os.path.join(REGISTRY_DIR, version)) else None
+
+
+def save_version(model, meta: dict, arrays: Optional[Dict[str, np.ndarray]] = None) -> str:
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    tmp = os.path.join(REGISTRY_DIR, f".tmp-{uuid.uuid4().hex}")
+    os.makedirs(tmp)
+    try:
+        # Sem compressão: os arrays podem ser mapeados em memória na carga
+        joblib.dump(model, os.path.join(tmp, _MODEL_FILE))
+        if arrays:
+            # Um .npy por array: np.load(mmap_mode="r") compartilha as páginas entre processos
+            os.makedirs(os.path.join(tmp, _ARRAYS_DIR))
+            for nome, arr in arrays.items():
+                np.save(os.path.join(tmp, _ARRAYS_DIR, f"{nome}.npy"), np.ascontiguousarray(arr))
+        while True:
+            nomes = _version_names()
+            version = f"v{int(nomes[-1][1:]) + 1 if nomes else 1:04d}"
+            meta = {**meta, "version": version, "criado_em": meta.get("criado_em") or datetime.now().isoformat()}
+            _write_atomic(os.path.join(tmp, _META_FILE), json.dumps(meta, ensure_ascii=False, indent=2, default=str))
+            try:
+                # rename de diretório é atômico e falha se outra gravação já usou o mesmo número
+                os.rename(tmp, os.path.join(REGISTRY_DIR, version))
+                break
+            except OSError:
+                if not os.path.isdir(os.path.join(REGISTRY_DIR, version)):
+                    raise
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+    _prune()
+    return version
+
+
+def _prune():
+    nomes = _version_names()
+    ativa = active_version()
+    for version in nomes[:max(len(nomes) - MAX_VERSIONS, 0)]:
+        if version != ativa:
+            shutil.rmtree(os.path.join(REGISTRY_DIR, version), ignore_errors=True)
+
+
+def list_versions() -> List[dict]:
+    ativa = active_version()
+    versions = []
+    for version in _version_names():
+        try:
+            meta = _read_meta(version)
+        except (OSError, ValueError):
+            continue
+        versions.append({**meta, "version": version, "ativa": version == ativa})
+    return versions
+
+
+def activate(version: str):
+    if version not in _version_names():
+        raise KeyError(f"Versão de modelo não encontrada: {version}")
+    _write_atomic(os.path.join(REGISTRY_DIR, _ACTIVE_FILE), version)
+
+
+def previous_version(version: str) -> Optional[str]:
+    anteriores = [n for n in _version_names() if n < version]
+    return anteriores[-1] if anteriores else None
+
+
+def load_version(version: Optional[str] = None, mmap: bool = True) -> Tuple[object, dict]:
+    version = version or active_version()
+    if version is None:
+        raise KeyError("Nenhuma versão de modelo ativa")
+    if version not in _version_names():
+        raise KeyError(f"Versão de modelo não encontrada: {version}")
+    model = joblib.load(os.path.join(REGISTRY_DIR, version, _MODEL_FILE), mmap_mode="r" if mmap else None)
+    return model, {**_read_meta(version), "version": version}
+
+
+def load_arrays(version: str, mmap: bool = True) -> Optional[Dict[str, np.ndarray]]:
+    pasta = os.path.join(REGISTRY_DIR, version, _ARRAYS_DIR)
+    if not os.path.isdir(pasta):
+        return None
+    return {nome[:-4]: np.load(os.path.join(pasta, nome), mmap_mode="r" if mmap else None)
+            for nome in os.listdir(pasta) if nome.endswith(".npy")}
+
+
+def import_legacy(path: str) -> Optional[str]:
+    if not os.path.exists(path):
+        return None
+    model = joblib.load(path)
+    version = save_version(model, {"modo": "full", "origem": os.path.abspath(path), "metrics": None,
+                                   "watermark": 0, "registros": 0, "atualizacoes": 0})
+    activate(version)
+    return version
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Registro de versões do modelo")
+    parser.add_argument("comando", choices=["list", "activate"])
+    parser.add_argument("version", nargs="?")
+    args = parser.parse_args()
+
+    if args.comando == "list":
+        for v in list_versions():
+            acc = (v.get("metrics") or {}).get("accuracy")
+            print(f"{'*' if v['ativa'] else ' '} {v['version']}  {v.get('criado_em', '')}  {v.get('modo', '')}"
+                  f"  watermark={v.get('watermark')}  accuracy={acc}")
+    else:
+        activate(args.version)
+        print(f"Versão ativa: {args.version}")
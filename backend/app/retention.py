@@ -0,0 +1,346 @@
+"""
+retention.py
+============
+
+Tiered retention for bee sensor data in the Abelhas IoT+ML backend.
+Records older than a configurable age are moved out of abelhas_data into day-partitioned, compressed Parquet files
+(cold storage) and then deleted from SQLite, keeping the hot table small. Readers combine both tiers transparently.
+
+Main Components
+---------------
+
+- Configuration (environment variables):
+    - ARCHIVE_DIR: Root of the Parquet archive (default: backend/archive, next to data.db).
+    - RETENTION_DAYS: Age in days after which records are archived by the periodic job (default 0 = job disabled).
+    - RETENTION_INTERVAL: Seconds between runs of the periodic job (default 3600).
+- ARCHIVE_SCHEMA: Arrow schema of the archived records (one file per chunk under dia=YYYY-MM-DD/).
+- Functions:
+    - archive_older_than(db, days, cutoff, chunk_size): Moves records older than the cutoff to Parquet and deletes them from SQLite,
+      together with their model feature rows (app.features.prune_features), bumping the data watermark when anything was archived.
+    - archive_dataset(): Returns the pyarrow dataset of the archive, or None when it is empty.
+    - archive_filter(inicio, fim, hive_id): Dataset filter for a period and hive (prunes day partitions before reading files).
+    - read_archive(inicio, fim, columns, limit, hive_id): Reads archived records of a period as a DataFrame, oldest first.
+      Scans the day partitions in order and stops as soon as `limit` records were read.
+    - read_history(db, inicio, fim, limit, columns, hive_id): Reads hot (SQLite) and cold (Parquet) records together, oldest first.
+    - iter_archive_rows(columns, batch_size, exclude_ids, ordered): Iterates archived records as dicts in batches (used by the
+      rebuild commands), skipping exclude_ids. With ordered=True, reads one day partition at a time and yields its records
+      sorted by (timestamp, id) without duplicates.
+    - hot_archived_ids(db): Ids present in both tiers (an archiving run interrupted between the Parquet write and the delete).
+    - archive_counts(exclude_ids): total, altas and per-status counts of the archived records per hive (used by the /stats
+      rebuild), skipping exclude_ids.
+    - retention_loop(): Background task that runs archive_older_than every RETENTION_INTERVAL seconds.
+
+Usage
+-----
+
+Archive records older than 30 days from the backend directory:
+    `python -m app.retention --days 30`
+
+Dependencies
+------------
+
+pyarrow, pandas, SQLAlchemy, asyncio, app.db, app.models, app.watermark
+"""
+import asyncio
+import os
+import uuid
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Set
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import delete, func, select
+from sqlalchemy.orm import Session
+from .db import DB_PATH, SessionLocal
+from .models import BeeRecord, DEFAULT_HIVE
+from .watermark import data_watermark
+
+ARCHIVE_DIR = os.path.abspath(os.getenv("ARCHIVE_DIR", os.path.join(os.path.dirname(DB_PATH), "archive")))
+RETENTION_DAYS = float(os.getenv("RETENTION_DAYS", "0"))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", "3600"))
+
+ARCHIVE_SCHEMA = pa.schema([
+    ("id", pa.int64()),
+    ("hive_id", pa.string()),
+    ("timestamp", pa.timestamp("us")),
+    ("temperatura", pa.float64()),
+    ("umidade", pa.float64()),
+    ("poluicao", pa.float64()),
+    ("abelhas_ativas", pa.int64()),
+    ("atividade_alta", pa.int64()),
+    ("atividade", pa.string()),
+    ("ruido_db", pa.float64()),
+    ("status_ruido", pa.string()),
+])
+ARCHIVE_COLUMNS = ARCHIVE_SCHEMA.names
+
+_DELETE_BATCH = 500  # abaixo do limite de variáveis por comando do SQLite
+
+
+def _write_partition(dia: str, rows: List[tuple]):
+    part_dir = os.path.join(ARCHIVE_DIR, f"dia={dia}")
+    os.makedirs(part_dir, exist_ok=True)
+    cols = list(zip(*rows))
+    table = pa.table([pa.array(c, type=f.type) for c, f in zip(cols, ARCHIVE_SCHEMA)], schema=ARCHIVE_SCHEMA)
+    final = os.path.join(part_dir, f"part-{uuid.uuid4().hex}.parquet")
+    tmp = final + ".tmp"
+    pq.write_table(table, tmp, compression="zstd")
+    os.replace(tmp, final)  # o arquivo só aparece para os leitores quando está completo
+
+
+def archive_older_than(db: Session, days: Optional[float] = None, cutoff: Optional[datetime] = None,
+                       chunk_size: int = 50000) -> dict:
+    if cutoff is None:
+        if days is None:
+            raise ValueError("Informe days ou cutoff")
+        cutoff = datetime.now() - timedelta(days=days)
+    cols = [getattr(BeeRecord, c) for c in ARCHIVE_COLUMNS]
+    # O registro de maior id nunca é arquivado: sem AUTOINCREMENT o SQLite reusaria ids de uma tabela
+    # esvaziada, colidindo com ids que já estão no Parquet
+    max_id = db.execute(select(func.max(BeeRecord.id))).scalar()
+    if max_id is None:
+        return {"archived": 0, "files": 0, "cutoff": cutoff}
+    archived = 0
+    files = 0
+    while True:
+        rows = db.execute(
+            select(*cols).where(BeeRecord.timestamp < cutoff, BeeRecord.id < max_id)
+            .order_by(BeeRecord.timestamp.asc(), BeeRecord.id.asc()).limit(chunk_size)
+        ).all()
+        if not rows:
+            break
+        por_dia: Dict[str, List[tuple]] = defaultdict(list)
+        for r in rows:
+            por_dia[r.timestamp.strftime("%Y-%m-%d")].append(tuple(r))
+        # Primeiro grava o Parquet, depois apaga do SQLite: em caso de falha o registro fica duplicado (e é
+        # descartado na leitura por id), nunca perdido
+        for dia, dia_rows in por_dia.items():
+            _write_partition(dia, dia_rows)
+            files += 1
+        ids = [r.id for r in rows]
+        for i in range(0, len(ids), _DELETE_BATCH):
+            db.execute(delete(BeeRecord).where(BeeRecord.id.in_(ids[i:i + _DELETE_BATCH])))
+        # As features dos registros arquivados saem na mesma transação (import local: app.features importa este módulo)
+        from .features import prune_features
+        prune_features(db, ids, batch_size=_DELETE_BATCH)
+        db.commit()
+        archived += len(rows)
+    if archived:
+        data_watermark.bump()
+    return {"archived": archived, "files": files, "cutoff": cutoff}
+
+
+def archive_dataset() -> Optional[ds.Dataset]:
+    if not os.path.isdir(ARCHIVE_DIR):
+        return None
+    dataset = ds.dataset(ARCHIVE_DIR, format="parquet", schema=ARCHIVE_SCHEMA.append(pa.field("dia", pa.string())),
+                         partitioning="hive", exclude_invalid_files=True)
+    return dataset if dataset.files else None
+
+
+def archive_filter(inicio: Optional[datetime], fim: Optional[datetime], hive_id: Optional[str] = None):
+    # O filtro na partição (dia) descarta diretórios inteiros antes de abrir os arquivos
+    expr = None
+    if inicio is not None:
+        expr = (ds.field("dia") >= inicio.strftime("%Y-%m-%d")) & \
+            (ds.field("timestamp") >= pa.scalar(inicio, type=pa.timestamp("us")))
+    if fim is not None:
+        cond = (ds.field("dia") <= fim.strftime("%Y-%m-%d")) & \
+            (ds.field("timestamp") < pa.scalar(fim, type=pa.timestamp("us")))
+        expr = cond if expr is None else expr & cond
+    if hive_id is not None:
+        cond = ds.field("hive_id") == hive_id
+        if hive_id == DEFAULT_HIVE:
+            # Arquivos gravados antes da coluna hive_id existir pertencem à colmeia padrão
+            cond = cond | ds.field("hive_id").is_null()
+        expr = cond if expr is None else expr & cond
+    return expr
+
+
+def _fill_hive(df: pd.DataFrame) -> pd.DataFrame:
+    if "hive_id" in df.columns:
+        df["hive_id"] = df["hive_id"].fillna(DEFAULT_HIVE)
+    return df
+
+
+def _archive_days(dataset: ds.Dataset, inicio: Optional[datetime] = None, fim: Optional[datetime] = None) -> List[str]:
+    # Partições dia=YYYY-MM-DD em ordem crescente, já recortadas pelo período
+    dias = sorted({os.path.basename(os.path.dirname(f)).split("=", 1)[1] for f in dataset.files})
+    if inicio is not None:
+        dias = [d for d in dias if d >= inicio.strftime("%Y-%m-%d")]
+    if fim is not None:
+        dias = [d for d in dias if d <= fim.strftime("%Y-%m-%d")]
+    return dias
+
+
+def _iter_day_tables(dataset: ds.Dataset, columns: List[str], filtro=None, inicio: Optional[datetime] = None,
+                     fim: Optional[datetime] = None) -> Iterator[pa.Table]:
+    # Um dia por vez (os arquivos de um dia não estão em ordem entre si), ordenado por (timestamp, id)
+    for dia in _archive_days(dataset, inicio, fim):
+        cond = ds.field("dia") == dia
+        table = dataset.to_table(columns=sorted(set(columns) | {"id", "timestamp"}),
+                                 filter=cond if filtro is None else cond & filtro)
+        yield table.sort_by([("timestamp", "ascending"), ("id", "ascending")])
+
+
+def read_archive(inicio: Optional[datetime] = None, fim: Optional[datetime] = None,
+                 columns: Optional[List[str]] = None, limit: Optional[int] = None,
+                 hive_id: Optional[str] = None) -> pd.DataFrame:
+    columns = columns or ARCHIVE_COLUMNS
+    dataset = archive_dataset()
+    if dataset is None:
+        return pd.DataFrame(columns=columns)
+    # Lê os dias em ordem e para assim que o limite é atingido, sem carregar o período inteiro
+    frames = []
+    total = 0
+    for table in _iter_day_tables(dataset, columns, archive_filter(inicio, fim, hive_id), inicio, fim):
+        df = table.to_pandas().drop_duplicates("id")
+        frames.append(df)
+        total += len(df)
+        if limit and total >= limit:
+            break
+    if not frames:
+        return pd.DataFrame(columns=columns)
+    df = pd.concat(frames, ignore_index=True)
+    if limit:
+        df = df.head(limit)
+    return _fill_hive(df[columns].reset_index(drop=True))
+
+
+def read_history(db: Session, inicio: Optional[datetime] = None, fim: Optional[datetime] = None,
+                 limit: Optional[int] = None, columns: Optional[List[str]] = None,
+                 hive_id: Optional[str] = None) -> pd.DataFrame:
+    columns = columns or ARCHIVE_COLUMNS
+    cold = read_archive(inicio, fim, columns, limit, hive_id)
+    if limit and len(cold) >= limit:
+        return cold
+
+    q = select(*[getattr(BeeRecord, c) for c in columns]).order_by(BeeRecord.timestamp.asc(), BeeRecord.id.asc())
+    if inicio is not None:
+        q = q.where(BeeRecord.timestamp >= inicio)
+    if fim is not None:
+        q = q.where(BeeRecord.timestamp < fim)
+    if hive_id is not None:
+        q = q.where(BeeRecord.hive_id == hive_id)
+    if limit:
+        q = q.limit(limit - len(cold))
+    hot = pd.DataFrame(db.execute(q).all(), columns=columns)
+    if cold.empty:
+        return hot
+    df = pd.concat([cold, hot], ignore_index=True)
+    if "id" in columns:
+        df = df.drop_duplicates("id", keep="last")
+    return df.reset_index(drop=True)
+
+
+def _exclude_filter(exclude_ids: Optional[Set[int]]):
+    return ~ds.field("id").isin(sorted(exclude_ids)) if exclude_ids else None
+
+
+def _fill_hive_rows(rows: List[dict]) -> List[dict]:
+    for row in rows:
+        if row.get("hive_id", DEFAULT_HIVE) is None:
+            row["hive_id"] = DEFAULT_HIVE
+    return rows
+
+
+def iter_archive_rows(columns: Optional[List[str]] = None, batch_size: int = 50000,
+                      exclude_ids: Optional[Set[int]] = None, ordered: bool = False) -> Iterator[List[dict]]:
+    dataset = archive_dataset()
+    if dataset is None:
+        return
+    columns = columns or ARCHIVE_COLUMNS
+    filtro = _exclude_filter(exclude_ids)
+    if not ordered:
+        for batch in dataset.to_batches(columns=columns, batch_size=batch_size, filter=filtro):
+            yield _fill_hive_rows(batch.to_pylist())
+        return
+    # Em ordem: no máximo um dia em memória
+    for table in _iter_day_tables(dataset, columns, filtro):
+        vistos = set()
+        rows = []
+        for row in table.to_pylist():
+            if row["id"] in vistos:
+                continue  # arquivamento interrompido e repetido: o mesmo registro em dois arquivos
+            vistos.add(row["id"])
+            rows.append({c: row[c] for c in columns})
+            if len(rows) >= batch_size:
+                yield _fill_hive_rows(rows)
+                rows = []
+        if rows:
+            yield _fill_hive_rows(rows)
+
+
+def hot_archived_ids(db: Session) -> Set[int]:
+    dataset = archive_dataset()
+    if dataset is None:
+        return set()
+    # Arquivamento interrompido entre a gravação do Parquet e o DELETE: os mesmos ids nos dois níveis.
+    # Só os ids do SQLite dentro da faixa arquivada são comparados (normalmente poucos)
+    archived = dataset.to_table(columns=["id"]).column("id")
+    faixa = pc.min_max(archived).as_py()
+    if faixa["min"] is None:
+        return set()
+    hot = db.execute(select(BeeRecord.id).where(BeeRecord.id.between(faixa["min"], faixa["max"]))).scalars().all()
+    if not hot:
+        return set()
+    hot = pa.array(hot, type=pa.int64())
+    return set(hot.filter(pc.is_in(hot, value_set=archived)).to_pylist())
+
+
+def archive_counts(exclude_ids: Optional[Set[int]] = None) -> Dict[str, dict]:
+    dataset = archive_dataset()
+    if dataset is None:
+        return {}
+    # Remove duplicatas de um arquivamento interrompido antes de contar
+    df = dataset.to_table(columns=["id", "hive_id", "atividade_alta", "status_ruido"],
+                          filter=_exclude_filter(exclude_ids)).to_pandas().drop_duplicates("id")
+    df["hive_id"] = df["hive_id"].fillna(DEFAULT_HIVE)
+    counts = {}
+    for hive, grupo in df.groupby("hive_id"):
+        por_status = grupo["status_ruido"].value_counts(dropna=False)
+        counts[hive] = {
+            "total": len(grupo),
+            "altas": int(grupo["atividade_alta"].sum()),
+            "por_status": {(None if pd.isna(k) else k): int(v) for k, v in por_status.items()},
+        }
+    return counts
+
+
+async def retention_loop():
+    while True:
+        await asyncio.sleep(RETENTION_INTERVAL)
+        try:
+            result = await asyncio.to_thread(_run_once)
+            if result["archived"]:
+                print("Retenção: registros arquivados:", result)
+        except Exception as e:
+            print("Falha na retenção:", e)
+
+
+def _run_once() -> dict:
+    db = SessionLocal()
+    try:
+        return archive_older_than(db, days=RETENTION_DAYS)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+    from .db import engine
+    from .models import init_db
+
+    parser = argparse.ArgumentParser(description="Move registros antigos de abelhas_data para Parquet")
+    parser.add_argument("--days", type=float, default=RETENTION_DAYS or 30)
+    args = parser.parse_args()
+
+    init_db(engine)
+    db = SessionLocal()
+    try:
+        print(archive_older_than(db, days=args.days))
+    finally:
+        db.close()
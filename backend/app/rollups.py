@@ -0,0 +1,167 @@
+"""
+rollups.py
+==========
+
+Time-bucketed rollups of bee sensor data for the Abelhas IoT+ML backend.
+Every ingested batch is pre-aggregated per hive and per minute, hour and day and merged into abelhas_rollup,
+so charts over long periods read a few hundred buckets instead of the raw records.
+
+Main Components
+---------------
+
+- BUCKETS: Supported granularities ("minute", "hour", "day").
+- Functions:
+    - bucket_start(ts, bucket): Truncates a timestamp to the start of its bucket.
+    - aggregate(rows): Pre-aggregates a batch of derived rows per (hive_id, bucket, inicio).
+    - apply_rollups(db, rows): Merges a batch into abelhas_rollup with one upsert; does not commit (runs inside the ingest transaction).
+    - read_series(db, bucket, inicio, fim, hive_id): Returns the buckets of a period with count and min/max/mean of each metric,
+      for one hive or combined across all hives.
+    - rebuild_rollups(db, chunk_size): Recomputes every rollup from abelhas_data and the Parquet archive, reading in chunks.
+    - ensure_rollups(db): Rebuilds the rollups when the table is empty but abelhas_data is not (first run).
+
+Usage
+-----
+
+Rebuild the rollups from the backend directory:
+    `python -m app.rollups rebuild`
+
+Dependencies
+------------
+
+SQLAlchemy, datetime, app.models, app.retention
+"""
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import delete, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from .models import BeeRecord, RollupRecord, ROLLUP_METRICAS
+from .retention import hot_archived_ids, iter_archive_rows
+
+BUCKETS = ("minute", "hour", "day")
+
+
+def bucket_start(ts: datetime, bucket: str) -> datetime:
+    if bucket == "minute":
+        return ts.replace(second=0, microsecond=0)
+    if bucket == "hour":
+        return ts.replace(minute=0, second=0, microsecond=0)
+    if bucket == "day":
+        return ts.replace(hour=0, minute=0, second=0, microsecond=0)
+    raise ValueError(f"Bucket inválido: {bucket}")
+
+
+def aggregate(rows: Iterable[dict]) -> List[dict]:
+    acc: Dict[Tuple[str, str, datetime], dict] = {}
+    for row in rows:
+        for bucket in BUCKETS:
+            key = (row["hive_id"], bucket, bucket_start(row["timestamp"], bucket))
+            agg = acc.get(key)
+            if agg is None:
+                agg = {"hive_id": key[0], "bucket": bucket, "inicio": key[2], "count": 0}
+                for m in ROLLUP_METRICAS:
+                    agg[f"{m}_min"] = None
+                    agg[f"{m}_max"] = None
+                    agg[f"{m}_soma"] = 0.0
+                    agg[f"{m}_n"] = 0
+                acc[key] = agg
+            agg["count"] += 1
+            for m in ROLLUP_METRICAS:
+                v = row[m]
+                if v is None:
+                    continue
+                agg[f"{m}_soma"] += v
+                agg[f"{m}_n"] += 1
+                if agg[f"{m}_min"] is None or v < agg[f"{m}_min"]:
+                    agg[f"{m}_min"] = v
+                if agg[f"{m}_max"] is None or v > agg[f"{m}_max"]:
+                    agg[f"{m}_max"] = v
+    return list(acc.values())
+
+
+def _upsert_stmt():
+    t = RollupRecord.__table__
+    stmt = sqlite_insert(t)
+    ex = stmt.excluded
+    set_ = {"count": t.c.count + ex.count}
+    for m in ROLLUP_METRICAS:
+        mn, mx = t.c[f"{m}_min"], t.c[f"{m}_max"]
+        # min()/max() escalares do SQLite retornam NULL se algum argumento for NULL
+        set_[f"{m}_min"] = func.min(func.coalesce(mn, ex[f"{m}_min"]), func.coalesce(ex[f"{m}_min"], mn))
+        set_[f"{m}_max"] = func.max(func.coalesce(mx, ex[f"{m}_max"]), func.coalesce(ex[f"{m}_max"], mx))
+        set_[f"{m}_soma"] = t.c[f"{m}_soma"] + ex[f"{m}_soma"]
+        set_[f"{m}_n"] = t.c[f"{m}_n"] + ex[f"{m}_n"]
+    return stmt.on_conflict_do_update(index_elements=["hive_id", "bucket", "inicio"], set_=set_)
+
+
+def apply_rollups(db: Session, rows: Iterable[dict]):
+    aggs = aggregate(rows)
+    if aggs:
+        db.execute(_upsert_stmt(), aggs)
+
+
+def read_series(db: Session, bucket: str, inicio: Optional[datetime] = None,
+                fim: Optional[datetime] = None, hive_id: Optional[str] = None) -> List[dict]:
+    if bucket not in BUCKETS:
+        raise ValueError(f"Bucket inválido: {bucket}")
+    t = RollupRecord.__table__
+    # Sem colmeia, os intervalos de todas as colmeias são combinados; com colmeia, cada grupo tem uma linha
+    cols = [t.c.inicio, func.sum(t.c.count).label("count")]
+    for m in ROLLUP_METRICAS:
+        cols += [func.min(t.c[f"{m}_min"]).label(f"{m}_min"), func.max(t.c[f"{m}_max"]).label(f"{m}_max"),
+                 func.sum(t.c[f"{m}_soma"]).label(f"{m}_soma"), func.sum(t.c[f"{m}_n"]).label(f"{m}_n")]
+    q = select(*cols).where(t.c.bucket == bucket)
+    if hive_id is not None:
+        q = q.where(t.c.hive_id == hive_id)
+    if inicio is not None:
+        q = q.where(t.c.inicio >= bucket_start(inicio, bucket))
+    if fim is not None:
+        q = q.where(t.c.inicio < fim)
+    serie = []
+    for r in db.execute(q.group_by(t.c.inicio).order_by(t.c.inicio.asc())).mappings():
+        ponto = {"inicio": r["inicio"], "count": r["count"]}
+        for m in ROLLUP_METRICAS:
+            n = r[f"{m}_n"]
+            ponto[f"{m}_min"] = r[f"{m}_min"]
+            ponto[f"{m}_max"] = r[f"{m}_max"]
+            ponto[f"{m}_media"] = r[f"{m}_soma"] / n if n else None
+        serie.append(ponto)
+    return serie
+
+
+def rebuild_rollups(db: Session, chunk_size: int = 10000):
+    # O DELETE abre a transação de escrita: ingestões concorrentes esperam o fim da reconstrução
+    db.execute(delete(RollupRecord))
+    cols = [BeeRecord.hive_id, BeeRecord.timestamp] + [getattr(BeeRecord, m) for m in ROLLUP_METRICAS]
+    result = db.execute(select(*cols).execution_options(yield_per=chunk_size))
+    for chunk in result.partitions():
+        apply_rollups(db, (r._asdict() for r in chunk))
+    # Registros já arquivados em Parquet continuam nos rollups (sem os que ainda estão no SQLite, já agregados acima)
+    for batch in iter_archive_rows(["hive_id", "timestamp"] + ROLLUP_METRICAS, batch_size=chunk_size,
+                                   exclude_ids=hot_archived_ids(db)):
+        apply_rollups(db, batch)
+    db.commit()
+
+
+def ensure_rollups(db: Session):
+    if db.execute(select(RollupRecord.bucket).limit(1)).first() is None \
+            and db.execute(select(BeeRecord.id).limit(1)).first() is not None:
+        rebuild_rollups(db)
+
+
+if __name__ == "__main__":
+    import argparse
+    from .db import SessionLocal, engine
+    from .models import init_db
+
+    parser = argparse.ArgumentParser(description="Manutenção das tabelas de rollup (minute/hour/day)")
+    parser.add_argument("comando", choices=["rebuild"])
+    parser.parse_args()
+
+    init_db(engine)
+    db = SessionLocal()
+    try:
+        rebuild_rollups(db)
+        print("Rollups reconstruídos.")
+    finally:
+        db.close()
@@ -3,6 +3,7 @@ data.py
 =======
 
 Defines FastAPI routes for handling bee sensor data, model predictions, training, statistics, and noise simulation.
+Every read endpoint accepts an optional hive_id query parameter that restricts it to one hive.
 Interacts with the database and the model manager to provide API endpoints for the frontend.
 
 Main Components
@@ -11,10 +12,33 @@ Main Components
 - API Router: Prefix /api/data, tag 'data'.
 - Endpoints:
     - POST /predicao: Predicts bee activity using the trained model and input features.
-    - POST /train: Trains the machine learning model with current database data.
-    - GET /dados: Returns a list of bee sensor records from the database.
-    - GET /stats: Returns statistics about bee activity (total, high, low).
-    - POST /ingest: Simulates and ingests a new bee sensor record into the database.
+    - POST /train: Starts a background training job in a separate process (202 with the job id and status); answers 409 while
+      another job is queued or running. The serving model is swapped atomically when the job finishes.
+      mode=full|incremental|auto chooses a full refit, an incremental update with the records since the last fit, or the retrain policy.
+    - GET /train/{job_id}: Returns the status, stage, progress and metrics of a training job.
+    - GET /dados: Returns a list of bee sensor records from the database, newest first (BeeRecordRead fields).
+      The JSON page is selected as plain row tuples and encoded straight to bytes (app.serialization).
+      Sends ETag/Last-Modified validators from the in-memory data watermark and answers If-None-Match/If-Modified-Since
+      with 304 before querying when no record was ingested or removed since.
+      Supports from/to timestamp filters and keyset pagination with an opaque (timestamp, id) cursor
+      (the next cursor is returned in the X-Next-Cursor header). format=ndjson|csv streams the rows from a server-side cursor.
+      limit is bounded by MAX_PAGE_SIZE (default 1000); deeper history is read page by page with the cursor.
+    - GET /historico: Returns the records of a from/to period oldest first, reading hot SQLite data and the cold Parquet archive together.
+      Runs in the threadpool (blocking Parquet and SQLite reads); limit is bounded by MAX_HISTORY_SIZE (default 100000).
+    - GET /export: Streams a from/to period as Arrow IPC stream batches (format=arrow) or Parquet (format=parquet), read in chunks.
+    - POST /retention/run: Archives records older than `days` days to day-partitioned Parquet and deletes them from SQLite.
+    - GET /stats: Returns statistics about bee activity (total, high, low, per noise status) from the incrementally maintained counters.
+      Conditional GET like /dados (304 without reading the counters when nothing changed).
+    - GET /series: Returns minute/hour/day buckets (count, min/max/mean per metric) for a from/to period, served from the rollup table.
+    - POST /stats/rebuild: Recomputes the counters from abelhas_data.
+    - POST /ingest: Validates and ingests a single bee sensor record. Returns a compact ack.
+    - POST /ingest/batch: Validates and ingests a list of bee sensor records in one transaction. Returns a compact ack.
+      With the write-behind buffer running both routes only enqueue (202), or answer 429 when the buffer is full.
+    - GET /ingest/stats: Returns queue depth and flush counters of the write-behind buffer.
+    - GET /stream: Server-Sent Events stream of newly ingested records ("record" events) and anomaly alarms ("alarm" events),
+      pushed by the in-process broadcaster. Event ids are record ids; a reconnecting client resumes after Last-Event-ID (or last_id).
+    - GET /stream/stats: Subscribers and delivery counters of the broadcaster.
+    - GET /alarms: Lists the alarms raised by the streaming anomaly detectors on ingest, newest first (since_id and limit filters).
     - GET /noise: Simulates and returns the current noise level in the hive.
 - Models:
     - PredInput: Pydantic model for prediction input (temperature, humidity, pollution).
@@ -27,17 +51,33 @@ Import and include this router in your FastAPI app to expose bee data endpoints.
 Dependencies
 ------------
 
-FastAPI, SQLAlchemy, random, datetime, pydantic, app.db, app.models, app.model_manager
+FastAPI, SQLAlchemy, base64, random, datetime, pydantic, app.db, app.models, app.schemas, app.ingest, app.ingest_buffer, app.stats, app.rollups, app.retention, app.export, app.alarms, app.broadcaster, app.watermark, app.serialization, app.model_manager
 """
-from fastapi import APIRouter, Depends
+import os
+import base64
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from sqlalchemy import String, and_, or_, select, type_coerce
 from sqlalchemy.orm import Session
 from fastapi.encoders import jsonable_encoder
-from ..db import get_db
-from ..models import BeeRecord
-from ..model_manager import model_manager
+from ..db import get_read_db, get_write_db
+from ..models import AlarmRecord, BeeRecord, DEFAULT_HIVE
+from ..schemas import AlarmRead, BeeRecordCreate, BeeRecordRead, IngestAck, StatsResponse, TrainJobStatus
+from ..ingest import insert_records
+from ..ingest_buffer import ingest_buffer
+from ..stats import read_stats, rebuild_stats
+from ..rollups import BUCKETS, read_series
+from ..retention import ARCHIVE_COLUMNS, archive_older_than, read_history
+from ..export import EXPORT_FORMATS, TEXT_FORMATS, stream_export, stream_rows
+from ..alarms import classify_noise
+from ..broadcaster import broadcaster
+from ..watermark import data_watermark
+from ..serialization import RECORD_COLUMNS, iso_timestamp, rows_to_json
+from ..model_manager import ModelNotReady, model_manager
 from datetime import datetime
 import random
-from typing import List
+from typing import List, Optional
 from pydantic import BaseModel
 
 # router = APIRouter()
@@ -45,74 +85,226 @@ from pydantic import BaseModel
 
 router = APIRouter(prefix="/api/data", tags=["data"])
 
+MAX_INGEST_BATCH = int(os.getenv("MAX_INGEST_BATCH", "10000"))
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+MAX_HISTORY_SIZE = int(os.getenv("MAX_HISTORY_SIZE", "100000"))
+
 class PredInput(BaseModel):
     temperatura: float
     umidade: float
     poluicao: float
+    ruido_db: Optional[float] = 50
+    hive_id: str = DEFAULT_HIVE
 
 @router.post("/predicao")
-async def predicao(data: PredInput, db: Session = Depends(get_db)):
-    resultado = model_manager.predict(
-        db,
-        temperatura=data.temperatura,
-        umidade=data.umidade,
-        poluicao=data.poluicao
-    )
+async def predicao(data: PredInput, db: Session = Depends(get_read_db)):
+    try:
+        resultado = model_manager.predict(
+            db,
+            temperatura=data.temperatura,
+            umidade=data.umidade,
+            poluicao=data.poluicao,
+            ruido_db=data.ruido_db,
+            hive_id=data.hive_id
+        )
+    except ModelNotReady as e:
+        # Treino de partida a frio em segundo plano
+        raise HTTPException(status_code=503, detail={"message": str(e), "job_id": e.job["job_id"]},
+                            headers={"Retry-After": "5"})
     return resultado
 
-@router.post("/train")
-async def treinar_modelo(db: Session = Depends(get_db)):
+@router.post("/train", response_model=TrainJobStatus, status_code=202)
+async def treinar_modelo(limit: Optional[int] = Query(None, ge=20), hive_id: Optional[str] = None,
+                         mode: str = Query("full", pattern="^(full|incremental|auto)$")):
+    """Inicia o treino em um processo separado e retorna o job; o modelo em uso só é trocado ao final.
+    mode=incremental acrescenta árvores treinadas só com os registros novos; auto segue a política de retreino."""
+    job, criado = model_manager.start_training(limit, hive_id, mode)
+    if not criado:
+        raise HTTPException(status_code=409, detail={"message": "Já existe um treino em andamento",
+                                                     "job_id": job["job_id"]})
+    return job
+
+@router.get("/train/{job_id}", response_model=TrainJobStatus)
+async def status_treino(job_id: str):
+    job = model_manager.job_status(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job de treino não encontrado")
+    return job
+
+def _encode_cursor(timestamp: str, record_id: int) -> str:
+    raw = f"{timestamp}|{record_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+def _decode_cursor(cursor: str):
     try:
-        metrics = model_manager.train(db)
-        return {"ok": True, "metrics": metrics}
-    except ValueError as e:
-        return {"ok": False, "error": str(e)}
-
-@router.get("/dados")
-async def get_dados(limit: int = 100, db: Session = Depends(get_db)):
-    dados = db.query(BeeRecord).order_by(BeeRecord.timestamp.desc()).limit(limit).all()
-    return jsonable_encoder(dados)
-
-@router.get("/stats")
-async def get_stats(db: Session = Depends(get_db)):
-    total = db.query(BeeRecord).count()
-    altas = db.query(BeeRecord).filter(BeeRecord.atividade_alta == 1).count()
-    baixas = total - altas
-    return {"total": total, "altas": altas, "baixas": baixas}
-
-@router.post("/ingest")
-async def ingest_data(db: Session = Depends(get_db)):
-    temperatura = round(random.uniform(15, 40), 2)
-    umidade = round(random.uniform(30, 90), 2)
-    poluicao = round(random.uniform(10, 80), 2)
-    abelhas_ativas = random.randint(100, 1000)
-
-    atividade = "alta" if abelhas_ativas > 500 else "baixa"
-    atividade_alta = 1 if abelhas_ativas > 500 else 0
-
-    ruido_db = round(random.uniform(20, 120), 2)
-    status_ruido = "normal"
-    if ruido_db > 80:
-        status_ruido = "alerta: possível agitação!"
-    elif ruido_db > 60:
-        status_ruido = "moderado: atenção"
-
-    novo_dado = BeeRecord(
-        temperatura=temperatura,
-        umidade=umidade,
-        poluicao=poluicao,
-        abelhas_ativas=abelhas_ativas,
-        atividade=atividade,
-        atividade_alta=atividade_alta,
-        ruido_db=ruido_db,
-        status_ruido=status_ruido,
+        ts, record_id = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit("|", 1)
+        return datetime.fromisoformat(ts), int(record_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def _dados_conditions(inicio: Optional[datetime], fim: Optional[datetime], cursor: Optional[str],
+                      hive_id: Optional[str]) -> list:
+    conds = []
+    if hive_id is not None:
+        conds.append(BeeRecord.hive_id == hive_id)
+    if inicio is not None:
+        conds.append(BeeRecord.timestamp >= inicio)
+    if fim is not None:
+        conds.append(BeeRecord.timestamp < fim)
+    if cursor:
+        # Paginação por chave (timestamp, id): cada página é uma busca no índice composto, sem OFFSET
+        ts, record_id = _decode_cursor(cursor)
+        conds.append(or_(BeeRecord.timestamp < ts,
+                         and_(BeeRecord.timestamp == ts, BeeRecord.id < record_id)))
+    return conds
+
+@router.get("/dados", response_model=List[BeeRecordRead])
+async def get_dados(
+    request: Request,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    inicio: Optional[datetime] = Query(None, alias="from"),
+    fim: Optional[datetime] = Query(None, alias="to"),
+    cursor: Optional[str] = None,
+    format: str = "json",
+    hive_id: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Registros do mais novo para o mais antigo, opcionalmente no intervalo [from, to).
+    Quando há mais páginas, o cabeçalho X-Next-Cursor traz o cursor da próxima.
+    Com format=ndjson ou format=csv a resposta é transmitida à medida que as linhas são lidas.
+    """
+    # Validadores da marca d'água em memória: sem registro novo, 304 antes de qualquer consulta
+    validators = data_watermark.headers(db)
+    if data_watermark.not_modified(request, validators):
+        return Response(status_code=304, headers=validators)
+    conds = _dados_conditions(inicio, fim, cursor, hive_id)
+    if format in TEXT_FORMATS:
+        q = select(*[getattr(BeeRecord, c) for c in ARCHIVE_COLUMNS]).where(*conds) \
+            .order_by(BeeRecord.timestamp.desc(), BeeRecord.id.desc()).limit(limit)
+        return StreamingResponse(stream_rows(format, q), media_type=TEXT_FORMATS[format], headers=validators)
+    if format != "json":
+        raise HTTPException(status_code=400, detail="format deve ser json, ndjson ou csv")
+
+    # Tuplas simples (timestamp como texto) serializadas direto para bytes, sem instâncias ORM nem jsonable_encoder
+    cols = [type_coerce(BeeRecord.timestamp, String) if c == "timestamp" else getattr(BeeRecord, c)
+            for c in RECORD_COLUMNS]
+    rows = db.execute(select(*cols).where(*conds)
+                      .order_by(BeeRecord.timestamp.desc(), BeeRecord.id.desc()).limit(limit)).all()
+    headers = dict(validators)
+    if rows and len(rows) == limit:
+        headers["X-Next-Cursor"] = _encode_cursor(iso_timestamp(rows[-1].timestamp), rows[-1].id)
+    return Response(rows_to_json(RECORD_COLUMNS, rows), media_type="application/json", headers=headers)
+
+@router.get("/historico")
+def get_historico(
+    inicio: Optional[datetime] = Query(None, alias="from"),
+    fim: Optional[datetime] = Query(None, alias="to"),
+    limit: int = Query(1000, ge=1, le=MAX_HISTORY_SIZE),
+    hive_id: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Registros do período em ordem cronológica, combinando o SQLite (quente) e o arquivo Parquet (frio)."""
+    df = read_history(db, inicio, fim, limit=limit, hive_id=hive_id)
+    return jsonable_encoder(df.astype(object).where(df.notna(), None).to_dict(orient="records"))
+
+@router.get("/export")
+def exportar(
+    format: str = "arrow",
+    inicio: Optional[datetime] = Query(None, alias="from"),
+    fim: Optional[datetime] = Query(None, alias="to"),
+    include_archive: bool = True,
+    chunk_size: int = Query(50000, gt=0, le=500000),
+    hive_id: Optional[str] = None,
+):
+    """Exporta o período em formato colunar (Arrow IPC stream ou Parquet), lido e enviado em lotes."""
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format deve ser um de {', '.join(EXPORT_FORMATS)}")
+    ext = "arrows" if format == "arrow" else "parquet"
+    return StreamingResponse(
+        stream_export(format, inicio, fim, chunk_size, include_archive, hive_id),
+        media_type=EXPORT_FORMATS[format],
+        headers={"Content-Disposition": f'attachment; filename="abelhas_data.{ext}"'},
     )
 
-    db.add(novo_dado)
-    db.commit()
-    db.refresh(novo_dado)
+@router.post("/retention/run")
+def executar_retencao(days: float = Query(..., gt=0), db: Session = Depends(get_write_db)):
+    """Move para o arquivo Parquet os registros com mais de `days` dias."""
+    return jsonable_encoder(archive_older_than(db, days=days))
+
+@router.get("/stats", response_model=StatsResponse)
+async def get_stats(request: Request, response: Response, hive_id: Optional[str] = None,
+                    db: Session = Depends(get_read_db)):
+    validators = data_watermark.headers(db)
+    if data_watermark.not_modified(request, validators):
+        return Response(status_code=304, headers=validators)
+    response.headers.update(validators)
+    return read_stats(db, hive_id)
+
+@router.get("/series")
+async def get_series(
+    bucket: str = "hour",
+    inicio: Optional[datetime] = Query(None, alias="from"),
+    fim: Optional[datetime] = Query(None, alias="to"),
+    hive_id: Optional[str] = None,
+    db: Session = Depends(get_read_db),
+):
+    """Série temporal pré-agregada (minute, hour ou day) com contagem e min/max/média de cada métrica."""
+    if bucket not in BUCKETS:
+        raise HTTPException(status_code=400, detail=f"bucket deve ser um de {', '.join(BUCKETS)}")
+    return jsonable_encoder(read_series(db, bucket, inicio, fim, hive_id))
+
+@router.post("/stats/rebuild", response_model=StatsResponse)
+def reconstruir_stats(db: Session = Depends(get_write_db)):
+    """Recalcula os contadores a partir de abelhas_data (reparo de consistência)."""
+    return rebuild_stats(db)
+
+async def _ingest(records: List[BeeRecordCreate], db: Session, response: Response) -> dict:
+    if ingest_buffer.running:
+        if not ingest_buffer.put_many(records):
+            raise HTTPException(status_code=429, detail="Buffer de ingestão cheio, tente novamente")
+        response.status_code = 202
+        return {"ok": True, "queued": len(records)}
+    inserted = await run_in_threadpool(insert_records, db, records)
+    return {"ok": True, "inserted": inserted}
+
+@router.post("/ingest", response_model=IngestAck)
+async def ingest_data(record: BeeRecordCreate, response: Response, db: Session = Depends(get_write_db)):
+    return await _ingest([record], db, response)
 
-    return {"ok": True, "data": jsonable_encoder(novo_dado)}
+@router.post("/ingest/batch", response_model=IngestAck)
+async def ingest_batch(records: List[BeeRecordCreate], response: Response, db: Session = Depends(get_write_db)):
+    """Recebe um lote de leituras dos sensores. Com o buffer write-behind ativo, apenas enfileira."""
+    if len(records) > MAX_INGEST_BATCH:
+        raise HTTPException(status_code=413, detail=f"Lote maior que o limite de {MAX_INGEST_BATCH} registros")
+    return await _ingest(records, db, response)
+
+@router.get("/ingest/stats")
+async def ingest_stats():
+    return ingest_buffer.stats()
+
+@router.get("/stream")
+async def stream(request: Request, hive_id: Optional[str] = None, last_id: Optional[int] = Query(None, ge=0),
+                 last_event_id: Optional[int] = Header(None, ge=0)):
+    """Envia cada registro ingerido (e cada alarme) assim que é gravado, em Server-Sent Events.
+    Na reconexão, o EventSource envia Last-Event-ID e os eventos posteriores são reenviados."""
+    inicio = last_event_id if last_event_id is not None else last_id
+    return StreamingResponse(broadcaster.stream(request, inicio, hive_id), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@router.get("/stream/stats")
+async def stream_stats():
+    return broadcaster.stats()
+
+@router.get("/alarms", response_model=List[AlarmRead])
+def listar_alarmes(hive_id: Optional[str] = None, since_id: Optional[int] = Query(None, ge=0),
+                   limit: int = Query(100, ge=1, le=1000), db: Session = Depends(get_read_db)):
+    """Alarmes dos detectores de anomalias (z-score e variação brusca), mais recentes primeiro."""
+    q = select(AlarmRecord).order_by(AlarmRecord.id.desc()).limit(limit)
+    if hive_id is not None:
+        q = q.where(AlarmRecord.hive_id == hive_id)
+    if since_id is not None:
+        q = q.where(AlarmRecord.id > since_id)
+    return db.execute(q).scalars().all()
 
 
 # app/routers/noise.py
@@ -125,12 +317,7 @@ def get_noise_level():
     noise_level = random.randint(20, 120)  # em decibéis
     # timestamp = datetime.datetime.now().isoformat()
     timestamp = datetime.now().isoformat()
-    status = "normal"
-
-    if noise_level > 80:
-        status = "alerta: possível agitação!"
-    elif noise_level > 60:
-        status = "moderado: atenção"
+    status = classify_noise(noise_level)
 
     return {
         "timestamp": timestamp,
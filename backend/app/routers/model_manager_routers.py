@@ -9,11 +9,21 @@ Main Components
 
 - API Router: Prefix /api, tag 'ml'.
 - Endpoints:
-    - POST /treinar: Trains the machine learning model with current database data. Returns training metrics.
+    - POST /treinar: Trains the machine learning model with current database data and returns the training metrics. The fit runs
+      as a training job in a separate process (joining the active job, if any), so the API keeps serving meanwhile.
     - POST /predicao: Predicts bee activity (high/low) based on input features (temperature, humidity, pollution, noise). Returns prediction results.
+    - POST /predicao/batch: Predicts a list of inputs with one feature matrix and one predict_proba call per chunk.
+      Returns one result per input, in order; with stream=true the results are streamed as NDJSON, chunk by chunk.
+    - GET /predicao/cache: Size and hit/miss counters of the prediction cache.
+    - GET /forecast: Forecasts the active bee count of a hive for the next steps records (ARIMA). The fitted model of each hive is
+      kept in memory and extended with new records, so calls between ingests are answered from a cache.
+    - GET /models: Lists the versions of the model registry with their metrics, features and data watermark.
+    - POST /models/{version}/activate: Promotes a registry version and starts serving it.
+    - POST /models/rollback: Activates the version created before the one being served.
 - Dependencies:
-    - Uses get_db for database session management.
+    - Uses get_read_db for database session management (both routes only read from the database).
     - Uses Pydantic schemas for request and response validation.
+    - MAX_PREDICT_BATCH: Maximum number of inputs per batch request (env, 100000 by default).
 
 Usage
 -----
@@ -23,30 +33,43 @@ Import and include this router in your FastAPI app to expose ML endpoints.
 Dependencies
 ------------
 
-FastAPI, SQLAlchemy, app.db, app.schemas, app.model_manager
+FastAPI, SQLAlchemy, json, app.db, app.models, app.schemas, app.model_manager, app.prediction_cache
 """
-from fastapi import APIRouter, Depends, HTTPException
+import json
+import os
+from typing import Iterator, List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from ..db import get_db
-from ..schemas import PredictionRequest, PredictionResponse, TrainMetrics
-from ..model_manager import model_manager
+from ..db import get_read_db
+from ..models import DEFAULT_HIVE
+from ..schemas import ModelVersion, PredictionRequest, PredictionResponse, TrainMetrics
+from ..model_manager import ModelNotReady, model_manager
+from ..prediction_cache import prediction_cache
 
 router = APIRouter(prefix="/api", tags=["ml"])
 
+MAX_PREDICT_BATCH = int(os.getenv("MAX_PREDICT_BATCH", "100000"))
+
+def _not_ready(e: ModelNotReady) -> HTTPException:
+    # Sem modelo ainda: o treino roda em segundo plano e o cliente tenta de novo
+    return HTTPException(status_code=503, detail={"message": str(e), "job_id": e.job["job_id"]},
+                         headers={"Retry-After": "5"})
+
 @router.post("/treinar", response_model=TrainMetrics)
-def treinar(db: Session = Depends(get_db)):
+def treinar():
     """Treina o modelo de Machine Learning com os dados atuais do banco.
     """
     try:
-        metrics = model_manager.train(db)
-        return metrics
+        job, _ = model_manager.start_training()
+        return model_manager.wait_job(job["job_id"])["metrics"]
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
 
 @router.post("/predicao", response_model=PredictionResponse)
-def predicao(body: PredictionRequest, db: Session = Depends(get_db)):
+def predicao(body: PredictionRequest, db: Session = Depends(get_read_db)):
     """Retorna a predição de atividade alta/baixa das abelhas com base em:
     temperatura, umidade, poluição e ruído.
     """
@@ -56,10 +79,74 @@ def predicao(body: PredictionRequest, db: Session = Depends(get_db)):
             temperatura=body.temperatura,
             umidade=body.umidade,
             poluicao=body.poluicao,
-            ruido_db=getattr(body, "ruido_db", 50)  # valor default se não vier
+            ruido_db=getattr(body, "ruido_db", 50),  # valor default se não vier
+            hive_id=body.hive_id
         )
         return res
+    except ModelNotReady as e:
+        raise _not_ready(e)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
+
+def _ndjson(chunks: Iterator[List[dict]]) -> Iterator[bytes]:
+    for chunk in chunks:
+        yield "".join(json.dumps(r) + "\n" for r in chunk).encode()
+
+@router.post("/predicao/batch", response_model=List[PredictionResponse])
+def predicao_batch(body: List[PredictionRequest],
+                   stream: bool = Query(False, description="Transmite os resultados em NDJSON à medida que são calculados"),
+                   db: Session = Depends(get_read_db)):
+    """Retorna a predição de cada item do lote, na mesma ordem, com uma única matriz de features.
+    """
+    if len(body) > MAX_PREDICT_BATCH:
+        raise HTTPException(status_code=413, detail=f"Lote maior que o limite de {MAX_PREDICT_BATCH} itens")
+    items = [item.model_dump() for item in body]
+    try:
+        if stream:
+            # Modelo e matriz prontos antes da resposta: a transmissão não usa a sessão do banco
+            model, X = model_manager.prepare_batch(db, items)
+            return StreamingResponse(_ndjson(model_manager.iter_predictions(model, X)),
+                                     media_type="application/x-ndjson")
+        return model_manager.predict_batch(db, items)
+    except ModelNotReady as e:
+        raise _not_ready(e)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Erro interno: {str(e)}")
+
+@router.get("/predicao/cache")
+def predicao_cache():
+    """Tamanho e contadores de acertos/falhas do cache de predições."""
+    return prediction_cache.stats()
+
+@router.get("/forecast")
+def forecast(steps: int = Query(5, ge=1, le=500), hive_id: str = DEFAULT_HIVE, db: Session = Depends(get_read_db)):
+    """Previsão (ARIMA) do número de abelhas ativas da colmeia para os próximos registros."""
+    res = model_manager.forecast(db, steps=steps, hive_id=hive_id)
+    if "error" in res:
+        raise HTTPException(status_code=400, detail=res["error"])
+    return {"hive_id": hive_id, "steps": steps, **res}
+
+@router.get("/models", response_model=List[ModelVersion])
+def listar_versoes():
+    """Lista as versões do registro de modelos; a versão ativa é marcada com ativa=true."""
+    return model_manager.versions()
+
+@router.post("/models/rollback", response_model=ModelVersion)
+def rollback_modelo():
+    """Volta para a versão criada antes da versão em uso."""
+    try:
+        return {**model_manager.rollback(), "ativa": True}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
+
+@router.post("/models/{version}/activate", response_model=ModelVersion)
+def ativar_versao(version: str):
+    """Promove uma versão do registro e passa a servi-la nas predições."""
+    try:
+        return {**model_manager.activate(version), "ativa": True}
+    except KeyError as e:
+        raise HTTPException(status_code=404, detail=e.args[0])
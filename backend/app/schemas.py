@@ -1,31 +1,52 @@
-from typing import Optional, List, Dict
-from pydantic import BaseModel, Field
+from typing import Any, Optional, List, Dict
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
 
 class BeeRecordCreate(BaseModel):
+    hive_id: str = Field("default", min_length=1, max_length=50)
     temperatura: float
     umidade: float
     poluicao: float
     abelhas_ativas: int
     ruido_db: Optional[float] = 50
-    # timestamp opcional (se não vier, servidor usa now)
+    # timestamp opcional (se não vier, servidor usa o horário de recebimento)
     timestamp: Optional[datetime] = None
 
+    class Config:
+        # NaN/Infinity não são leituras válidas (viram NULL no banco e contaminam os detectores)
+        allow_inf_nan = False
+
+    @field_validator("timestamp")
+    @classmethod
+    def _hora_local(cls, valor: Optional[datetime]) -> Optional[datetime]:
+        # Banco guarda horário local sem fuso (como datetime.now() do servidor): horários com fuso são convertidos
+        if valor is not None and valor.tzinfo is not None:
+            return valor.astimezone().replace(tzinfo=None)
+        return valor
+
+class IngestAck(BaseModel):
+    ok: bool
+    inserted: int = 0
+    queued: int = 0
+
 class BeeRecordRead(BaseModel):
     id: int
+    hive_id: str
     timestamp: datetime
     temperatura: float
     umidade: float
     poluicao: float
     abelhas_ativas: int
-    ruido_db: float
+    ruido_db: Optional[float] = None
     atividade_alta: int
     atividade: str
+    status_ruido: Optional[str] = None
 
     class Config:
         from_attributes = True
 
 class PredictionRequest(BaseModel):
+    hive_id: str = "default"
     temperatura: float
     umidade: float
     poluicao: float
@@ -41,11 +62,55 @@ class TrainMetrics(BaseModel):
     f1_score: Optional[float] = None
     auc: Optional[float] = None
     confusion_matrix: List[List[int]]
-    classification_report: Dict[str, Dict[str, float]]
+    classification_report: Dict[str, Any]  # inclui "accuracy" (float) além das classes
     cross_val_mean: Optional[float] = None
     feature_importance: Optional[Dict[str, float]] = None
 
+class TrainJobStatus(BaseModel):
+    job_id: str
+    status: str  # "queued", "running", "done" ou "error"
+    modo: str = "full"  # "full" ou "incremental"
+    version: Optional[str] = None  # versão do registro criada pelo job
+    etapa: Optional[str] = None
+    progresso: float = 0.0
+    limit: Optional[int] = None
+    hive_id: Optional[str] = None
+    criado_em: datetime
+    iniciado_em: Optional[datetime] = None
+    concluido_em: Optional[datetime] = None
+    linhas: Optional[int] = None
+    metrics: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+
+class ModelVersion(BaseModel):
+    version: str
+    ativa: bool
+    criado_em: Optional[str] = None
+    modo: Optional[str] = None
+    base: Optional[str] = None
+    features: Optional[List[str]] = None
+    metrics: Optional[Dict[str, Any]] = None
+    watermark: int = 0
+    registros: int = 0
+    linhas: Optional[int] = None
+    atualizacoes: int = 0
+
 class StatsResponse(BaseModel):
     total: int
     altas: int
     baixas: int
+    por_status: Dict[str, int] = {}
+
+class AlarmRead(BaseModel):
+    id: int
+    record_id: int
+    hive_id: str
+    timestamp: datetime
+    metrica: str
+    detector: str
+    valor: float
+    referencia: float
+    score: float
+
+    class Config:
+        from_attributes = True
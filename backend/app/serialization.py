@@ -0,0 +1,66 @@
+"""
+serialization.py
+================
+
+Fast JSON serialization of record rows for the read endpoints of the Abelhas IoT+ML backend.
+Instead of loading ORM instances and walking them with jsonable_encoder, the routes select plain column tuples (timestamps
+as the stored text, without SQLAlchemy's per-row datetime parsing) and encode them straight to JSON bytes. orjson is used
+when it is installed; otherwise the standard json module produces the same output FastAPI would.
+
+Main Components
+---------------
+
+- RECORD_COLUMNS: Columns of a record response, taken from the BeeRecordRead schema (the response contract).
+- iso_timestamp(valor): Converts a stored SQLite timestamp ("YYYY-MM-DD HH:MM:SS.ffffff") to the ISO 8601 text of
+  datetime.isoformat() (microseconds omitted when zero).
+- dumps(obj): Encodes a JSON-compatible object to bytes (orjson, or json with FastAPI's settings).
+- rows_to_json(columns, rows): Encodes (timestamp text, ...) row tuples as a JSON array of objects.
+- JSON_ENCODER: Name of the encoder in use ("orjson" or "json"), reported by GET /.
+
+Usage
+-----
+
+    `rows = db.execute(select(*record_columns)).all()`
+    `Response(rows_to_json(RECORD_COLUMNS, rows), media_type="application/json")`
+
+Dependencies
+------------
+
+json, orjson (pinned in requirements.txt; the standard json module is the fallback), app.schemas
+"""
+import json
+from typing import Iterable, List, Sequence
+from .schemas import BeeRecordRead
+
+try:
+    import orjson
+except ImportError:  # dependência opcional
+    orjson = None
+
+RECORD_COLUMNS: List[str] = list(BeeRecordRead.model_fields)
+JSON_ENCODER = "orjson" if orjson is not None else "json"
+
+
+def iso_timestamp(valor: str) -> str:
+    # "2025-01-01 08:00:05.000000" -> "2025-01-01T08:00:05" (mesmo texto de datetime.isoformat())
+    if valor.endswith(".000000"):
+        valor = valor[:-7]
+    return valor[:10] + "T" + valor[11:]
+
+
+def dumps(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    # Mesmas opções do JSONResponse do FastAPI
+    return json.dumps(obj, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def rows_to_json(columns: Sequence[str], rows: Iterable[tuple]) -> bytes:
+    tem_timestamp = "timestamp" in columns
+    registros = []
+    for row in rows:
+        registro = dict(zip(columns, row))
+        if tem_timestamp and registro["timestamp"] is not None:
+            registro["timestamp"] = iso_timestamp(registro["timestamp"])
+        registros.append(registro)
+    return dumps(registros)
@@ -1,41 +1,288 @@
+"""
+simulator.py
+============
+
+Sensor data simulator and load generator for the ingest API of the Abelhas IoT+ML backend.
+simulate_data() is the background task started by main.py: one reading every INTERVAL seconds for the default hive.
+Run as a module, the simulator becomes a load generator to find the ingest ceiling of the API: N virtual hives send
+readings at a target rate (records per second), grouped in batches, through a single pooled httpx.AsyncClient with a
+bounded number of requests in flight. Requests are scheduled open-loop (at fixed times, not after the previous answer),
+so when the API cannot keep up the achieved throughput falls below the target and the latencies grow.
+
+Main Components
+---------------
+
+- Configuration (environment variables):
+    - API_URL: Base URL of the API (default http://127.0.0.1:8001).
+- INTERVAL: Seconds between readings of the background simulator (5).
+- Functions:
+    - make_reading(rng, hive_id): Returns a random sensor reading (BeeRecordCreate fields).
+    - build_phases(profile, rate, duration, steps, window): Splits a run into (target rate, seconds) phases:
+        - constant: the target rate for the whole duration.
+        - ramp: `steps` equal phases with the rate growing up to the target (rate/steps, 2*rate/steps, ...).
+        - soak: the target rate for the whole duration, reported in windows of `window` seconds (drift over time).
+    - simulate_data(): Background task used by main.py.
+- LoadGenerator:
+    - run(phases): Sends the load and returns the report: per phase and in total, requests and records sent/accepted,
+      errors by cause (HTTP status or exception type), achieved throughput (accepted records/s), latency percentiles
+      (p50/p90/p99/max/mean, ms) measured from the scheduled send time, so time spent waiting for a free slot counts
+      (no coordinated omission), service time measured from the actual send, and how late the scheduler dispatched
+      (a late generator means the client or the concurrency limit is the bottleneck).
+
+Usage
+-----
+
+From the backend directory, with the API running:
+    `API_URL=http://127.0.0.1:8001 python -m app.simulator --hives 50 --rate 2000 --batch 50 --concurrency 32 \
+--profile ramp --steps 5 --duration 100 --output relatorio.json`
+
+Dependencies
+------------
+
+httpx, asyncio, random
+"""
 import asyncio
-import httpx
+import json
+import os
 import random
+import time
 from datetime import datetime
-from .db import SessionLocal
+from typing import Dict, List, Optional, Tuple
+import httpx
 
+API_URL = os.getenv("API_URL", "http://127.0.0.1:8001")
+INGEST_PATH = "/api/data/ingest"
+INGEST_BATCH_PATH = "/api/data/ingest/batch"
 INTERVAL = 5  # segundos
 
-async def simulate_data():
-    API_URL = "http://127.0.0.1:8001/api/data/ingest"
-
-    while True:
-        abelhas_ativas = random.randint(0, 1000)
-
-        ruido_db = round(random.uniform(20, 120), 2)
-        status_ruido = "normal"
-        if ruido_db > 80:
-            status_ruido = "alerta: possível agitação!"
-        elif ruido_db > 60:
-            status_ruido = "moderado: atenção"
-
-        payload = {
-            "temperatura": round(random.uniform(15, 40), 2),
-            "umidade": round(random.uniform(30, 90), 2),
-            "poluicao": round(random.uniform(10, 80), 2),
-            "abelhas_ativas": abelhas_ativas,
-            "atividade": "alta" if abelhas_ativas > 500 else "baixa",
-            "atividade_alta": 1 if abelhas_ativas > 500 else 0,
-            "ruido_db": ruido_db,
-            "status_ruido": status_ruido,
-            "timestamp": datetime.now().isoformat()
+PROFILES = ("constant", "ramp", "soak")
+
+# Fase de uma execução: (taxa alvo em registros/s, duração em segundos)
+Phase = Tuple[float, float]
+
+
+def make_reading(rng: random.Random, hive_id: Optional[str] = None) -> dict:
+    payload = {
+        "temperatura": round(rng.uniform(15, 40), 2),
+        "umidade": round(rng.uniform(30, 90), 2),
+        "poluicao": round(rng.uniform(10, 80), 2),
+        "abelhas_ativas": rng.randint(0, 1000),
+        "ruido_db": round(rng.uniform(20, 120), 2),
+        "timestamp": datetime.now().isoformat(),
+    }
+    if hive_id is not None:
+        payload["hive_id"] = hive_id
+    return payload
+
+
+def build_phases(profile: str, rate: float, duration: float, steps: int = 5, window: float = 60.0) -> List[Phase]:
+    if profile not in PROFILES:
+        raise ValueError(f"profile deve ser um de {', '.join(PROFILES)}")
+    if profile == "ramp":
+        return [(rate * (k + 1) / steps, duration / steps) for k in range(steps)]
+    if profile == "soak":
+        phases = []
+        restante = duration
+        while restante > 1e-9:
+            phases.append((rate, min(window, restante)))
+            restante -= window
+        return phases
+    return [(rate, duration)]
+
+
+def _client(api_url: str, concurrency: int, timeout: float) -> httpx.AsyncClient:
+    # Um único cliente com pool de conexões reutilizadas (keep-alive) para todas as requisições
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    return httpx.AsyncClient(base_url=api_url, limits=limits, timeout=timeout)
+
+
+def _percentile(ordenados: List[float], p: float) -> Optional[float]:
+    if not ordenados:
+        return None
+    idx = min(len(ordenados) - 1, max(0, round(p / 100 * len(ordenados)) - 1))
+    return ordenados[idx]
+
+
+def _ms(valor: Optional[float]) -> Optional[float]:
+    return None if valor is None else round(valor * 1000, 3)
+
+
+def _summary(valores: List[float]) -> dict:
+    ordenados = sorted(valores)
+    return {
+        "p50": _ms(_percentile(ordenados, 50)), "p90": _ms(_percentile(ordenados, 90)),
+        "p99": _ms(_percentile(ordenados, 99)), "max": _ms(ordenados[-1] if ordenados else None),
+        "mean": _ms(sum(ordenados) / len(ordenados) if ordenados else None),
+    }
+
+
+class _PhaseStats:
+    def __init__(self, target_rate: float, seconds: float):
+        self.target_rate = target_rate
+        self.seconds = seconds
+        self.started = 0.0
+        self.finished = 0.0           # fim da última resposta das requisições despachadas na fase
+        self.requests = 0
+        self.records_sent = 0
+        self.records_ok = 0
+        self.errors: Dict[str, int] = {}
+        self.latencies: List[float] = []  # do horário agendado até a resposta (s), inclui a espera por vaga
+        self.service: List[float] = []    # do envio efetivo até a resposta (s)
+        self.lags: List[float] = []       # atraso do despacho em relação ao horário agendado (s)
+
+    def report(self) -> dict:
+        elapsed = max(self.finished, self.started + self.seconds) - self.started
+        lags = sorted(self.lags)
+        return {
+            "target_rate": round(self.target_rate, 3),
+            "duration_s": round(elapsed, 3),
+            "requests": self.requests,
+            "records_sent": self.records_sent,
+            "records_ok": self.records_ok,
+            "errors": dict(sorted(self.errors.items())),
+            "error_count": sum(self.errors.values()),
+            "throughput": round(self.records_ok / elapsed, 3) if elapsed > 0 else 0.0,
+            "latency_ms": _summary(self.latencies),
+            "service_ms": _summary(self.service),
+            "dispatch_lag_ms": {"p99": _ms(_percentile(lags, 99)), "max": _ms(lags[-1] if lags else None)},
+        }
+
+
+class LoadGenerator:
+    def __init__(self, api_url: str = API_URL, hives: int = 10, batch_size: int = 1, concurrency: int = 16,
+                 timeout: float = 10.0, seed: Optional[int] = None):
+        self.api_url = api_url
+        self.hive_ids = [f"colmeia-{i}" for i in range(hives)]
+        self.batch_size = batch_size
+        self.concurrency = concurrency
+        self.timeout = timeout
+        self._rng = random.Random(seed)
+        self._next_hive = 0
+
+    def _batch(self) -> List[dict]:
+        # Colmeias em rodízio: cada colmeia virtual recebe rate/hives leituras por segundo
+        batch = []
+        for _ in range(self.batch_size):
+            batch.append(make_reading(self._rng, self.hive_ids[self._next_hive]))
+            self._next_hive = (self._next_hive + 1) % len(self.hive_ids)
+        return batch
+
+    async def _send(self, client: httpx.AsyncClient, sem: asyncio.Semaphore, stats: _PhaseStats, batch: List[dict],
+                    agendado: float):
+        inicio = time.perf_counter()
+        try:
+            if len(batch) == 1:
+                r = await client.post(INGEST_PATH, json=batch[0])
+            else:
+                r = await client.post(INGEST_BATCH_PATH, json=batch)
+            causa = None if r.status_code in (200, 202) else f"http_{r.status_code}"
+        except Exception as e:
+            # Qualquer falha do envio vira um erro do relatório (pelo tipo), nunca derruba a execução
+            causa = type(e).__name__
+        finally:
+            sem.release()
+        fim = time.perf_counter()
+        # Latência a partir do horário agendado: a espera por uma vaga (sem.acquire) também conta
+        stats.latencies.append(fim - agendado)
+        stats.service.append(fim - inicio)
+        stats.finished = max(stats.finished, fim)
+        if causa is None:
+            stats.records_ok += len(batch)
+        else:
+            stats.errors[causa] = stats.errors.get(causa, 0) + 1
+
+    async def run(self, phases: List[Phase]) -> dict:
+        all_stats = [_PhaseStats(rate, seconds) for rate, seconds in phases]
+        sem = asyncio.Semaphore(self.concurrency)
+        tasks = set()
+        async with _client(self.api_url, self.concurrency, self.timeout) as client:
+            inicio = time.perf_counter()
+            for stats in all_stats:
+                stats.started = agendado = time.perf_counter()
+                fim_fase = stats.started + stats.seconds
+                intervalo = self.batch_size / stats.target_rate if stats.target_rate > 0 else stats.seconds
+                while agendado < fim_fase:
+                    espera = agendado - time.perf_counter()
+                    if espera > 0:
+                        await asyncio.sleep(espera)
+                    # Com o limite de requisições em voo atingido, o despacho espera (e o atraso é medido)
+                    await sem.acquire()
+                    stats.lags.append(max(0.0, time.perf_counter() - agendado))
+                    batch = self._batch()
+                    stats.requests += 1
+                    stats.records_sent += len(batch)
+                    task = asyncio.create_task(self._send(client, sem, stats, batch, agendado))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                    agendado += intervalo
+                espera = fim_fase - time.perf_counter()
+                if espera > 0:
+                    await asyncio.sleep(espera)
+            if tasks:
+                await asyncio.gather(*tasks)
+            total_s = time.perf_counter() - inicio
+
+        total = {"requests": 0, "records_sent": 0, "records_ok": 0, "errors": {}}
+        for stats in all_stats:
+            total["requests"] += stats.requests
+            total["records_sent"] += stats.records_sent
+            total["records_ok"] += stats.records_ok
+            for causa, n in stats.errors.items():
+                total["errors"][causa] = total["errors"].get(causa, 0) + n
+        total.update({
+            "error_count": sum(total["errors"].values()),
+            "duration_s": round(total_s, 3),
+            "throughput": round(total["records_ok"] / total_s, 3) if total_s > 0 else 0.0,
+            "latency_ms": _summary([v for stats in all_stats for v in stats.latencies]),
+            "service_ms": _summary([v for stats in all_stats for v in stats.service]),
+        })
+        return {
+            "config": {"api_url": self.api_url, "hives": len(self.hive_ids), "batch_size": self.batch_size,
+                       "concurrency": self.concurrency, "timeout": self.timeout},
+            "phases": [stats.report() for stats in all_stats],
+            "total": total,
         }
 
-        async with httpx.AsyncClient() as client:
+
+async def simulate_data(interval: float = INTERVAL):
+    rng = random.Random()
+    async with _client(API_URL, 1, timeout=10.0) as client:
+        while True:
+            payload = make_reading(rng)
             try:
-                await client.post(API_URL, json=payload)
+                r = await client.post(INGEST_PATH, json=payload)
+                r.raise_for_status()
                 print("Dado enviado:", payload)
-            except Exception as e:
+            except httpx.HTTPError as e:
                 print("Falha ao enviar:", e)
 
-        await asyncio.sleep(INTERVAL)
+            await asyncio.sleep(interval)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Gerador de carga para a ingestão da API (relatório em JSON)")
+    parser.add_argument("--url", default=API_URL, help="URL base da API (padrão: variável API_URL)")
+    parser.add_argument("--hives", type=int, default=10, help="Colmeias virtuais")
+    parser.add_argument("--rate", type=float, default=100.0, help="Taxa alvo em registros/s (máxima na rampa)")
+    parser.add_argument("--batch", type=int, default=1, help="Registros por requisição (1 usa /ingest)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Máximo de requisições em voo")
+    parser.add_argument("--profile", choices=PROFILES, default="constant")
+    parser.add_argument("--duration", type=float, default=60.0, help="Duração total em segundos")
+    parser.add_argument("--steps", type=int, default=5, help="Degraus da rampa")
+    parser.add_argument("--window", type=float, default=60.0, help="Janela do relatório no perfil soak (s)")
+    parser.add_argument("--timeout", type=float, default=10.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--output", default=None, help="Arquivo do relatório JSON (padrão: stdout)")
+    args = parser.parse_args()
+
+    generator = LoadGenerator(args.url, hives=args.hives, batch_size=args.batch, concurrency=args.concurrency,
+                              timeout=args.timeout, seed=args.seed)
+    report = asyncio.run(generator.run(build_phases(args.profile, args.rate, args.duration, args.steps, args.window)))
+    report["config"].update({"profile": args.profile, "rate": args.rate, "duration": args.duration})
+    texto = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(texto)
+    print(texto)
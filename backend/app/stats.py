@@ -0,0 +1,159 @@
+"""
+stats.py
+========
+
+Incrementally maintained counters for the /api/data/stats endpoint of the Abelhas IoT+ML backend.
+Totals live in the small abelhas_stats table, one set per hive, and are updated in the same transaction as every ingest,
+so reading them is O(1) in the number of records.
+
+Main Components
+---------------
+
+- Functions:
+    - counter_deltas(rows): Counter increments per (hive_id, chave) for a batch of derived rows (total, altas, status:<status_ruido>).
+    - apply_counters(db, rows): Upserts the increments of a batch; does not commit (runs inside the ingest transaction).
+    - read_stats(db, hive_id): Returns total, altas, baixas and per-status counts of one hive, or of all hives when hive_id is None.
+    - rebuild_stats(db): Recomputes every counter from abelhas_data and the Parquet archive in one transaction (repair)
+      and bumps the data watermark.
+    - check_stats(db): Compares the stored counters with a fresh recount. Returns the differences.
+    - ensure_stats(db): Rebuilds the counters when the table is empty but abelhas_data is not (first run).
+
+Usage
+-----
+
+Repair the counters from the backend directory:
+    `python -m app.stats rebuild`
+Check them without changing anything:
+    `python -m app.stats check`
+
+Dependencies
+------------
+
+SQLAlchemy, collections, app.models, app.retention, app.watermark
+"""
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from sqlalchemy import func, select, delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+from .models import BeeRecord, StatsCounter
+from .retention import archive_counts, hot_archived_ids
+from .watermark import data_watermark
+
+SEM_STATUS = "sem_status"
+
+
+def _status_key(status) -> str:
+    return f"status:{status if status is not None else SEM_STATUS}"
+
+
+def counter_deltas(rows: Iterable[dict]) -> Dict[Tuple[str, str], int]:
+    deltas: Counter = Counter()
+    for row in rows:
+        hive = row["hive_id"]
+        deltas[(hive, "total")] += 1
+        deltas[(hive, "altas")] += row["atividade_alta"]
+        deltas[(hive, _status_key(row["status_ruido"]))] += 1
+    return dict(deltas)
+
+
+def _counter_rows(counters: Dict[Tuple[str, str], int]) -> List[dict]:
+    return [{"hive_id": hive, "chave": chave, "valor": v} for (hive, chave), v in counters.items()]
+
+
+def apply_counters(db: Session, rows: Iterable[dict]):
+    deltas = counter_deltas(rows)
+    if not deltas:
+        return
+    stmt = sqlite_insert(StatsCounter.__table__)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["hive_id", "chave"],
+        set_={"valor": StatsCounter.__table__.c.valor + stmt.excluded.valor},
+    )
+    db.execute(stmt, _counter_rows(deltas))
+
+
+def _counts_from_rows(pairs) -> dict:
+    counters: Counter = Counter()
+    for k, v in pairs:
+        counters[k] += v
+    total = counters.get("total", 0)
+    altas = counters.get("altas", 0)
+    por_status = {k.split(":", 1)[1]: v for k, v in counters.items() if k.startswith("status:")}
+    return {"total": total, "altas": altas, "baixas": total - altas, "por_status": por_status}
+
+
+def read_stats(db: Session, hive_id: Optional[str] = None) -> dict:
+    q = select(StatsCounter.chave, StatsCounter.valor)
+    if hive_id is not None:
+        q = q.where(StatsCounter.hive_id == hive_id)
+    return _counts_from_rows(db.execute(q).all())
+
+
+def _recount(db: Session) -> Dict[Tuple[str, str], int]:
+    counters: Counter = Counter()
+    for hive, total, altas in db.execute(
+        select(BeeRecord.hive_id, func.count(BeeRecord.id), func.coalesce(func.sum(BeeRecord.atividade_alta), 0))
+        .group_by(BeeRecord.hive_id)
+    ):
+        counters[(hive, "total")] += total
+        counters[(hive, "altas")] += altas
+    for hive, status, n in db.execute(
+        select(BeeRecord.hive_id, BeeRecord.status_ruido, func.count())
+        .group_by(BeeRecord.hive_id, BeeRecord.status_ruido)
+    ):
+        counters[(hive, _status_key(status))] += n
+    # Os contadores cobrem todo o histórico, inclusive o que já foi arquivado em Parquet; ids ainda presentes
+    # no SQLite (arquivamento interrompido) já foram contados acima
+    for hive, cold in archive_counts(exclude_ids=hot_archived_ids(db)).items():
+        counters[(hive, "total")] += cold["total"]
+        counters[(hive, "altas")] += cold["altas"]
+        for status, n in cold["por_status"].items():
+            counters[(hive, _status_key(status))] += n
+    return dict(counters)
+
+
+def rebuild_stats(db: Session) -> dict:
+    # O DELETE abre a transação de escrita antes da recontagem: nenhuma ingestão concorrente fica de fora
+    db.execute(delete(StatsCounter))
+    counters = _recount(db)
+    if counters:
+        db.execute(sqlite_insert(StatsCounter.__table__), _counter_rows(counters))
+    db.commit()
+    data_watermark.bump()
+    return _counts_from_rows((chave, v) for (_, chave), v in counters.items())
+
+
+def check_stats(db: Session) -> Dict[str, dict]:
+    stored = {(h, k): v for h, k, v in db.execute(
+        select(StatsCounter.hive_id, StatsCounter.chave, StatsCounter.valor)).all()}
+    fresh = _recount(db)
+    return {f"{h}/{k}": {"armazenado": stored.get((h, k), 0), "recontado": fresh.get((h, k), 0)}
+            for h, k in sorted(set(stored) | set(fresh)) if stored.get((h, k), 0) != fresh.get((h, k), 0)}
+
+
+def ensure_stats(db: Session):
+    if db.execute(select(StatsCounter.chave).limit(1)).first() is None \
+            and db.execute(select(BeeRecord.id).limit(1)).first() is not None:
+        rebuild_stats(db)
+
+
+if __name__ == "__main__":
+    import argparse
+    from .db import SessionLocal, engine
+    from .models import init_db
+
+    parser = argparse.ArgumentParser(description="Manutenção dos contadores de /api/data/stats")
+    parser.add_argument("comando", choices=["rebuild", "check"])
+    args = parser.parse_args()
+
+    init_db(engine)
+    db = SessionLocal()
+    try:
+        if args.comando == "rebuild":
+            print("Contadores reconstruídos:", rebuild_stats(db))
+        else:
+            diff = check_stats(db)
+            print("Contadores consistentes." if not diff else f"Divergências: {diff}")
+    finally:
+        db.close()
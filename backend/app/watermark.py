@@ -0,0 +1,95 @@
+"""
+watermark.py
+============
+
+In-memory data watermark and HTTP conditional GET support for the read endpoints of the Abelhas IoT+ML backend.
+The watermark is the largest record id plus a generation counter (bumped when records are removed or counters rebuilt)
+and the time of the last change. It is read from the database once and then maintained by the writers, so the
+validators of /dados and /stats (ETag and Last-Modified) are computed without a query and a poll whose data did not
+change is answered with 304 Not Modified before the endpoint touches the database.
+
+Main Components
+---------------
+
+- DataWatermark:
+    - seed(db): Reads the largest record id (only on first use).
+    - bump(max_id): Records a change: new records up to max_id (ingest) or, without max_id, a removal or rebuild.
+    - headers(db): Returns the validators: ETag (weak, "<generation>.<max id>"), Last-Modified and Cache-Control: no-cache.
+    - not_modified(request, headers): True when If-None-Match (or, without it, If-Modified-Since) still matches.
+- data_watermark: Global instance updated by app.ingest, app.retention and app.stats and read by the data routes.
+
+Usage
+-----
+
+    `validators = data_watermark.headers(db)`
+    `if data_watermark.not_modified(request, validators): return Response(status_code=304, headers=validators)`
+
+The watermark lives in the API process: writes made by other processes (CLI tools) are only seen after a restart.
+
+Dependencies
+------------
+
+SQLAlchemy, email.utils, threading, app.models
+"""
+import threading
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, Optional
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from .models import BeeRecord
+
+
+class DataWatermark:
+    def __init__(self):
+        self.max_id: Optional[int] = None  # None: ainda não lido do banco
+        self.generation = 0
+        self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+        self._lock = threading.Lock()
+
+    def seed(self, db: Session):
+        if self.max_id is not None:
+            return
+        max_id = db.execute(select(func.max(BeeRecord.id))).scalar() or 0
+        with self._lock:
+            if self.max_id is None:
+                self.max_id = max_id
+
+    def bump(self, max_id: Optional[int] = None):
+        with self._lock:
+            if max_id is None:
+                self.generation += 1
+            elif self.max_id is not None:
+                self.max_id = max(self.max_id, max_id)
+            # Last-Modified tem resolução de segundos: o ETag distingue mudanças no mesmo segundo
+            self.last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+
+    def headers(self, db: Session) -> Dict[str, str]:
+        self.seed(db)
+        with self._lock:
+            etag = f'W/"{self.generation}.{self.max_id}"'
+            last_modified = format_datetime(self.last_modified, usegmt=True)
+        return {"ETag": etag, "Last-Modified": last_modified, "Cache-Control": "no-cache"}
+
+    @staticmethod
+    def not_modified(request, headers: Dict[str, str]) -> bool:
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match is not None:
+            # Comparação fraca: ignora o prefixo W/
+            etag = headers["ETag"].removeprefix("W/")
+            return any(tag.strip() == "*" or tag.strip().removeprefix("W/") == etag
+                       for tag in if_none_match.split(","))
+        if_modified_since = request.headers.get("if-modified-since")
+        if if_modified_since is None:
+            return False
+        try:
+            desde = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        if desde.tzinfo is None:
+            desde = desde.replace(tzinfo=timezone.utc)
+        return parsedate_to_datetime(headers["Last-Modified"]) <= desde
+
+
+# Global instance
+data_watermark = DataWatermark()
@@ -0,0 +1,74 @@
+"""
+_setup.py
+=========
+
+Shared setup for the backend benchmarks.
+Points the app at a temporary SQLite database and Parquet archive (the real data.db is never touched)
+and fills it with synthetic sensor records.
+
+Main Components
+---------------
+
+- TMP_DIR: Temporary directory holding the benchmark database, archive and model registry.
+- populate(n, hives, seed): Inserts n synthetic records spread over the given number of hives. Returns the row count.
+- timed(fn, repeat): Runs fn repeat times and returns (best seconds, last result).
+
+Usage
+-----
+
+Import this module before anything from app:
+    `from _setup import populate, timed`
+
+Dependencies
+------------
+
+numpy, SQLAlchemy, app.db, app.models
+"""
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+TMP_DIR = tempfile.mkdtemp(prefix="abelhas-bench-")
+os.environ.setdefault("DB_PATH", os.path.join(TMP_DIR, "bench.db"))
+os.environ.setdefault("ARCHIVE_DIR", os.path.join(TMP_DIR, "archive"))
+os.environ.setdefault("MODEL_PATH", os.path.join(TMP_DIR, "model.pkl"))
+os.environ.setdefault("MODEL_REGISTRY_DIR", os.path.join(TMP_DIR, "models"))
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))  # backend/
+
+import numpy as np  # noqa: E402
+from sqlalchemy import insert  # noqa: E402
+from app.db import engine  # noqa: E402
+from app.models import BeeRecord, init_db  # noqa: E402
+
+
+def populate(n: int, hives: int = 1, seed: int = 42, chunk: int = 50000) -> int:
+    init_db(engine)
+    rng = np.random.default_rng(seed)
+    inicio = datetime(2025, 1, 1)
+    with engine.begin() as conn:
+        for start in range(0, n, chunk):
+            m = min(chunk, n - start)
+            abelhas = rng.integers(100, 1000, m)
+            ruido = rng.uniform(20, 120, m).round(2)
+            rows = [{
+                "hive_id": f"colmeia-{(start + i) % hives}",
+                "timestamp": inicio + timedelta(seconds=5 * (start + i)),
+                "temperatura": float(t), "umidade": float(u), "poluicao": float(p),
+                "abelhas_ativas": int(a), "atividade_alta": int(a > 500), "atividade": "alta" if a > 500 else "baixa",
+                "ruido_db": float(r), "status_ruido": "normal",
+            } for i, (t, u, p, a, r) in enumerate(zip(rng.uniform(15, 40, m).round(2), rng.uniform(30, 90, m).round(2),
+                                                     rng.uniform(10, 80, m).round(2), abelhas, ruido))]
+            conn.execute(insert(BeeRecord.__table__), rows)
+    return n
+
+
+def timed(fn, repeat: int = 3):
+    best = float("inf")
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
@@ -0,0 +1,76 @@
+"""
+bench_dados_serialization.py
+============================
+
+Compares the previous response path of GET /dados (ORM instances -> jsonable_encoder -> JSONResponse) with the current
+one (plain column tuples encoded straight to JSON bytes by app.serialization), checking that both produce the same
+documents (parity) and reporting rows per second for several page sizes, with orjson and with the standard json fallback.
+
+Usage
+-----
+
+From the backend directory:
+    `python benchmarks/bench_dados_serialization.py --rows 200000 --limits 100 1000 10000 100000`
+
+Dependencies
+------------
+
+fastapi, SQLAlchemy, app.serialization (orjson optional)
+"""
+import argparse
+from _setup import populate, timed
+
+import json
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from sqlalchemy import String, select, type_coerce
+from app import serialization
+from app.db import SessionLocal
+from app.models import BeeRecord
+from app.serialization import RECORD_COLUMNS, rows_to_json
+
+
+def dados_legacy(db, limit: int) -> bytes:
+    """Caminho anterior: instâncias ORM percorridas pelo jsonable_encoder e codificadas pelo JSONResponse."""
+    records = db.query(BeeRecord).order_by(BeeRecord.timestamp.desc(), BeeRecord.id.desc()).limit(limit).all()
+    return JSONResponse(jsonable_encoder(records)).body
+
+
+def dados_atual(db, limit: int) -> bytes:
+    cols = [type_coerce(BeeRecord.timestamp, String) if c == "timestamp" else getattr(BeeRecord, c)
+            for c in RECORD_COLUMNS]
+    rows = db.execute(select(*cols).order_by(BeeRecord.timestamp.desc(), BeeRecord.id.desc()).limit(limit)).all()
+    return rows_to_json(RECORD_COLUMNS, rows)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--hives", type=int, default=4)
+    parser.add_argument("--limits", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    populate(args.rows, hives=args.hives)
+    encoders = ["json"] + (["orjson"] if serialization.orjson is not None else [])
+    orjson = serialization.orjson
+
+    print(f"{'limit':>8} {'legado (linhas/s)':>18} " + " ".join(f"{e + ' (linhas/s)':>18}" for e in encoders))
+    with SessionLocal() as db:
+        for limit in args.limits:
+            t_legacy, legado = timed(lambda: dados_legacy(db, limit), args.repeat)
+            esperado = [{c: r[c] for c in RECORD_COLUMNS} for r in json.loads(legado)]
+            n = len(esperado)
+            taxas = []
+            for encoder in encoders:
+                serialization.orjson = orjson if encoder == "orjson" else None
+                t, atual = timed(lambda: dados_atual(db, limit), args.repeat)
+                assert json.loads(atual) == esperado, f"respostas diferentes ({encoder}, limit={limit})"
+                taxas.append(n / t)
+            serialization.orjson = orjson
+            print(f"{limit:>8} {n / t_legacy:>18,.0f} " + " ".join(f"{taxa:>18,.0f}" for taxa in taxas))
+    print("paridade: ok")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+bench_fetch_df.py
+=================
+
+Compares the previous loading path of ModelManager._fetch_df (ORM objects -> dicts -> DataFrame, with every feature
+recomputed in pandas over the whole history) with the current one (a columnar read of the incremental feature store),
+checking that both produce the same features (parity) and reporting the time of each.
+
+Usage
+-----
+
+From the backend directory:
+    `python benchmarks/bench_fetch_df.py --rows 1000000 --hives 4`
+
+Dependencies
+------------
+
+pandas, app.features, app.model_manager
+"""
+import argparse
+from _setup import populate, timed
+
+import pandas as pd
+from app.db import SessionLocal
+from app.features import FEATURE_COLUMNS, rebuild_features
+from app.model_manager import model_manager
+from app.models import BeeRecord
+
+RAW_COLUMNS = ["hive_id", "temperatura", "umidade", "poluicao", "abelhas_ativas", "atividade_alta", "ruido_db",
+               "timestamp"]
+
+
+def fetch_legacy(db) -> pd.DataFrame:
+    """Caminho anterior: objetos ORM -> dicts -> DataFrame e features recalculadas sobre todo o histórico."""
+    rows = db.query(BeeRecord).order_by(BeeRecord.timestamp.asc()).all()
+    df = pd.DataFrame([{c: getattr(r, c) for c in RAW_COLUMNS} for r in rows], columns=RAW_COLUMNS)
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    por_colmeia = df.groupby("hive_id", sort=False)
+    df["delta_abelhas"] = por_colmeia["abelhas_ativas"].diff().fillna(0)
+    df["delta_temperatura"] = por_colmeia["temperatura"].diff().fillna(0)
+    df["delta_umidade"] = por_colmeia["umidade"].diff().fillna(0)
+    df["delta_poluicao"] = por_colmeia["poluicao"].diff().fillna(0)
+    df["delta_ruido"] = por_colmeia["ruido_db"].diff().fillna(0)
+    for janela in (3, 5, 10):
+        df[f"media_movel_{janela}"] = por_colmeia["abelhas_ativas"].transform(
+            lambda s: s.rolling(janela, min_periods=1).mean())
+    df["indice_estresse"] = df["temperatura"] * df["poluicao"]
+    df["temp_umidade"] = df["temperatura"] * df["umidade"]
+    df["poluicao_ruido"] = df["poluicao"] * df["ruido_db"]
+    df["hora"] = df["timestamp"].dt.hour
+    df["dia_semana"] = df["timestamp"].dt.dayofweek
+    return df
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=200000)
+    parser.add_argument("--hives", type=int, default=1)
+    args = parser.parse_args()
+
+    populate(args.rows, args.hives)
+    db = SessionLocal()
+    try:
+        t_build, _ = timed(lambda: rebuild_features(db), repeat=1)
+        t_legacy, df_legacy = timed(lambda: fetch_legacy(db), repeat=1)
+        db.expunge_all()
+        t_store, df_store = timed(lambda: model_manager._fetch_df(db), repeat=1)
+    finally:
+        db.close()
+
+    # Ambos em ordem de timestamp (os registros sintéticos não repetem timestamps, então o desempate por id não importa)
+    pd.testing.assert_frame_equal(df_legacy[FEATURE_COLUMNS], df_store, check_dtype=False)
+
+    print(f"linhas: {args.rows}  colmeias: {args.hives}")
+    print(f"rebuild da feature store (uma vez) : {t_build:8.3f} s")
+    print(f"ORM + features em pandas           : {t_legacy:8.3f} s")
+    print(f"leitura da feature store           : {t_store:8.3f} s  ({t_legacy / t_store:.1f}x)")
+    print("paridade: OK")
+
+
+if __name__ == "__main__":
+    main()
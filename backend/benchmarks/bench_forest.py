@@ -0,0 +1,83 @@
+"""
+bench_forest.py
+===============
+
+Checks that the compiled forest (app.forest) gives exactly the same probabilities and labels as sklearn's RandomForestClassifier,
+including inputs with missing noise readings, and compares both engines on single-row latency (p50/p99 over many calls)
+and on batched throughput for several batch sizes. The compiled arrays are loaded back from the registry memory-mapped,
+as the API serves them.
+
+Usage
+-----
+
+From the backend directory:
+    `python benchmarks/bench_forest.py --rows 20000 --calls 500`
+
+Dependencies
+------------
+
+numpy, app.features, app.forest, app.model_manager, app.registry
+"""
+import argparse
+import time
+import warnings
+from _setup import populate, timed
+
+import numpy as np
+from app import registry
+from app.db import SessionLocal
+from app.features import load_features, rebuild_features
+from app.forest import CompiledForest
+from app.model_manager import MODEL_FEATURES, model_manager
+
+
+def latencias(fn, X, calls):
+    amostras = []
+    for i in range(calls):
+        inicio = time.perf_counter()
+        fn(X[i % len(X):i % len(X) + 1])
+        amostras.append(time.perf_counter() - inicio)
+    return np.percentile(amostras, [50, 99]) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--hives", type=int, default=4)
+    parser.add_argument("--calls", type=int, default=500, help="chamadas de uma linha para os percentis")
+    parser.add_argument("--batches", default="1,10,100,256,1000,10000")
+    args = parser.parse_args()
+    # A API pontua matrizes NumPy (sem nomes de colunas), como aqui
+    warnings.filterwarnings("ignore", message="X does not have valid feature names")
+
+    populate(args.rows, args.hives)
+    with SessionLocal() as db:
+        rebuild_features(db)
+        model_manager.train(db)
+        X = load_features(db, columns=MODEL_FEATURES)[MODEL_FEATURES].to_numpy(dtype=np.float64, copy=True)
+    model = model_manager.model
+    forest = CompiledForest.from_arrays(registry.load_arrays(model_manager.version))
+
+    # Exatidão: dados do banco com ~10% de ruído ausente (NaN) e entradas fora da faixa de treino
+    rng = np.random.default_rng(3)
+    X[rng.random(len(X)) < 0.1, MODEL_FEATURES.index("ruido_db")] = np.nan
+    X = np.vstack([X, X[:1000] * rng.uniform(0.5, 1.5, size=(1000, X.shape[1]))])
+    assert np.array_equal(model.predict_proba(X), forest.predict_proba(X))
+    assert np.array_equal(model.predict(X), forest.predict(X))
+    print(f"exatidão: OK ({len(X)} linhas, {forest.n_estimators} árvores, {len(forest.feature)} nós)")
+
+    print("\numa linha por chamada:")
+    for nome, fn in (("sklearn", model.predict_proba), ("compilada", forest.predict_proba)):
+        p50, p99 = latencias(fn, X, args.calls)
+        print(f"  {nome:10s} p50 {p50:7.3f} ms  p99 {p99:7.3f} ms")
+
+    print("\nlotes (linhas/s):")
+    for n in map(int, args.batches.split(",")):
+        lote = X[:n]
+        t_sk, _ = timed(lambda: model.predict_proba(lote))
+        t_comp, _ = timed(lambda: forest.predict_proba(lote))
+        print(f"  {n:6d} linhas  sklearn {n / t_sk:12,.0f}  compilada {n / t_comp:12,.0f}  ({t_sk / t_comp:5.1f}x)")
+
+
+if __name__ == "__main__":
+    main()
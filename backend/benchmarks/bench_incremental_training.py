@@ -0,0 +1,73 @@
+"""
+bench_incremental_training.py
+=============================
+
+Replays a growing history and compares the cumulative training CPU time of the two retrain policies:
+    - full: every threshold crossing refits the RandomForest on the whole history (previous behavior of ensure_model);
+    - incremental: each crossing grows TREES_PER_UPDATE trees on the new records only, with a full refit every FULL_REFIT_EVERY updates.
+Both final models are scored on the same held-out records.
+
+Usage
+-----
+
+From the backend directory:
+    `python benchmarks/bench_incremental_training.py --base 2000 --step 500 --rounds 20`
+
+Dependencies
+------------
+
+scikit-learn, app.features, app.model_manager
+"""
+import argparse
+import time
+from _setup import populate
+
+from sklearn.metrics import accuracy_score
+from app.db import SessionLocal
+from app.features import load_features, rebuild_features
+from app.model_manager import FULL_REFIT_EVERY, MODEL_FEATURES, fit_incremental, fit_model
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--base", type=int, default=1000, help="registros no primeiro treino")
+    parser.add_argument("--step", type=int, default=200, help="registros novos a cada retreino")
+    parser.add_argument("--rounds", type=int, default=15)
+    parser.add_argument("--holdout", type=int, default=2000)
+    args = parser.parse_args()
+
+    total = args.base + args.step * args.rounds + args.holdout
+    populate(total, hives=2)
+    with SessionLocal() as db:
+        rebuild_features(db)
+        df = load_features(db)
+    historico, teste = df.iloc[:-args.holdout], df.iloc[-args.holdout:]
+
+    cpu = {"full": 0.0, "incremental": 0.0}
+    modelos = {}
+    updates = 0
+    for r in range(args.rounds + 1):
+        fim = args.base + r * args.step
+        inicio = time.process_time()
+        modelos["full"], _ = fit_model(historico.iloc[:fim])
+        cpu["full"] += time.process_time() - inicio
+
+        inicio = time.process_time()
+        if r == 0 or updates >= FULL_REFIT_EVERY:
+            modelos["incremental"], _ = fit_model(historico.iloc[:fim])
+            updates = 0
+        else:
+            modelos["incremental"], _ = fit_incremental(modelos["incremental"], historico.iloc[fim - args.step:fim])
+            updates += 1
+        cpu["incremental"] += time.process_time() - inicio
+
+    print(f"retreinos: {args.rounds + 1}  histórico final: {fim} registros")
+    for politica, segundos in cpu.items():
+        modelo = modelos[politica]
+        acc = accuracy_score(teste["atividade_alta"], modelo.predict(teste[MODEL_FEATURES]))
+        print(f"{politica:12s}: CPU acumulada {segundos:8.2f} s  árvores {len(modelo.estimators_):4d}  acurácia {acc:.3f}")
+    print(f"redução de CPU: {cpu['full'] / cpu['incremental']:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+"""
+bench_predict_batch.py
+======================
+
+Compares scoring N inputs one by one with ModelManager.predict against a single ModelManager.predict_batch call,
+checking that both return the same labels and probabilities.
+
+Usage
+-----
+
+From the backend directory:
+    `python benchmarks/bench_predict_batch.py --inputs 5000`
+
+Dependencies
+------------
+
+numpy, app.features, app.model_manager
+"""
+import argparse
+from _setup import populate, timed
+
+import numpy as np
+from app.db import SessionLocal
+from app.features import rebuild_features
+from app.model_manager import model_manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=20000)
+    parser.add_argument("--hives", type=int, default=4)
+    parser.add_argument("--inputs", type=int, default=2000)
+    args = parser.parse_args()
+
+    populate(args.rows, args.hives)
+    rng = np.random.default_rng(7)
+    items = [{"hive_id": f"colmeia-{rng.integers(args.hives)}", "temperatura": float(rng.uniform(15, 40)),
+              "umidade": float(rng.uniform(30, 90)), "poluicao": float(rng.uniform(10, 80)),
+              "ruido_db": float(rng.uniform(20, 120))} for _ in range(args.inputs)]
+    db = SessionLocal()
+    try:
+        rebuild_features(db)
+        model_manager.train(db)
+        model_manager.predict_batch(db, items[:1])  # janelas e contador semeados fora da medição
+
+        t_single, single = timed(lambda: [model_manager.predict(db, **it) for it in items], repeat=1)
+        t_batch, batch = timed(lambda: model_manager.predict_batch(db, items))
+    finally:
+        db.close()
+
+    assert [r["predicted_class"] for r in single] == [r["predicted_class"] for r in batch]
+    np.testing.assert_allclose([r["proba_alta"] for r in single], [r["proba_alta"] for r in batch])
+
+    print(f"entradas: {args.inputs}")
+    print(f"predict() um a um : {t_single:8.3f} s  ({t_single / args.inputs * 1000:.2f} ms/entrada)")
+    print(f"predict_batch()   : {t_batch:8.3f} s  ({t_batch / args.inputs * 1000:.3f} ms/entrada, "
+          f"{t_single / t_batch:.0f}x)")
+    print("paridade: OK")
+
+
+if __name__ == "__main__":
+    main()
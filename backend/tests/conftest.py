@@ -0,0 +1,36 @@
+"""
+conftest.py
+===========
+
+Shared fixtures for the backend tests.
+Reuses the benchmark setup (benchmarks/_setup.py), so the app points at a temporary SQLite database, Parquet archive
+and model registry, and the real data.db is never touched.
+
+Main Components
+---------------
+
+- db: Session over a small synthetic database (a few hundred records over two hives) with the feature store built.
+
+Dependencies
+------------
+
+pytest, app.db, app.features
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+
+import pytest  # noqa: E402
+from _setup import populate  # noqa: E402
+from app.db import SessionLocal  # noqa: E402
+from app.features import rebuild_features  # noqa: E402
+
+
+@pytest.fixture(scope="session")
+def db():
+    populate(400, hives=2)
+    session = SessionLocal()
+    rebuild_features(session)
+    yield session
+    session.close()
@@ -0,0 +1,21 @@
+"""Exatidão da floresta compilada (app.forest) frente ao RandomForestClassifier do sklearn (benchmarks/bench_forest.py)."""
+import numpy as np
+from sklearn.ensemble import RandomForestClassifier
+from app.features import load_features
+from app.forest import CompiledForest
+from app.model_manager import MODEL_FEATURES
+
+
+def test_compiled_forest_matches_sklearn(db):
+    df = load_features(db, columns=MODEL_FEATURES + ["atividade_alta"])
+    X = df[MODEL_FEATURES].to_numpy(dtype=np.float64, copy=True)
+    model = RandomForestClassifier(n_estimators=5, random_state=42).fit(X, df["atividade_alta"])
+    # Os arrays passam pelo mesmo formato em que o registro os grava
+    forest = CompiledForest.from_arrays(CompiledForest.from_sklearn(model).arrays())
+
+    # Ruído ausente (NaN) e entradas fora da faixa de treino
+    rng = np.random.default_rng(3)
+    X[rng.random(len(X)) < 0.1, MODEL_FEATURES.index("ruido_db")] = np.nan
+    X = np.vstack([X, X[:100] * rng.uniform(0.5, 1.5, size=(100, X.shape[1]))])
+    assert np.array_equal(model.predict_proba(X), forest.predict_proba(X))
+    assert np.array_equal(model.predict(X), forest.predict(X))
@@ -26,12 +26,28 @@ export default function Page() {
   const ALERT_LIMIT = 600;
   const RECENT_COUNT = 1;
 
-  const { data = [], error, isLoading } = useSWR<BeeRecord[]>(
+  // Carga inicial via /dados; depois cada registro novo chega por Server-Sent Events (sem polling)
+  const { data = [], error, isLoading, mutate } = useSWR<BeeRecord[]>(
     `${BACKEND}/api/data/dados`,
     fetcher,
-    { refreshInterval: 3000 }
+    { revalidateOnFocus: false }
   );
 
+  // O stream só abre depois da carga inicial e continua do maior id recebido: o que foi gravado entre a resposta
+  // de /dados e a conexão é reenviado, sem lacunas nem duplicados
+  const dataRef = useRef<BeeRecord[]>(data);
+  dataRef.current = data;
+  useEffect(() => {
+    if (isLoading) return;
+    const maxId = Math.max(0, ...dataRef.current.map(d => d.id ?? 0));
+    const source = new EventSource(`${BACKEND}/api/data/stream${maxId ? `?last_id=${maxId}` : ""}`);
+    source.addEventListener("record", (e) => {
+      const rec: BeeRecord = JSON.parse((e as MessageEvent).data);
+      mutate(atual => [rec, ...(atual ?? []).filter(d => d.id !== rec.id)].slice(0, 100), { revalidate: false });
+    });
+    return () => source.close();
+  }, [isLoading, mutate]);
+
   const [audioAllowed, setAudioAllowed] = useState(false);
   const audioRef = useRef<HTMLAudioElement | null>(null);
 